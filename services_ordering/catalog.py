@@ -0,0 +1,277 @@
+import frappe
+from frappe.utils import cint, flt, get_datetime, now
+
+from services_ordering.pricing import (
+    DEFAULT_SELLING_PRICE_LIST,
+    clear_item_price_cache,
+    get_item_prices,
+    load_item_prices,
+)
+
+SERVICE_COMPANY = "Sage Services Co Ltd"
+
+# Columns of the Service Catalog table, besides the standard ones
+CATALOG_COLUMNS = [
+    "item_code", "item_name", "item_group", "brand", "stock_uom", "price_list", "rate", "standard_rate",
+    "item_tax_template", "service_time", "gap_time", "total_duration", "description", "weight_per_unit",
+    "weight_uom"
+]
+
+# Service Catalog columns in the shape get_items has always returned
+CATALOG_ITEM_FIELDS = [
+    "item_code as name", "item_name", "description", "stock_uom", "rate as standard_rate", "item_group",
+    "brand", "service_time as custom_service_time", "gap_time as custom_gap_time", "total_duration"
+]
+
+
+def get_catalog_items(item_codes=None):
+    """Sellable service items with their resolved price, read from the Service Catalog"""
+    filters = {}
+    if item_codes is not None:
+        if not item_codes:
+            return []
+        filters["name"] = ["in", list(item_codes)]
+
+    items = frappe.get_all("Service Catalog", fields=CATALOG_ITEM_FIELDS, filters=filters, order_by="item_name asc")
+    for item in items:
+        item["has_variants"] = 0  # Template items are never in the catalog
+    return items
+
+
+def get_catalog_item_details(item_code, price_list=None):
+    """Item details for the cart from a single Service Catalog read, None if not a catalog item"""
+    item = frappe.db.get_value("Service Catalog", item_code, CATALOG_COLUMNS, as_dict=True)
+    if not item:
+        return None
+
+    # Same fallback as get_item_details: price list rate if set, else the standard rate
+    if price_list and price_list == item.price_list:
+        rate = item.rate
+    elif price_list:
+        rate = get_item_prices([item_code], price_list).get(item_code)
+    else:
+        rate = None
+
+    return make_item_details(item, rate)
+
+
+def get_catalog_items_details(item_codes, price_list=None):
+    """Item details for a whole cart, keyed by item code
+
+    Catalog items are read in one query, items outside the catalog are resolved
+    from Item directly, and a price list other than the catalog's costs one more.
+    """
+    item_codes = list(dict.fromkeys(item_code for item_code in item_codes or [] if item_code))
+    if not item_codes:
+        return {}
+
+    items = {
+        item.item_code: item
+        for item in frappe.get_all("Service Catalog", fields=CATALOG_COLUMNS, filters={"name": ["in", item_codes]})
+    }
+    missing = [item_code for item_code in item_codes if item_code not in items]
+    if missing:
+        items.update({item.item_code: item for item in resolve_item_rows({"name": ["in", missing]})})
+
+    rates = {}
+    if price_list and price_list != DEFAULT_SELLING_PRICE_LIST:
+        rates = get_item_prices(list(items), price_list)
+
+    details = {}
+    for item_code, item in items.items():
+        if not price_list:
+            rate = None
+        elif price_list == item.price_list:
+            rate = item.rate
+        else:
+            rate = rates.get(item_code)
+        details[item_code] = make_item_details(item, rate)
+    return details
+
+
+def make_item_details(item, rate=None):
+    """Shape a catalog row like get_item_details, falling back to the standard rate"""
+    return {
+        "item_name": item.item_name,
+        "description": item.description,
+        "stock_uom": item.stock_uom,
+        "rate": rate or item.standard_rate or 0,
+        "item_group": item.item_group,
+        "brand": item.brand,
+        "item_tax_template": item.item_tax_template,
+        "weight_per_unit": item.weight_per_unit,
+        "weight_uom": item.weight_uom,
+        "custom_service_time": item.service_time,
+        "custom_gap_time": item.gap_time
+    }
+
+
+def get_catalog_delta(modified_after=None):
+    """Get catalog items changed since `modified_after`, plus tombstones for removed ones
+
+    Returns `items` to upsert, `removed` item codes to drop and a `sync_token` to pass as
+    `modified_after` next time. Without `modified_after` the whole catalog is returned.
+    """
+    # Taken before reading so changes made while we read are picked up by the next sync
+    sync_token = now()
+
+    if not modified_after:
+        return {"items": get_catalog_items(), "removed": [], "full": True, "sync_token": sync_token}
+
+    modified_after = get_datetime(modified_after)
+    changed = set(frappe.db.sql_list("""
+        SELECT name FROM `tabItem` WHERE modified > %(after)s
+        UNION
+        SELECT item_code FROM `tabItem Price`
+        WHERE price_list = %(price_list)s AND selling = 1 AND modified > %(after)s
+    """, {"after": modified_after, "price_list": DEFAULT_SELLING_PRICE_LIST}))
+
+    # Hard deletes: an Item is gone for good, a deleted Item Price falls back to standard_rate
+    removed = set()
+    for deleted in frappe.get_all(
+        "Deleted Document",
+        fields=["deleted_doctype", "deleted_name", "data"],
+        filters={"deleted_doctype": ["in", ["Item", "Item Price"]], "creation": [">", modified_after]}
+    ):
+        if deleted.deleted_doctype == "Item":
+            removed.add(deleted.deleted_name)
+        else:
+            data = frappe.parse_json(deleted.data or "{}")
+            if data.get("price_list") == DEFAULT_SELLING_PRICE_LIST and data.get("item_code"):
+                changed.add(data.get("item_code"))
+
+    items = get_catalog_items(changed - removed)
+
+    # Changed items that are no longer sellable services are tombstoned as well
+    removed.update(changed - {item.name for item in items})
+
+    return {"items": items, "removed": sorted(removed), "full": False, "sync_token": sync_token}
+
+
+def build_catalog_rows(item_codes=None):
+    """Resolve Service Catalog rows from Item, Item Default, Item Price and Item Tax"""
+    service_item_codes = get_service_item_codes()
+    if item_codes is not None:
+        service_item_codes = list(set(service_item_codes) & set(item_codes))
+    if not service_item_codes:
+        return []
+
+    return resolve_item_rows({
+        "disabled": 0,
+        "is_sales_item": 1,
+        "has_variants": 0,  # Exclude template items
+        "name": ["in", service_item_codes]
+    })
+
+
+def resolve_item_rows(filters):
+    """Resolve Items matching `filters` into Service Catalog shaped rows"""
+    items = frappe.get_all(
+        "Item",
+        fields=[
+            "name", "item_name", "description", "stock_uom", "standard_rate", "item_group", "brand",
+            "custom_service_time", "custom_gap_time", "weight_per_unit", "weight_uom"
+        ],
+        filters=filters
+    )
+    if not items:
+        return []
+
+    item_names = [item.name for item in items]
+    # Straight from Item Price, the catalog hooks may run before the price cache is cleared
+    rates = load_item_prices(item_names, DEFAULT_SELLING_PRICE_LIST)
+
+    tax_templates = {}
+    for tax in frappe.get_all(
+        "Item Tax",
+        fields=["parent", "item_tax_template"],
+        filters={"parent": ["in", item_names], "parenttype": "Item"},
+        order_by="idx asc"
+    ):
+        tax_templates.setdefault(tax.parent, tax.item_tax_template)
+
+    rows = []
+    for item in items:
+        service_time = cint(item.custom_service_time)
+        gap_time = cint(item.custom_gap_time)
+        rows.append(frappe._dict({
+            "item_code": item.name,
+            "item_name": item.item_name,
+            "item_group": item.item_group,
+            "brand": item.brand,
+            "stock_uom": item.stock_uom,
+            "price_list": DEFAULT_SELLING_PRICE_LIST,
+            "rate": flt(rates[item.name]) if item.name in rates else flt(item.standard_rate),
+            "standard_rate": flt(item.standard_rate),
+            "item_tax_template": tax_templates.get(item.name),
+            "service_time": service_time,
+            "gap_time": gap_time,
+            "total_duration": service_time + gap_time,
+            "description": item.description,
+            "weight_per_unit": item.weight_per_unit,
+            "weight_uom": item.weight_uom
+        }))
+    return rows
+
+
+def write_catalog_rows(rows):
+    if not rows:
+        return
+    timestamp = now()
+    user = frappe.session.user
+    frappe.db.bulk_insert(
+        "Service Catalog",
+        ["name", "creation", "modified", "owner", "modified_by", "docstatus", *CATALOG_COLUMNS],
+        [(row.item_code, timestamp, timestamp, user, user, 0, *(row[column] for column in CATALOG_COLUMNS)) for row in rows]
+    )
+
+
+def rebuild_service_catalog():
+    """Rebuild the whole Service Catalog, run nightly and after migrate"""
+    rows = build_catalog_rows()
+    frappe.db.delete("Service Catalog")
+    write_catalog_rows(rows)
+    # Also resyncs prices written without hooks, e.g. by data imports
+    clear_item_price_cache()
+
+
+def update_service_catalog(item_codes):
+    """Re-resolve the catalog rows of the given items, dropping those no longer sellable"""
+    item_codes = list({item_code for item_code in item_codes if item_code})
+    if not item_codes:
+        return
+    frappe.db.delete("Service Catalog", {"name": ["in", item_codes]})
+    write_catalog_rows(build_catalog_rows(item_codes))
+
+
+def update_catalog_for_item(doc, method=None, *args):
+    """doc_events hook for Item"""
+    if method == "after_delete":
+        frappe.db.delete("Service Catalog", {"name": doc.name})
+        return
+
+    item_codes = [doc.name]
+    if method == "after_rename" and args:
+        item_codes.append(args[0])  # Old name
+    update_service_catalog(item_codes)
+
+
+def update_catalog_for_item_price(doc, method=None):
+    """doc_events hook for Item Price, only prices of the catalog's price list matter"""
+    prices = [doc]
+    if doc.get_doc_before_save():
+        prices.append(doc.get_doc_before_save())
+
+    update_service_catalog([
+        price.item_code for price in prices
+        if price.price_list == DEFAULT_SELLING_PRICE_LIST and price.selling
+    ])
+
+
+def get_service_item_codes():
+    """Item codes that have the service company in their item defaults"""
+    return frappe.db.sql_list("""
+        SELECT parent
+        FROM `tabItem Default`
+        WHERE company = %s AND parenttype = 'Item'
+    """, SERVICE_COMPANY)
@@ -0,0 +1,55 @@
+import json
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("services-ordering-load-test")
+@click.option("--orders", default=100, help="Order flows to run")
+@click.option("--concurrency", default=4, help="Agents placing orders at the same time")
+@click.option("--customers", default=50, help="Synthetic customers to seed")
+@click.option("--items", default=20, help="Synthetic service items to seed")
+@click.option("--teams", default=5, help="Synthetic cleaning teams to seed")
+@click.option("--skip-email", is_flag=True, default=False, help="Do not call send_sales_order_email")
+@click.option("--mode-of-payment", default="Cash", help="Mode of Payment for create_payment_entry, empty to skip it")
+@click.option("--paymob-latency-ms", default=150, help="Latency of each stub Paymob call")
+@click.option("--user", default="Administrator", help="User the agents act as")
+@click.option("--random-seed", type=int, help="Seed for reproducible carts")
+@click.option("--output", type=click.Path(), help="Also write the report as JSON to this file")
+@pass_context
+def load_test(
+	context, orders, concurrency, customers, items, teams, skip_email, mode_of_payment, paymob_latency_ms,
+	user, random_seed, output
+):
+	"""Measure create_sales_order, send_sales_order_email and create_payment_entry under concurrent agents"""
+	import frappe
+
+	from services_ordering.load_test import format_report, run_load_test
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		report = run_load_test(
+			site,
+			orders=orders,
+			concurrency=concurrency,
+			customers=customers,
+			items=items,
+			teams=teams,
+			send_email=not skip_email,
+			mode_of_payment=mode_of_payment or None,
+			paymob_latency_ms=paymob_latency_ms,
+			user=user,
+			random_seed=random_seed,
+		)
+	finally:
+		frappe.destroy()
+
+	click.echo(format_report(report))
+	if output:
+		with open(output, "w") as f:
+			json.dump(report, f, indent=2)
+
+
+commands = [load_test]
@@ -0,0 +1,61 @@
+import frappe
+from erpnext.selling.doctype.quotation.quotation import _make_sales_order
+from frappe import _
+from frappe.utils import getdate, nowdate
+
+from services_ordering.naming import set_block_name
+
+# Sales Order fields a conversion may override, keyed by their name in the portal payload
+CONVERSION_OVERRIDE_FIELDS = {
+    "delivery_date": "delivery_date",
+    "custom_time": "custom_time",
+    "team": "custom_team",
+    "custom_payment_mode": "custom_payment_mode",
+    "customer_address": "customer_address",
+    "shipping_address_name": "shipping_address_name",
+    "contact_person": "contact_person",
+    "terms": "terms"
+}
+
+
+def convert_quotation(quotation_name, overrides=None):
+    """Map a Quotation into a submitted Sales Order in the current transaction
+
+    ERPNext's Quotation mapper copies the lines with their rates, the taxes,
+    payment terms and same-named custom fields, so nothing is repriced. Service
+    and gap times are fetched from the items on insert and totalled by
+    utils.calculate_total_service_time. A draft quotation is submitted first,
+    converting it means the customer accepted it.
+    """
+    overrides = overrides or {}
+
+    # Locked until commit, so the same quotation is never converted twice concurrently
+    quotation = frappe.get_doc("Quotation", quotation_name, for_update=True)
+    if quotation.docstatus == 2:
+        frappe.throw(_("Quotation {0} is cancelled").format(quotation.name))
+    if quotation.status == "Ordered":
+        frappe.throw(_("Quotation {0} is already converted to a Sales Order").format(quotation.name))
+    if quotation.quotation_to != "Customer":
+        frappe.throw(_("Quotation {0} is not for a customer").format(quotation.name))
+
+    if quotation.docstatus == 0:
+        quotation.flags.ignore_permissions = True
+        quotation.submit()
+
+    sales_order = _make_sales_order(quotation.name, ignore_permissions=True)
+
+    # Valid till doubles as the delivery date on portal quotations, see insert_quotation
+    delivery_date = overrides.get("delivery_date") or quotation.valid_till or nowdate()
+    sales_order.delivery_date = max(getdate(delivery_date), getdate(sales_order.transaction_date or nowdate()))
+    for item in sales_order.items:
+        if not item.delivery_date:
+            item.delivery_date = sales_order.delivery_date
+
+    for key, fieldname in CONVERSION_OVERRIDE_FIELDS.items():
+        if key != "delivery_date" and overrides.get(key):
+            sales_order.set(fieldname, overrides.get(key))
+
+    set_block_name(sales_order)
+    sales_order.insert(ignore_permissions=True)
+    sales_order.submit()
+    return sales_order
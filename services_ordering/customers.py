@@ -0,0 +1,259 @@
+import re
+
+import frappe
+from frappe.utils import cint
+
+SEARCH_CUSTOMER_GROUP = "Sage"
+SEARCH_PAGE_LEN = 20
+MAX_SEARCH_PAGE_LEN = 100
+
+CUSTOMER_SEARCH_FIELDS = [
+    "name", "customer_name", "customer_group", "territory", "customer_type", "mobile_no", "email_id"
+]
+
+# Harakat, superscript alef and Quranic marks carry no meaning for lookups
+ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+ARABIC_TATWEEL = "\u0640"
+ARABIC_LETTER_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ى": "ي",
+    "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+    # Arabic-Indic and Persian digits, so mobile numbers typed either way match
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+})
+
+
+def normalize_search_text(text):
+    """Fold Arabic spelling variants, diacritics, tatweel, case and spacing for search"""
+    if not text:
+        return ""
+    text = ARABIC_DIACRITICS.sub("", str(text)).replace(ARABIC_TATWEEL, "")
+    text = text.translate(ARABIC_LETTER_MAP).casefold()
+    return " ".join(text.split())
+
+
+def set_customer_search_name(doc, method=None):
+    """doc_events hook: keep the indexed search name of a Customer in sync"""
+    doc.custom_search_name = normalize_search_text(doc.customer_name)
+
+
+def find_customers(txt=None, start=None, page_len=SEARCH_PAGE_LEN):
+    """Prefix search over customer name, mobile and email with keyset pagination
+
+    `start` is the `next_start` cursor of the previous page. Each branch of the match
+    is a prefix LIKE on an indexed column, so the cost does not grow with the table.
+    """
+    page_len = min(cint(page_len) or SEARCH_PAGE_LEN, MAX_SEARCH_PAGE_LEN)
+    txt = (txt or "").strip()
+    search_name = normalize_search_text(txt)
+
+    conditions = ["disabled = 0", "customer_group = %(customer_group)s"]
+    values = {"customer_group": SEARCH_CUSTOMER_GROUP, "page_len": page_len + 1}
+
+    if search_name:
+        values["name_prefix"] = escape_like(search_name) + "%"
+        values["mobile_prefix"] = escape_like(search_name.replace(" ", "")) + "%"
+        values["email_prefix"] = escape_like(txt.lower()) + "%"
+        values["customer_id"] = txt
+        conditions.append("""(
+            custom_search_name LIKE %(name_prefix)s
+            OR mobile_no LIKE %(mobile_prefix)s
+            OR email_id LIKE %(email_prefix)s
+            OR name = %(customer_id)s
+        )""")
+
+    after_name, after_id = parse_cursor(start)
+    if after_id:
+        values.update({"after_name": after_name, "after_id": after_id})
+        conditions.append("""(
+            custom_search_name > %(after_name)s
+            OR (custom_search_name = %(after_name)s AND name > %(after_id)s)
+        )""")
+
+    customers = frappe.db.sql(f"""
+        SELECT {", ".join(CUSTOMER_SEARCH_FIELDS)}, custom_search_name
+        FROM `tabCustomer`
+        WHERE {" AND ".join(conditions)}
+        ORDER BY custom_search_name ASC, name ASC
+        LIMIT %(page_len)s
+    """, values, as_dict=True)
+
+    next_start = None
+    if len(customers) > page_len:
+        customers = customers[:page_len]
+        last = customers[-1]
+        next_start = make_cursor(last.custom_search_name, last.name)
+
+    for customer in customers:
+        customer.pop("custom_search_name", None)
+
+    return customers, next_start
+
+
+def make_cursor(search_name, name):
+    return frappe.as_json([search_name or "", name], indent=None)
+
+
+def parse_cursor(start):
+    """Decode a `next_start` cursor, anything else (0, None, "") means the first page"""
+    if not start or not isinstance(start, str) or not start.startswith("["):
+        return None, None
+    try:
+        search_name, name = frappe.parse_json(start)
+    except (ValueError, TypeError):
+        return None, None
+    return search_name, name
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+CUSTOMER_PROFILE_CACHE_KEY = "services_ordering:customer_profile"
+
+
+def get_customer_profiles(customers):
+    """Customer details with primary address and contact, keyed by customer
+
+    Profiles are cached per customer and invalidated by Customer, Address and
+    Contact hooks; the misses of a batch are resolved together in one query.
+    """
+    if isinstance(customers, str):
+        customers = [customers]
+    customers = list(dict.fromkeys(customer for customer in customers or [] if customer))
+
+    cache = frappe.cache()
+    profiles = {}
+    for customer in customers:
+        profile = cache.hget(CUSTOMER_PROFILE_CACHE_KEY, customer)
+        if profile:
+            profiles[customer] = profile
+
+    missing = [customer for customer in customers if customer not in profiles]
+    for customer, profile in load_customer_profiles(missing).items():
+        cache.hset(CUSTOMER_PROFILE_CACHE_KEY, customer, profile)
+        profiles[customer] = profile
+
+    return profiles
+
+
+def load_customer_profiles(customers):
+    """Resolve customer, primary address and primary contact in a single joined query"""
+    if not customers:
+        return {}
+
+    # Not a Customer column on every version, credit limits moved to a child table
+    credit_limit = "c.credit_limit" if frappe.db.has_column("Customer", "credit_limit") else "NULL"
+
+    rows = frappe.db.sql(f"""
+        SELECT
+            c.name, c.customer_name, c.customer_group, c.territory, c.customer_type,
+            c.default_currency, c.default_price_list, c.payment_terms, {credit_limit} AS credit_limit,
+            addr.name AS address_name, addr.address_line1, addr.address_line2, addr.city,
+            addr.state, addr.country, addr.pincode,
+            con.name AS contact_name, con.first_name, con.last_name, con.email_id,
+            con.mobile_no, con.phone
+        FROM `tabCustomer` c
+        LEFT JOIN `tabAddress` addr ON addr.name = COALESCE(c.customer_primary_address, (
+            SELECT dl.parent
+            FROM `tabDynamic Link` dl
+            JOIN `tabAddress` a ON a.name = dl.parent
+            WHERE dl.parenttype = 'Address' AND dl.link_doctype = 'Customer' AND dl.link_name = c.name
+            ORDER BY a.is_primary_address DESC, a.creation ASC
+            LIMIT 1
+        ))
+        LEFT JOIN `tabContact` con ON con.name = COALESCE(c.customer_primary_contact, (
+            SELECT dl.parent
+            FROM `tabDynamic Link` dl
+            JOIN `tabContact` ct ON ct.name = dl.parent
+            WHERE dl.parenttype = 'Contact' AND dl.link_doctype = 'Customer' AND dl.link_name = c.name
+            ORDER BY ct.is_primary_contact DESC, ct.creation ASC
+            LIMIT 1
+        ))
+        WHERE c.name IN %(customers)s
+    """, {"customers": customers}, as_dict=True)
+
+    profiles = {}
+    for row in rows:
+        default_address = None
+        if row.address_name:
+            default_address = {
+                "name": row.address_name,
+                "address_line1": row.address_line1,
+                "address_line2": row.address_line2,
+                "city": row.city,
+                "state": row.state,
+                "country": row.country,
+                "pincode": row.pincode
+            }
+
+        default_contact = None
+        if row.contact_name:
+            default_contact = {
+                "name": row.contact_name,
+                "first_name": row.first_name,
+                "last_name": row.last_name,
+                "email_id": row.email_id,
+                "mobile_no": row.mobile_no,
+                "phone": row.phone
+            }
+
+        profiles[row.name] = {
+            "customer_name": row.customer_name,
+            "customer_group": row.customer_group,
+            "territory": row.territory,
+            "customer_type": row.customer_type,
+            "default_currency": row.default_currency,
+            "default_price_list": row.default_price_list,
+            "payment_terms": row.payment_terms,
+            "credit_limit": row.credit_limit,
+            "default_address": default_address,
+            "default_contact": default_contact
+        }
+    return profiles
+
+
+def get_customer_neighborhoods(customers):
+    """Neighborhood of each customer's primary address, the portals keep it in address_line2"""
+    neighborhoods = {}
+    for customer, profile in get_customer_profiles(customers).items():
+        address = profile.get("default_address") or {}
+        if address.get("address_line2"):
+            neighborhoods[customer] = address["address_line2"]
+    return neighborhoods
+
+
+def clear_customer_profiles(customers):
+    customers = [customer for customer in customers if customer]
+    if not customers:
+        return
+
+    def clear():
+        for customer in customers:
+            frappe.cache().hdel(CUSTOMER_PROFILE_CACHE_KEY, customer)
+
+    clear()
+    # A request running concurrently may cache pre-commit data, clear again once committed
+    frappe.db.after_commit.add(clear)
+
+
+def clear_customer_profile(doc, method=None, *args):
+    """doc_events hook for Customer"""
+    customers = [doc.name]
+    if method == "after_rename" and args:
+        customers.append(args[0])  # Old name
+    clear_customer_profiles(customers)
+
+
+def clear_linked_customer_profiles(doc, method=None, *args):
+    """doc_events hook for Address and Contact: clear every customer linked now or before the save"""
+    links = list(doc.get("links") or [])
+    if doc.get_doc_before_save():
+        links += doc.get_doc_before_save().get("links") or []
+    clear_customer_profiles({link.link_name for link in links if link.link_doctype == "Customer"})
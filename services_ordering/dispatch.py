@@ -0,0 +1,427 @@
+import random
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import pairwise
+from time import monotonic
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, getdate, now_datetime, nowdate, to_timedelta
+
+from services_ordering.customers import get_customer_neighborhoods
+from services_ordering.naming import set_block_name
+from services_ordering.scheduling import (
+    DEFAULT_APPOINTMENT_HOURS,
+    SLOT_MINUTES,
+    SLOT_SECONDS,
+    SLOTS_PER_DAY,
+    get_busy_mask,
+    get_day_bounds,
+    get_past_mask,
+    get_run_starts,
+    get_shift_mask,
+    get_team_day_indexes,
+    get_team_details,
+)
+from services_ordering.services_ordering.doctype.service_appointment.service_appointment import (
+    get_paid_sales_order_condition,
+)
+from services_ordering.tracing import trace
+
+GREEDY = "greedy"
+OPTIMIZE = "optimize"
+
+# A plan minimizes idle minutes between a team's jobs, plus these per neighborhood
+# change between two consecutive jobs and per minute away from the requested time
+IDLE_MINUTE_COST = 1
+HOP_COST = 45
+TIME_DEVIATION_MINUTE_COST = 2
+
+# Orders taken out and put back per local search move
+MAX_RUIN_SIZE = 3
+
+# Overridable in site_config.json
+DEFAULT_TIME_WINDOW_MINUTES = 120
+DEFAULT_OPTIMIZE_ITERATIONS = 5000
+DEFAULT_OPTIMIZE_SECONDS = 20
+
+
+class TeamDay:
+    """A team's day on the slot grid of scheduling: its free slots and its jobs sorted by start
+
+    Jobs already booked have no `order`, they are fixed. Planned jobs point to
+    their order, which points back through `team_day` and `start`.
+    """
+
+    def __init__(self, team, free, jobs):
+        self.team = team
+        self.free = free
+        self.jobs = sorted(jobs, key=lambda job: job.start)
+
+    def get_insertion(self, order):
+        """Cheapest (cost, start) of adding `order` to this day, None if it fits nowhere"""
+        starts = get_run_starts(self.free, order.slots)
+        if order.window is not None:
+            starts &= order.window
+
+        best = None
+        for start in get_candidate_starts(starts, order.requested_slot):
+            cost = self.get_insertion_cost(start, start + order.slots, order.neighborhood) + get_time_cost(order, start)
+            if best is None or cost < best[0]:
+                best = (cost, start)
+        return best
+
+    def get_insertion_cost(self, start, end, neighborhood):
+        """Change of idle and hop cost when a job takes [start, end), between the jobs around it"""
+        position = bisect_left([job.start for job in self.jobs], start)
+        previous = self.jobs[position - 1] if position else None
+        following = self.jobs[position] if position < len(self.jobs) else None
+
+        job = frappe._dict(start=start, end=end, neighborhood=neighborhood)
+        cost = 0
+        if previous:
+            cost += get_link_cost(previous, job)
+        if following:
+            cost += get_link_cost(job, following)
+        if previous and following:
+            cost -= get_link_cost(previous, following)
+        return cost
+
+    def add(self, order, start):
+        job = frappe._dict(start=start, end=start + order.slots, neighborhood=order.neighborhood, order=order)
+        self.jobs.insert(bisect_left([other.start for other in self.jobs], start), job)
+        self.free &= ~get_slot_mask(start, order.slots)
+        order.team_day, order.start = self, start
+
+    def remove(self, order):
+        self.jobs = [job for job in self.jobs if job.order is not order]
+        self.free |= get_slot_mask(order.start, order.slots)
+        order.team_day = order.start = None
+
+    def get_cost(self):
+        cost = sum(get_link_cost(previous, job) for previous, job in pairwise(self.jobs))
+        return cost + sum(get_time_cost(job.order, job.start) for job in self.jobs if job.order)
+
+
+def plan_team_assignments(day=None, mode=GREEDY, service_teams=None):
+    """Plan Service Appointments for the sales orders of a day that have none yet
+
+    Orders are placed on the team shifts around existing bookings, at most
+    `services_ordering_dispatch_time_window` minutes from their requested time,
+    on their own team if one is set. The plan minimizes idle gaps, neighborhood
+    changes and distance to the requested time. The greedy mode places the
+    most constrained orders first at their cheapest spot, fast enough for
+    interactive use. The optimize mode then keeps taking a few orders out and
+    putting them back in a random order, keeping every change that does not
+    make the plan worse. Nothing is written, see apply_team_assignments.
+    """
+    day = getdate(day or nowdate())
+    if mode not in (GREEDY, OPTIMIZE):
+        frappe.throw(_("Mode must be {0} or {1}").format(GREEDY, OPTIMIZE))
+
+    orders = get_unscheduled_orders(day)
+    team_days = get_team_days(day, service_teams, orders)
+
+    for order in sorted(orders, key=get_order_priority):
+        insert_order(order, team_days)
+    if mode == OPTIMIZE:
+        improve_plan(orders, team_days, random.Random(str(day)))
+
+    plan = make_plan(day, mode, orders, team_days)
+    trace(
+        "Dispatch - Plan",
+        date=plan["date"],
+        mode=mode,
+        assigned=len(plan["assignments"]),
+        unassigned=len(plan["unassigned"]),
+        cost=plan["cost"]
+    )
+    return plan
+
+
+def get_unscheduled_orders(day):
+    """Submitted, open and paid sales orders delivered on `day` without an appointment"""
+    # Paid as for the sales orders an appointment may be booked on, see get_paid_sales_orders
+    orders = frappe.db.sql(f"""
+        SELECT so.name, so.customer, so.custom_time, so.custom_team, so.custom_total_service_time
+        FROM `tabSales Order` so
+        WHERE so.docstatus = 1
+            AND so.delivery_date = %(day)s
+            AND so.status NOT IN ('Closed', 'Completed', 'On Hold')
+            AND IFNULL(so.custom_appointment_ref, '') = ''
+            AND {get_paid_sales_order_condition("so")}
+        ORDER BY so.name ASC
+    """, {"day": day}, as_dict=True)
+    if not orders:
+        return orders
+
+    # Draft appointments, e.g. of an earlier plan, do not set custom_appointment_ref yet
+    booked = set(frappe.get_all(
+        "Service Appointment",
+        filters={"sales_order": ["in", [order.name for order in orders]], "docstatus": ["!=", 2]},
+        pluck="sales_order"
+    ))
+    return [order for order in orders if order.name not in booked]
+
+
+def get_team_days(day, service_teams, orders):
+    """TeamDay of every team with a shift, keyed by team, and the orders prepared for placing"""
+    if not service_teams:
+        service_teams = frappe.get_all("Cleaning Team", pluck="name", order_by="name asc")
+    service_teams = list(dict.fromkeys(service_teams))
+    details = get_team_details(service_teams)
+    shift_masks = {team: get_shift_mask(team_details.shifts) for team, team_details in details.items()}
+    teams = [team for team in details if shift_masks[team]]
+
+    indexes = get_team_day_indexes(teams, [day]) if teams else {}
+    customers = {order.customer for order in orders}
+    customers.update(appointment.customer for index in indexes.values() for appointment in index.appointments)
+    neighborhoods = get_customer_neighborhoods([customer for customer in customers if customer])
+
+    day_start, day_end = get_day_bounds(day)
+    past = get_past_mask(day_start, now_datetime())
+    team_days = {}
+    for team in teams:
+        index = indexes[(team, day)]
+        jobs = [
+            frappe._dict(
+                start=max(int((appointment.start - day_start).total_seconds()) // SLOT_SECONDS, 0),
+                end=min(-(-int((appointment.end - day_start).total_seconds()) // SLOT_SECONDS), SLOTS_PER_DAY),
+                neighborhood=neighborhoods.get(appointment.customer),
+                order=None
+            )
+            for appointment in index.appointments
+        ]
+        free = shift_masks[team] & ~get_busy_mask(index, day_start, day_end) & ~past
+        team_days[team] = TeamDay(team, free, jobs)
+
+    window_slots = get_time_window_minutes() // SLOT_MINUTES
+    for order in orders:
+        order.minutes = (cint(order.custom_total_service_time) or DEFAULT_APPOINTMENT_HOURS) * 60
+        order.slots = -(-order.minutes // SLOT_MINUTES)
+        order.neighborhood = neighborhoods.get(order.customer)
+        order.requested_slot = None
+        order.window = None
+        if order.custom_time is not None:
+            order.requested_slot = round(to_timedelta(order.custom_time).total_seconds() / SLOT_SECONDS)
+            first = max(order.requested_slot - window_slots, 0)
+            order.window = get_slot_mask(first, order.requested_slot + window_slots + 1 - first)
+        order.team_requested = not order.custom_team or order.custom_team in service_teams
+        order.team_day = order.start = None
+
+    return team_days
+
+
+def get_order_priority(order):
+    # Orders tied to a team, then to a time, then the longest, have the fewest places to go
+    return (not order.custom_team, order.requested_slot is None, order.requested_slot or 0, -order.slots)
+
+
+def insert_order(order, team_days):
+    """Place `order` where it adds the least cost, False if no team can take it"""
+    if order.custom_team:
+        candidates = [team_days[order.custom_team]] if order.custom_team in team_days else []
+    else:
+        candidates = team_days.values()
+
+    best = None
+    for team_day in candidates:
+        insertion = team_day.get_insertion(order)
+        if insertion and (best is None or insertion[0] < best[0]):
+            best = (insertion[0], insertion[1], team_day)
+    if not best:
+        return False
+
+    best[2].add(order, best[1])
+    return True
+
+
+def improve_plan(orders, team_days, rng):
+    """Local search: take a few orders out, put them back in a random order, keep it unless the plan got worse"""
+    if not orders:
+        return
+
+    iterations = cint(frappe.conf.get("services_ordering_dispatch_iterations", DEFAULT_OPTIMIZE_ITERATIONS))
+    deadline = monotonic() + cint(frappe.conf.get("services_ordering_dispatch_seconds", DEFAULT_OPTIMIZE_SECONDS))
+    score = get_plan_score(orders, team_days)
+
+    for _iteration in range(iterations):
+        if monotonic() > deadline:
+            break
+
+        ruined = rng.sample(orders, rng.randint(1, min(MAX_RUIN_SIZE, len(orders))))
+        previous = [(order, order.team_day, order.start) for order in ruined]
+        for order in ruined:
+            if order.team_day:
+                order.team_day.remove(order)
+        rng.shuffle(ruined)
+        for order in ruined:
+            insert_order(order, team_days)
+
+        new_score = get_plan_score(orders, team_days)
+        if new_score <= score:
+            # Equal plans are kept too, so the search can move across plateaus
+            score = new_score
+            continue
+
+        for order in ruined:
+            if order.team_day:
+                order.team_day.remove(order)
+        for order, team_day, start in previous:
+            if team_day:
+                team_day.add(order, start)
+
+
+def get_plan_score(orders, team_days):
+    # Placing one more order always beats any saving in cost
+    unassigned = sum(1 for order in orders if not order.team_day)
+    return (unassigned, sum(team_day.get_cost() for team_day in team_days.values()))
+
+
+def make_plan(day, mode, orders, team_days):
+    day_start = get_day_bounds(day)[0]
+    assignments, idle_minutes, hops, time_deviation_minutes = [], 0, 0, 0
+
+    for team_day in team_days.values():
+        for previous, job in pairwise(team_day.jobs):
+            if previous.order or job.order:
+                idle_minutes += max(job.start - previous.end, 0) * SLOT_MINUTES
+                hops += is_hop(previous, job)
+
+        for job in team_day.jobs:
+            if not job.order:
+                continue
+            order = job.order
+            start = day_start + timedelta(minutes=job.start * SLOT_MINUTES)
+            if order.requested_slot is not None:
+                time_deviation_minutes += abs(job.start - order.requested_slot) * SLOT_MINUTES
+            assignments.append({
+                "sales_order": order.name,
+                "customer": order.customer,
+                "neighborhood": order.neighborhood,
+                "team": team_day.team,
+                "start": start,
+                "end": start + timedelta(minutes=order.minutes),
+                "service_time": order.minutes // 60,
+                "requested_time": order.custom_time
+            })
+
+    unassigned = []
+    for order in orders:
+        if order.team_day:
+            continue
+        if not order.team_requested:
+            reason = _("Team {0} is not among the teams being planned").format(order.custom_team)
+        elif order.custom_team and order.custom_team not in team_days:
+            reason = _("Team {0} has no shift").format(order.custom_team)
+        elif order.window is not None:
+            reason = _("No free slot within {0} minutes of the requested time").format(get_time_window_minutes())
+        else:
+            reason = _("No free slot long enough in any shift")
+        unassigned.append({"sales_order": order.name, "customer": order.customer, "reason": reason})
+
+    return {
+        "date": str(day),
+        "mode": mode,
+        "assignments": sorted(assignments, key=lambda assignment: (assignment["team"], assignment["start"])),
+        "unassigned": unassigned,
+        "idle_minutes": idle_minutes,
+        "hops": hops,
+        "time_deviation_minutes": time_deviation_minutes,
+        "cost": get_plan_score(orders, team_days)[1]
+    }
+
+
+def apply_team_assignments(plan, submit=False):
+    """Create the planned Service Appointments, each in its own savepoint so a failing one is rolled back alone
+
+    Appointments are left in draft unless `submit` is set; submitting links the
+    sales order, sets its team and emails the customer.
+    """
+    results = []
+    for index, assignment in enumerate(plan["assignments"]):
+        savepoint = f"team_assignment_{index}"
+        frappe.db.savepoint(savepoint)
+        try:
+            appointment = make_appointment(assignment, submit=submit)
+        except Exception as e:
+            frappe.db.rollback(save_point=savepoint)
+            frappe.log_error(
+                f"Error creating appointment for {assignment['sales_order']}: {str(e)}", "Dispatch - Create Appointment"
+            )
+            results.append({"success": False, "sales_order": assignment["sales_order"], "message": str(e)})
+        else:
+            results.append({"success": True, "sales_order": assignment["sales_order"], "appointment": appointment.name})
+    return results
+
+
+def make_appointment(assignment, submit=False):
+    appointment = frappe.get_doc({
+        "doctype": "Service Appointment",
+        "sales_order": assignment["sales_order"],
+        "customer": assignment["customer"],
+        "service_team": assignment["team"],
+        "appointment_date_time": assignment["start"],
+        "appointment_end_time": assignment["end"],
+        "total_service_time": assignment["service_time"]
+    })
+    set_block_name(appointment)
+    appointment.insert(ignore_permissions=True)
+    if submit:
+        appointment.submit()
+    return appointment
+
+
+def plan_next_day():
+    """Scheduled nightly: plan tomorrow in optimize mode as draft appointments for the dispatchers to review
+
+    Opt-in, set `services_ordering_nightly_dispatch` to 1 in site_config.json.
+    """
+    if not cint(frappe.conf.get("services_ordering_nightly_dispatch", 0)):
+        return
+    apply_team_assignments(plan_team_assignments(add_days(nowdate(), 1), mode=OPTIMIZE))
+
+
+def get_candidate_starts(starts, requested_slot=None):
+    """First and last start of each run of feasible starts, and the requested start inside it
+
+    Within a run the jobs around a new one stay the same, so its cost is linear
+    in the start except for a bend at the requested time; the cheapest start is
+    always one of these.
+    """
+    candidates = []
+    while starts:
+        first = (starts & -starts).bit_length() - 1
+        run = starts >> first
+        length = (~run & (run + 1)).bit_length() - 1
+        last = first + length - 1
+        candidates.append(first)
+        if last != first:
+            candidates.append(last)
+        if requested_slot is not None and first < requested_slot < last:
+            candidates.append(requested_slot)
+        starts &= ~get_slot_mask(first, length)
+    return candidates
+
+
+def get_slot_mask(start, length):
+    return ((1 << length) - 1) << start
+
+
+def get_link_cost(previous, job):
+    """Cost of `job` following `previous` on a team"""
+    return max(job.start - previous.end, 0) * SLOT_MINUTES * IDLE_MINUTE_COST + is_hop(previous, job) * HOP_COST
+
+
+def is_hop(previous, job):
+    return bool(previous.neighborhood and job.neighborhood and previous.neighborhood != job.neighborhood)
+
+
+def get_time_cost(order, start):
+    if order.requested_slot is None:
+        return 0
+    return abs(start - order.requested_slot) * SLOT_MINUTES * TIME_DEVIATION_MINUTE_COST
+
+
+def get_time_window_minutes():
+    return cint(frappe.conf.get("services_ordering_dispatch_time_window", DEFAULT_TIME_WINDOW_MINUTES))
@@ -30,6 +30,7 @@ app_license = "mit"
 # include js, css files in header of desk.html
 # app_include_css = "/assets/services_ordering/css/services_ordering.css"
 # app_include_js = "/assets/services_ordering/js/services_ordering.js"
+app_include_js = "/assets/services_ordering/js/portal_master_data.js"
 
 # include js, css files in header of web template
 # web_include_css = "/assets/services_ordering/css/services_ordering.css"
@@ -98,6 +99,11 @@ doctype_js = {
 # before_uninstall = "services_ordering.uninstall.before_uninstall"
 # after_uninstall = "services_ordering.uninstall.after_uninstall"
 
+# Migration
+# ------------
+
+after_migrate = "services_ordering.catalog.rebuild_service_catalog"
+
 # Integration Setup
 # ------------------
 # To set up dependencies/integrations with other apps
@@ -147,12 +153,130 @@ doctype_js = {
 doc_events = {
 	"Sales Order": {
 		"validate": "services_ordering.utils.calculate_total_service_time",
+	},
+	"Customer": {
+		"validate": "services_ordering.customers.set_customer_search_name",
+		"on_update": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.customers.clear_customer_profile",
+		],
+		"after_rename": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.customers.clear_customer_profile",
+		],
+		"on_trash": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.customers.clear_customer_profile",
+		],
+	},
+	"Address": {
+		"on_update": "services_ordering.customers.clear_linked_customer_profiles",
+		"on_trash": "services_ordering.customers.clear_linked_customer_profiles",
+	},
+	"Contact": {
+		"on_update": "services_ordering.customers.clear_linked_customer_profiles",
+		"on_trash": "services_ordering.customers.clear_linked_customer_profiles",
+	},
+	"Company": {
+		"on_update": "services_ordering.master_data.clear_master_data_cache",
+		"after_rename": "services_ordering.master_data.clear_master_data_cache",
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+	},
+	"Item": {
+		"on_update": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.catalog.update_catalog_for_item",
+		],
+		"after_rename": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.catalog.update_catalog_for_item",
+		],
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+		"after_delete": "services_ordering.catalog.update_catalog_for_item",
+	},
+	"Item Price": {
+		"on_update": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.pricing.clear_cached_item_price",
+			"services_ordering.catalog.update_catalog_for_item_price",
+		],
+		"after_rename": "services_ordering.master_data.clear_master_data_cache",
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+		"after_delete": [
+			"services_ordering.pricing.clear_cached_item_price",
+			"services_ordering.catalog.update_catalog_for_item_price",
+		],
+	},
+	"Warehouse": {
+		"on_update": "services_ordering.master_data.clear_master_data_cache",
+		"after_rename": "services_ordering.master_data.clear_master_data_cache",
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+	},
+	"Territory": {
+		"on_update": "services_ordering.master_data.clear_master_data_cache",
+		"after_rename": "services_ordering.master_data.clear_master_data_cache",
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+	},
+	"Customer Group": {
+		"on_update": "services_ordering.master_data.clear_master_data_cache",
+		"after_rename": "services_ordering.master_data.clear_master_data_cache",
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+	},
+	"Price List": {
+		"on_update": "services_ordering.master_data.clear_master_data_cache",
+		"after_rename": "services_ordering.master_data.clear_master_data_cache",
+		"on_trash": "services_ordering.master_data.clear_master_data_cache",
+	},
+	"City": {
+		"on_update": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.locations.clear_location_tree",
+		],
+		"after_rename": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.locations.clear_location_tree",
+		],
+		"on_trash": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.locations.clear_location_tree",
+		],
+	},
+	"Neighborhood": {
+		"on_update": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.locations.clear_location_tree",
+		],
+		"after_rename": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.locations.clear_location_tree",
+		],
+		"on_trash": [
+			"services_ordering.master_data.clear_master_data_cache",
+			"services_ordering.locations.clear_location_tree",
+		],
 	}
 }
 
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"all": [
+		"services_ordering.tracing.write_traces"
+	],
+	"daily": [
+		"services_ordering.catalog.rebuild_service_catalog",
+		"services_ordering.idempotency.purge_expired_keys",
+		"services_ordering.tracing.purge_old_traces"
+	],
+	"cron": {
+		# Evening before, so dispatchers find tomorrow planned in the morning (opt-in, see plan_next_day)
+		"0 22 * * *": [
+			"services_ordering.dispatch.plan_next_day"
+		]
+	},
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"services_ordering.tasks.all"
@@ -203,11 +327,13 @@ doc_events = {
 # ----------------
 # before_request = ["services_ordering.utils.before_request"]
 # after_request = ["services_ordering.utils.after_request"]
+after_request = ["services_ordering.tracing.flush_trace_buffer"]
 
 # Job Events
 # ----------
 # before_job = ["services_ordering.utils.before_job"]
 # after_job = ["services_ordering.utils.after_job"]
+after_job = ["services_ordering.tracing.flush_trace_buffer"]
 
 # User Data Protection
 # --------------------
@@ -269,7 +395,7 @@ fixtures = [
         "dt": "Custom Field",
         "filters": [
             [
-                "dt", "in", ["Sales Order", "Delivery Note", "Item", "Sales Order Item", "Delivery Note Item", "Quotation", "Quotation Item"]
+                "dt", "in", ["Sales Order", "Delivery Note", "Item", "Sales Order Item", "Delivery Note Item", "Quotation", "Quotation Item", "Customer"]
             ]
         ]
     }
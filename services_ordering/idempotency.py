@@ -0,0 +1,82 @@
+import hashlib
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, now, now_datetime
+
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+
+def run_idempotent(scope, idempotency_key, fn):
+    """Run `fn` once per idempotency key, replaying its response to retries
+
+    The key is optional and may also come in the Idempotency-Key header. Only
+    successful responses are kept, so a failed attempt can be retried. Keys are
+    scoped per endpoint and user and expire after IDEMPOTENCY_KEY_TTL_HOURS.
+    """
+    if not idempotency_key:
+        # Background jobs, scripts and the load test call the endpoints outside a request
+        request = getattr(frappe.local, "request", None)
+        idempotency_key = request.headers.get("Idempotency-Key") if request else None
+    if not idempotency_key:
+        return fn()
+
+    name = get_key_name(scope, idempotency_key)
+    response = get_stored_response(name)
+    if response is not None:
+        return response
+
+    try:
+        # The primary key serialises concurrent retries, the second insert waits for the first to finish
+        frappe.get_doc({
+            "doctype": "Idempotency Key",
+            "scope": scope,
+            "idempotency_key": idempotency_key,
+            "user": frappe.session.user,
+            "status": "In Progress",
+            "expires_on": add_to_date(now_datetime(), hours=IDEMPOTENCY_KEY_TTL_HOURS)
+        }).insert(ignore_permissions=True, set_name=name)
+    except frappe.DuplicateEntryError:
+        response = get_stored_response(name)
+        if response is not None:
+            return response
+        return {"success": False, "message": "This request is already being processed, please wait and try again"}
+
+    try:
+        response = fn()
+    except Exception:
+        frappe.db.delete("Idempotency Key", name)
+        raise
+
+    if isinstance(response, dict) and response.get("success"):
+        frappe.db.set_value(
+            "Idempotency Key", name,
+            {"status": "Completed", "response": frappe.as_json(response)},
+            update_modified=False
+        )
+    else:
+        frappe.db.delete("Idempotency Key", name)
+    return response
+
+
+def get_key_name(scope, idempotency_key):
+    return hashlib.sha1(f"{scope}:{frappe.session.user}:{idempotency_key}".encode()).hexdigest()
+
+
+def get_stored_response(name):
+    """Stored response for a completed key, None if unknown, expired or still in progress"""
+    key = frappe.db.get_value("Idempotency Key", name, ["status", "response", "expires_on"], as_dict=True)
+    if not key:
+        return None
+
+    if get_datetime(key.expires_on) < now_datetime():
+        frappe.db.delete("Idempotency Key", name)
+        return None
+
+    if key.status != "Completed" or not key.response:
+        return None
+    return frappe.parse_json(key.response)
+
+
+def purge_expired_keys():
+    """Scheduled daily: drop expired idempotency keys"""
+    frappe.db.delete("Idempotency Key", {"expires_on": ["<", now()]})
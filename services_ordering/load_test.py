@@ -0,0 +1,444 @@
+"""Load test of the portal order flow: create_sales_order -> send_sales_order_email -> create_payment_entry
+
+Run with `bench --site <site> services-ordering-load-test`, see commands.py. The site
+is seeded with synthetic customers, items and teams, Paymob and outgoing mail are
+served by local stub servers, and each agent is a forked process with its own
+database connection, like a web worker. Only run against a disposable site.
+"""
+
+import json
+import math
+import multiprocessing
+import random
+import socketserver
+import sys
+import threading
+import time
+import types
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import frappe
+from frappe.utils import add_days, now, nowdate
+
+from services_ordering.catalog import SERVICE_COMPANY
+from services_ordering.customers import SEARCH_CUSTOMER_GROUP
+
+LOAD_TEST_PREFIX = "LOADTEST"
+
+# Queries run by the current "request" of a worker process
+QUERY_COUNT = [0]
+
+
+def run_load_test(
+    site,
+    orders=100,
+    concurrency=4,
+    customers=50,
+    items=20,
+    teams=5,
+    send_email=True,
+    mode_of_payment="Cash",
+    paymob_latency_ms=150,
+    user="Administrator",
+    random_seed=None,
+):
+    """Seed the site, drive `orders` order flows with `concurrency` agents and return the report"""
+    if not frappe.conf.allow_tests:
+        frappe.throw("The load test writes synthetic data, set allow_tests in site_config.json of a disposable site")
+    if send_email and frappe.db.exists("Email Account", {"enable_outgoing": 1}):
+        # Mail would go out through that account instead of the stub SMTP server
+        frappe.throw("The load test sends mail, disable outgoing on every Email Account of the site first")
+
+    seed = seed_load_test_data(customers, items, teams)
+    frappe.db.commit()
+
+    rng = random.Random(random_seed)
+    payloads = [
+        make_order_flow(rng, seed, send_email=send_email, mode_of_payment=mode_of_payment)
+        for _ in range(orders)
+    ]
+
+    paymob = start_server(ThreadingHTTPServer(("127.0.0.1", 0), StubPaymobHandler))
+    paymob.latency = paymob_latency_ms / 1000
+    smtp = start_server(StubSMTPServer(("127.0.0.1", 0), StubSMTPHandler))
+
+    # Workers are forked, they must not share this process' connection
+    frappe.db.close()
+    started_at = now()
+    started = time.perf_counter()
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(
+            concurrency,
+            initializer=init_worker,
+            initargs=(site, user, get_server_url(paymob), smtp.server_address[1])
+        ) as pool:
+            flows = pool.map(run_order_flow, payloads, chunksize=1)
+        elapsed = time.perf_counter() - started
+
+        frappe.connect()
+        samples = [sample for flow in flows for sample in flow]
+        if send_email:
+            use_stub_smtp(smtp.server_address[1])
+            samples.append(timed_call("email_queue_flush", flush_email_queue, since=started_at))
+    finally:
+        paymob.shutdown()
+        smtp.shutdown()
+
+    return make_report(samples, orders, concurrency, elapsed, smtp.messages)
+
+
+def seed_load_test_data(customers, items, teams):
+    """Create the synthetic customers, service items and cleaning teams once, returns their names"""
+    customer_group = SEARCH_CUSTOMER_GROUP if frappe.db.exists("Customer Group", SEARCH_CUSTOMER_GROUP) else "All Customer Groups"
+    item_group = "Services" if frappe.db.exists("Item Group", "Services") else "All Item Groups"
+
+    customer_names = []
+    for i in range(customers):
+        customer_name = f"{LOAD_TEST_PREFIX} Customer {i:04d}"
+        name = frappe.db.get_value("Customer", {"customer_name": customer_name})
+        if not name:
+            customer = frappe.get_doc({
+                "doctype": "Customer",
+                "customer_name": customer_name,
+                "customer_type": "Individual",
+                "customer_group": customer_group,
+                "territory": "All Territories"
+            }).insert(ignore_permissions=True)
+            frappe.get_doc({
+                "doctype": "Contact",
+                "first_name": customer_name,
+                "email_ids": [{"email_id": f"loadtest-{i:04d}@example.com", "is_primary": 1}],
+                "links": [{"link_doctype": "Customer", "link_name": customer.name}]
+            }).insert(ignore_permissions=True)
+            name = customer.name
+        customer_names.append(name)
+
+    item_codes = []
+    for i in range(items):
+        item_code = f"{LOAD_TEST_PREFIX}-SVC-{i:03d}"
+        if not frappe.db.exists("Item", item_code):
+            frappe.get_doc({
+                "doctype": "Item",
+                "item_code": item_code,
+                "item_name": f"{LOAD_TEST_PREFIX} Service {i:03d}",
+                "item_group": item_group,
+                "stock_uom": "Nos",
+                "is_stock_item": 0,
+                "is_sales_item": 1,
+                "standard_rate": 100 + 25 * (i % 8),
+                "custom_service_time": 1 + i % 3,
+                "custom_gap_time": i % 2,
+                "item_defaults": [{"company": SERVICE_COMPANY}]
+            }).insert(ignore_permissions=True)
+        item_codes.append(item_code)
+
+    team_names = []
+    for i in range(teams):
+        team_name = f"{LOAD_TEST_PREFIX} Team {i:02d}"
+        # Slot search and dispatch only place orders inside a team's shifts
+        if not frappe.db.exists("Cleaning Team", team_name):
+            frappe.get_doc({
+                "doctype": "Cleaning Team",
+                "name1": team_name,
+                "duty_start_time": "08:00:00",
+                "duty_end_time": "18:00:00",
+                "shifts": [{"start_time": "08:00:00", "end_time": "18:00:00"}]
+            }).insert(ignore_permissions=True)
+        elif not frappe.db.exists("Team Shift", {"parent": team_name, "parenttype": "Cleaning Team"}):
+            team = frappe.get_doc("Cleaning Team", team_name)
+            team.append("shifts", {"start_time": "08:00:00", "end_time": "18:00:00"})
+            team.save(ignore_permissions=True)
+        team_names.append(team_name)
+
+    return frappe._dict({"customers": customer_names, "items": item_codes, "teams": team_names})
+
+
+def make_order_flow(rng, seed, send_email=True, mode_of_payment=None):
+    """One agent's order: a cart of one to three lines, priced by the server"""
+    lines = rng.sample(seed["items"], k=min(rng.randint(1, 3), len(seed["items"])))
+    return {
+        "sales_order": {
+            "customer": rng.choice(seed["customers"]),
+            "delivery_date": add_days(nowdate(), rng.randint(1, 14)),
+            "custom_time": f"{rng.randint(8, 16):02d}:00:00",
+            "team": rng.choice(seed["teams"]) if seed["teams"] else None,
+            "custom_payment_mode": "POS",
+            "items": [{"item_code": item_code, "qty": rng.randint(1, 2), "rate": 0} for item_code in lines]
+        },
+        "send_email": send_email,
+        "mode_of_payment": mode_of_payment
+    }
+
+
+def init_worker(site, user, paymob_url, smtp_port):
+    frappe.init(site=site, force=True)
+    frappe.connect()
+    frappe.set_user(user)
+    install_stub_paymob(paymob_url)
+    use_stub_smtp(smtp_port)
+
+    sql = frappe.db.sql
+
+    def counted_sql(*args, **kwargs):
+        QUERY_COUNT[0] += 1
+        return sql(*args, **kwargs)
+
+    frappe.db.sql = counted_sql
+
+
+def run_order_flow(flow):
+    from services_ordering.services_ordering.page.sales_order_portal.sales_order_portal import (
+        create_payment_entry,
+        create_sales_order,
+        send_sales_order_email,
+    )
+
+    samples = [timed_call("create_sales_order", create_sales_order, sales_order_data=flow["sales_order"])]
+    if not samples[0]["error"]:
+        sales_order_name = samples[0]["result"]["sales_order_name"]
+        if flow["send_email"]:
+            samples.append(timed_call(
+                "send_sales_order_email", send_sales_order_email,
+                sales_order_name=sales_order_name, customer_name=flow["sales_order"]["customer"]
+            ))
+        if flow["mode_of_payment"]:
+            samples.append(timed_call(
+                "create_payment_entry", create_payment_entry,
+                sales_order_name=sales_order_name, mode_of_payment=flow["mode_of_payment"]
+            ))
+
+    for sample in samples:
+        sample.pop("result")
+    return samples
+
+
+def timed_call(endpoint, fn, **kwargs):
+    """Call an endpoint like one request would: fresh request cache, commit or rollback at the end"""
+    QUERY_COUNT[0] = 0
+    frappe.local.cache = {}
+    started = time.perf_counter()
+    result, error = None, None
+    try:
+        result = fn(**kwargs)
+        if isinstance(result, dict) and not result.get("success"):
+            error = result.get("message") or "Unsuccessful response"
+    except Exception as e:
+        error = str(e)
+
+    if error:
+        frappe.db.rollback()
+    else:
+        frappe.db.commit()
+
+    return {
+        "endpoint": endpoint,
+        "duration": time.perf_counter() - started,
+        "queries": QUERY_COUNT[0],
+        "error": error,
+        "result": result
+    }
+
+
+def flush_email_queue(since):
+    """Send the mail queued by this run, anything else in the Email Queue is left alone"""
+    queued = frappe.db.sql("""
+        SELECT DISTINCT eq.name
+        FROM `tabEmail Queue` eq
+        JOIN `tabEmail Queue Recipient` recipient ON recipient.parent = eq.name
+        WHERE eq.status = 'Not Sent' AND eq.creation >= %(since)s AND recipient.recipient LIKE %(recipients)s
+    """, {"since": since, "recipients": "loadtest-%@example.com"}, pluck=True)  # Seeded contacts
+
+    for name in queued:
+        frappe.get_doc("Email Queue", name).send()
+
+
+def make_report(samples, orders, concurrency, elapsed, emails_delivered):
+    endpoints = {}
+    for sample in samples:
+        endpoints.setdefault(sample["endpoint"], []).append(sample)
+
+    report = {
+        "orders": orders,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "orders_per_second": orders / elapsed if elapsed else 0,
+        "emails_delivered": emails_delivered,
+        "endpoints": {}
+    }
+    for endpoint, endpoint_samples in endpoints.items():
+        durations = [sample["duration"] * 1000 for sample in endpoint_samples]
+        errors = [sample["error"] for sample in endpoint_samples if sample["error"]]
+        report["endpoints"][endpoint] = {
+            "calls": len(endpoint_samples),
+            "errors": len(errors),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "p99_ms": percentile(durations, 99),
+            "queries_per_call": sum(sample["queries"] for sample in endpoint_samples) / len(endpoint_samples),
+            # The distinct messages are enough to tell a regression from noise
+            "error_messages": sorted(set(errors))[:10]
+        }
+    return report
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(math.ceil(pct / 100 * len(values)) - 1, 0)]
+
+
+def format_report(report):
+    lines = [
+        f"{report['orders']} orders, {report['concurrency']} agents, {report['elapsed']:.1f}s, "
+        f"{report['orders_per_second']:.2f} orders/s, {report['emails_delivered']} emails delivered",
+        "",
+        f"{'endpoint':<26}{'calls':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+    ]
+    for endpoint, stats in report["endpoints"].items():
+        lines.append(
+            f"{endpoint:<26}{stats['calls']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['queries_per_call']:>9.1f}"
+        )
+    for endpoint, stats in report["endpoints"].items():
+        for message in stats["error_messages"]:
+            lines.append(f"{endpoint}: {message}")
+    return "\n".join(lines)
+
+
+# Stub servers
+# ------------
+
+
+def start_server(server):
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_server_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+class StubPaymobHandler(BaseHTTPRequestHandler):
+    """Answers the Paymob accept flow: auth token, order registration, payment key"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.server.latency)
+
+        if self.path.endswith("/auth/tokens"):
+            body = {"token": "stub-auth-token"}
+        elif self.path.endswith("/ecommerce/orders"):
+            body = {"id": random.randint(10**6, 10**7)}
+        else:
+            body = {"token": f"stub-payment-key-{random.randint(10**6, 10**7)}"}
+
+        payload = json.dumps(body).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def install_stub_paymob(paymob_url):
+    """Point PaymobAPI at the stub server, standing in for the app if it is not installed"""
+
+    def generate_payment_link(self, sales_order):
+        token = paymob_post(paymob_url, "/api/auth/tokens", {"api_key": "stub"})["token"]
+        order_id = paymob_post(paymob_url, "/api/ecommerce/orders", {
+            "auth_token": token,
+            "merchant_order_id": sales_order.name,
+            "amount_cents": round((sales_order.grand_total or 0) * 100)
+        })["id"]
+        payment_key = paymob_post(paymob_url, "/api/acceptance/payment_keys", {
+            "auth_token": token,
+            "order_id": order_id
+        })["token"]
+
+        link = f"{paymob_url}/api/acceptance/iframes/0?payment_token={payment_key}"
+        frappe.db.set_value("Sales Order", sales_order.name, "paymob_payment_link", link)
+        sales_order.paymob_payment_link = link
+        return link
+
+    try:
+        from paymob_integration.paymob_integration.api import PaymobAPI
+    except ImportError:
+        PaymobAPI = type("PaymobAPI", (), {})
+        for name in ["paymob_integration", "paymob_integration.paymob_integration", "paymob_integration.paymob_integration.api"]:
+            sys.modules[name] = types.ModuleType(name)
+        sys.modules["paymob_integration.paymob_integration.api"].PaymobAPI = PaymobAPI
+
+    PaymobAPI.__init__ = lambda self, *args, **kwargs: None
+    PaymobAPI.generate_payment_link = generate_payment_link
+
+
+def paymob_post(paymob_url, path, data):
+    request = urllib.request.Request(
+        paymob_url + path, data=json.dumps(data).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    messages = 0
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Accepts and drops every message, just enough SMTP for smtplib"""
+
+    def handle(self):
+        self.reply("220 services-ordering-load-test ESMTP")
+        in_data = False
+        for line in self.rfile:
+            line = line.decode(errors="replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self.server.messages += 1
+                    self.reply("250 OK")
+                continue
+
+            command = line[:4].upper()
+            if command == "EHLO":
+                self.reply("250-services-ordering-load-test\r\n250 AUTH PLAIN")
+            elif command == "AUTH":
+                self.reply("235 Authentication successful")
+            elif command == "DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+    def reply(self, message):
+        self.wfile.write(f"{message}\r\n".encode())
+
+
+def use_stub_smtp(smtp_port):
+    """Send outgoing mail of this process to the stub through the site config mail account
+
+    Frappe only falls back to it without an outgoing Email Account, run_load_test
+    refuses to send mail while one is enabled.
+    """
+    frappe.local.conf.update({
+        "mail_server": "127.0.0.1",
+        "mail_port": smtp_port,
+        "use_tls": 0,
+        "use_ssl": 0,
+        "mail_login": "loadtest@example.com",
+        "mail_password": "loadtest",
+        "auto_email_id": "loadtest@example.com"
+    })
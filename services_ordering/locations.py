@@ -0,0 +1,55 @@
+import frappe
+
+LOCATION_TREE_CACHE_KEY = "services_ordering:location_tree"
+
+
+def get_location_tree():
+    """Get the cached City -> Neighborhood tree, building it once if missing"""
+    return frappe.cache().get_value(LOCATION_TREE_CACHE_KEY, generator=build_location_tree)
+
+
+def build_location_tree():
+    """Load all enabled cities and neighborhoods, grouped by city"""
+    cities = frappe.get_all(
+        "City",
+        fields=["city"],
+        filters={"disabled": 0} if frappe.db.has_column("City", "disabled") else {},
+        order_by="city asc"
+    )
+    neighborhoods = frappe.get_all(
+        "Neighborhood",
+        fields=["name", "city"],
+        filters={"disabled": 0} if frappe.db.has_column("Neighborhood", "disabled") else {},
+        order_by="name asc"
+    )
+
+    neighborhoods_by_city = {}
+    for neighborhood in neighborhoods:
+        neighborhoods_by_city.setdefault(neighborhood.city, []).append(neighborhood)
+
+    return {
+        "cities": cities,
+        "neighborhoods": neighborhoods,
+        "neighborhoods_by_city": neighborhoods_by_city
+    }
+
+
+def get_cities():
+    return get_location_tree()["cities"]
+
+
+def get_neighborhoods(city=None):
+    tree = get_location_tree()
+    if city:
+        return tree["neighborhoods_by_city"].get(city, [])
+    return tree["neighborhoods"]
+
+
+def rebuild_location_tree():
+    frappe.cache().set_value(LOCATION_TREE_CACHE_KEY, build_location_tree())
+
+
+def clear_location_tree(doc=None, method=None):
+    """doc_events hook for City and Neighborhood: rebuild the tree once the change is committed"""
+    frappe.cache().delete_value(LOCATION_TREE_CACHE_KEY)
+    frappe.db.after_commit.add(rebuild_location_tree)
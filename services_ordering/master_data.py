@@ -0,0 +1,103 @@
+import hashlib
+
+import frappe
+from frappe.utils import now
+
+MASTER_DATA_CACHE_KEY = "services_ordering:master_data"
+
+# doc_events clear the snapshot on every change, the expiry is only a safety net
+MASTER_DATA_CACHE_TTL = 6 * 60 * 60
+
+# Opt-in wire format, see encode_columnar
+COLUMNAR_ENCODING = "columnar"
+
+
+def get_master_data_snapshot(scope, build):
+    """Get the cached master data snapshot of a portal, building it on a cache miss
+
+    `build` returns a `(data, complete)` tuple. Incomplete builds (a section failed
+    to load) are served but not cached, so a transient error is not pinned.
+    """
+    cache_key = f"{MASTER_DATA_CACHE_KEY}:{scope}"
+    snapshot = frappe.cache().get_value(cache_key)
+    if snapshot:
+        return snapshot
+
+    # Catalog delta syncs (get_items_since) continue from the moment the snapshot was read
+    synced_at = now()
+    data, complete = build()
+    snapshot = {
+        "version": get_data_version(data),
+        "data": data,
+        "columnar": encode_columnar(data),
+        "synced_at": synced_at
+    }
+    if complete:
+        frappe.cache().set_value(cache_key, snapshot, expires_in_sec=MASTER_DATA_CACHE_TTL)
+    return snapshot
+
+
+def get_data_version(data):
+    """Content hash of a payload, used as its version/ETag"""
+    return hashlib.sha1(frappe.as_json(data, indent=None).encode()).hexdigest()
+
+
+def get_client_version(version=None):
+    """Version the client already holds, from the argument or the If-None-Match header"""
+    version = version or frappe.get_request_header("If-None-Match") or ""
+    return version.removeprefix("W/").strip('"')
+
+
+def get_master_data_response(snapshot, version=None, encoding=None):
+    """Build the get_master_data response, skipping the payload if the client is up to date
+
+    With `encoding="columnar"` the data is sent in the encode_columnar format. The
+    version is that of the decoded data, so it does not depend on the encoding.
+    """
+    response = {"success": True, "version": snapshot["version"], "synced_at": snapshot.get("synced_at")}
+    if get_client_version(version) == snapshot["version"]:
+        response["unchanged"] = True
+    elif encoding == COLUMNAR_ENCODING:
+        response["encoding"] = COLUMNAR_ENCODING
+        response["data"] = snapshot.get("columnar") or encode_columnar(snapshot["data"])
+    else:
+        response["data"] = snapshot["data"]
+    return response
+
+
+def encode_columnar(data):
+    """Encode each list-of-rows section as column arrays instead of repeating keys per row
+
+    A section becomes `{"fields": [...], "columns": [[...], ...], "dicts": {...}, "length": n}`.
+    Columns with mostly repeated values (group, territory, UOM...) hold indexes into
+    `dicts[field]` instead of the values. Other sections are passed through as they are.
+    """
+    encoded = {}
+    for section, rows in data.items():
+        if not rows or not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            encoded[section] = rows
+            continue
+
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+        columns = []
+        dictionaries = {}
+        for field in fields:
+            values = [row.get(field) for row in rows]
+            distinct = list(dict.fromkeys(values))
+            # Only worth it when values repeat, an index per row costs about as much as a short value
+            if len(distinct) * 2 <= len(values):
+                position = {value: index for index, value in enumerate(distinct)}
+                dictionaries[field] = distinct
+                values = [position[value] for value in values]
+            columns.append(values)
+
+        encoded[section] = {"fields": fields, "columns": columns, "dicts": dictionaries, "length": len(rows)}
+    return encoded
+
+
+def clear_master_data_cache(doc=None, method=None):
+    """doc_events hook: drop the master data snapshots of all portals"""
+    frappe.cache().delete_keys(MASTER_DATA_CACHE_KEY)
+
+    # A request running concurrently may rebuild from pre-commit data, clear again once committed
+    frappe.db.after_commit.add(lambda: frappe.cache().delete_keys(MASTER_DATA_CACHE_KEY))
@@ -0,0 +1,81 @@
+import threading
+
+import frappe
+from frappe.database import get_db
+from frappe.model.naming import get_default_naming_series, parse_naming_series
+from frappe.utils import cint
+
+# Overridable in site_config.json
+DEFAULT_NAME_BLOCK_SIZE = 20
+
+# Series numbers reserved by this process, (site, prefix) -> [next, last]
+NAME_BLOCKS = {}
+NAME_BLOCKS_LOCK = threading.Lock()
+
+
+def set_block_name(doc):
+    """Name a new naming series document from this process' block of series numbers
+
+    Inserting with the standard naming locks the Series row until the request
+    commits, so concurrent portal inserts queue behind each other. Numbers are
+    instead reserved in blocks of `services_ordering_name_block_size` in a short
+    transaction of their own. Names stay unique and in the same series as desk
+    created documents; numbers left in a block when the process exits are skipped.
+    """
+    if doc.meta.autoname != "naming_series:" or doc.flags.name_set:
+        return
+
+    if not doc.get("naming_series"):
+        doc.naming_series = get_default_naming_series(doc.doctype)
+    if not doc.naming_series:
+        # No series to allocate from, standard naming reports it
+        return
+
+    series = doc.naming_series
+    if "#" not in series:
+        series += ".#####"  # Same default width as standard naming
+
+    doc.name = parse_naming_series(series, doc=doc, number_generator=get_next_block_number)
+    doc.flags.name_set = True
+
+
+def get_next_block_number(prefix, digits):
+    key = (frappe.local.site, prefix)
+    with NAME_BLOCKS_LOCK:
+        block = NAME_BLOCKS.get(key)
+        if not block or block[0] > block[1]:
+            size = get_name_block_size()
+            last = reserve_series_block(prefix, size)
+            block = NAME_BLOCKS[key] = [last - size + 1, last]
+        current = block[0]
+        block[0] += 1
+    return ("%0" + str(digits) + "d") % current
+
+
+def get_name_block_size():
+    return max(cint(frappe.conf.get("services_ordering_name_block_size", DEFAULT_NAME_BLOCK_SIZE)), 1)
+
+
+def reserve_series_block(prefix, size):
+    """Advance the Series counter of `prefix` by `size` and commit at once, returns the last reserved number
+
+    Runs on its own connection, so the row lock is released right away instead
+    of being held until the calling request commits.
+    """
+    conf = frappe.local.conf
+    db = get_db(
+        socket=conf.db_socket,
+        host=conf.db_host,
+        port=conf.db_port,
+        user=conf.db_user or conf.db_name,
+        password=conf.db_password,
+        cur_db_name=conf.db_name
+    )
+    try:
+        db.sql("INSERT IGNORE INTO `tabSeries` (`name`, `current`) VALUES (%s, 0)", prefix)
+        db.sql("UPDATE `tabSeries` SET `current` = `current` + %s WHERE `name` = %s", (size, prefix))
+        last = cint(db.sql("SELECT `current` FROM `tabSeries` WHERE `name` = %s", prefix)[0][0])
+        db.commit()
+    finally:
+        db.close()
+    return last
@@ -0,0 +1,142 @@
+import frappe
+from frappe.utils import now
+
+ORDER_PIPELINE_CACHE_KEY = "services_ordering:order_pipeline"
+
+# Statuses are only needed while the portal follows the order
+ORDER_PIPELINE_STATUS_TTL = 24 * 60 * 60
+
+ORDER_PIPELINE_STAGES = ["submit", "payment_link", "email"]
+
+
+def start_order_pipeline(sales_order_name, send_email=False):
+    """Continue an inserted Sales Order in background jobs: submit, payment link, email
+
+    Each stage enqueues the next one once its own transaction has committed.
+    Progress is kept in the cache, see get_order_pipeline_status, and pushed to
+    the user on the "order_pipeline" realtime event.
+    """
+    stages = {stage: "Pending" for stage in ORDER_PIPELINE_STAGES}
+    if not send_email:
+        stages["email"] = "Skipped"
+
+    set_order_pipeline_status(sales_order_name, {
+        "sales_order": sales_order_name,
+        "state": "Queued",
+        "stage": "submit",
+        "stages": stages,
+        "message": None
+    })
+    enqueue_stage("submit_order", sales_order_name, send_email=send_email)
+
+
+def enqueue_stage(method, sales_order_name, **kwargs):
+    frappe.enqueue(
+        f"services_ordering.order_pipeline.{method}",
+        queue="short",
+        enqueue_after_commit=True,
+        sales_order_name=sales_order_name,
+        **kwargs
+    )
+
+
+def submit_order(sales_order_name, send_email=False):
+    def submit():
+        sales_order = frappe.get_doc("Sales Order", sales_order_name)
+        if sales_order.docstatus == 0:
+            sales_order.submit()
+
+    if run_stage(sales_order_name, "submit", submit):
+        enqueue_stage("generate_payment_link", sales_order_name, send_email=send_email)
+
+
+def generate_payment_link(sales_order_name, send_email=False):
+    from services_ordering.services_ordering.page.sales_order_portal.sales_order_portal import (
+        generate_paymob_payment_link_safe,
+    )
+
+    def generate():
+        sales_order = frappe.get_doc("Sales Order", sales_order_name)
+        if sales_order.get("paymob_payment_link"):
+            return
+
+        # Most failures come back as None instead of raising
+        payment_link = generate_paymob_payment_link_safe(sales_order, sales_order_name)
+        if not payment_link and not frappe.db.get_value("Sales Order", sales_order_name, "paymob_payment_link"):
+            raise Exception(f"No payment link was generated for {sales_order_name}")
+
+    # A missing payment link does not stop the order, the email goes out without it
+    run_stage(sales_order_name, "payment_link", generate, required=False)
+    if send_email:
+        enqueue_stage("send_order_email", sales_order_name)
+    else:
+        finish_order_pipeline(sales_order_name)
+
+
+def send_order_email(sales_order_name):
+    from services_ordering.services_ordering.page.sales_order_portal.sales_order_portal import (
+        send_sales_order_email,
+    )
+
+    def send():
+        # Renders the PDF and reuses the payment link generated by the previous stage
+        customer = frappe.db.get_value("Sales Order", sales_order_name, "customer")
+        result = send_sales_order_email(sales_order_name, customer_name=customer)
+        if not result.get("success"):
+            raise Exception(result.get("message"))
+
+    if run_stage(sales_order_name, "email", send):
+        finish_order_pipeline(sales_order_name)
+
+
+def run_stage(sales_order_name, stage, fn, required=True):
+    """Run one stage and record its outcome, returns False if the pipeline stops here"""
+    update_order_pipeline_status(sales_order_name, stage, "Running", state="Running")
+    try:
+        fn()
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(
+            f"Error in order pipeline stage {stage} of {sales_order_name}: {str(e)}",
+            "Sales Order Form - Order Pipeline"
+        )
+        update_order_pipeline_status(
+            sales_order_name, stage, "Failed", state="Failed" if required else None, message=str(e)
+        )
+        return not required
+
+    update_order_pipeline_status(sales_order_name, stage, "Done")
+    return True
+
+
+def finish_order_pipeline(sales_order_name):
+    status = get_order_pipeline_status(sales_order_name)
+    if status and status["state"] != "Failed":
+        status["state"] = "Completed"
+        set_order_pipeline_status(sales_order_name, status)
+
+
+def get_order_pipeline_status(sales_order_name):
+    """Pipeline status of a Sales Order, None if it was not created in pipeline mode"""
+    return frappe.cache().get_value(f"{ORDER_PIPELINE_CACHE_KEY}:{sales_order_name}")
+
+
+def update_order_pipeline_status(sales_order_name, stage, stage_status, state=None, message=None):
+    status = get_order_pipeline_status(sales_order_name)
+    if not status:
+        return
+    status["stage"] = stage
+    status["stages"][stage] = stage_status
+    if state:
+        status["state"] = state
+    if message:
+        status["message"] = message
+    set_order_pipeline_status(sales_order_name, status)
+
+
+def set_order_pipeline_status(sales_order_name, status):
+    status["updated_at"] = now()
+    frappe.cache().set_value(
+        f"{ORDER_PIPELINE_CACHE_KEY}:{sales_order_name}", status, expires_in_sec=ORDER_PIPELINE_STATUS_TTL
+    )
+    frappe.publish_realtime("order_pipeline", status, user=frappe.session.user)
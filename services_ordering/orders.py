@@ -0,0 +1,152 @@
+import frappe
+from frappe.utils import flt, nowdate
+
+from services_ordering.pricing import VAT_ACCOUNT, VAT_RATE, get_line_rate, get_order_price_list
+from services_ordering.tracing import trace
+
+
+def build_sales_order(sales_order_data, facts):
+    """Build an unsaved Sales Order from validated portal or web form data
+
+    `facts` come from validation.resolve_order_references for the same orders.
+    """
+    # Create new Sales Order document
+    sales_order = frappe.new_doc("Sales Order")
+
+    # Set basic fields with static values
+    sales_order.customer = sales_order_data.get("customer")
+    sales_order.company = "Sage Services Co Ltd"  # Static company
+    sales_order.currency = "SAR"  # Static currency
+    sales_order.transaction_date = sales_order_data.get("transaction_date", nowdate())
+    sales_order.delivery_date = sales_order_data.get("delivery_date")
+    pl_candidate = get_order_price_list(sales_order_data)
+    valid_price_list = None
+    if pl_candidate and pl_candidate in facts.price_lists:
+        valid_price_list = pl_candidate
+        sales_order.selling_price_list = pl_candidate
+
+    # Optional fields
+    if sales_order_data.get("customer_group"):
+        sales_order.customer_group = sales_order_data.get("customer_group")
+    if sales_order_data.get("territory"):
+        sales_order.territory = sales_order_data.get("territory")
+    if sales_order_data.get("order_type"):
+        sales_order.order_type = sales_order_data.get("order_type", "Sales")
+
+    # Handle new fields (time and team)
+    if sales_order_data.get("custom_time"):
+        sales_order.custom_time = sales_order_data.get("custom_time")
+        trace("Sales Order Form - Custom Time", custom_time=sales_order_data.get("custom_time"))
+
+    if sales_order_data.get("team"):
+        sales_order.custom_team = sales_order_data.get("team")
+        trace("Sales Order Form - Custom Team", custom_team=sales_order_data.get("team"))
+
+    # Handle payment mode
+    if sales_order_data.get("custom_payment_mode"):
+        sales_order.custom_payment_mode = sales_order_data.get("custom_payment_mode")
+        trace("Sales Order Form - Custom Payment Mode", custom_payment_mode=sales_order_data.get("custom_payment_mode"))
+
+    if sales_order_data.get("source"):
+        sales_order.source = sales_order_data.get("source")
+    if sales_order_data.get("project"):
+        sales_order.project = sales_order_data.get("project")
+    if sales_order_data.get("cost_center"):
+        sales_order.cost_center = sales_order_data.get("cost_center")
+
+    # Address and contact details
+    if sales_order_data.get("customer_address"):
+        sales_order.customer_address = sales_order_data.get("customer_address")
+    if sales_order_data.get("shipping_address_name"):
+        sales_order.shipping_address_name = sales_order_data.get("shipping_address_name")
+    if sales_order_data.get("contact_person"):
+        sales_order.contact_person = sales_order_data.get("contact_person")
+
+    # Terms and conditions
+    if sales_order_data.get("tc_name"):
+        sales_order.tc_name = sales_order_data.get("tc_name")
+        # Fetch terms content from Terms and Conditions template
+        if facts.terms.get(sales_order_data.get("tc_name")):
+            sales_order.terms = facts.terms.get(sales_order_data.get("tc_name"))
+    if sales_order_data.get("terms"):
+        sales_order.terms = sales_order_data.get("terms")
+
+    # Payment terms
+    if sales_order_data.get("payment_terms_template"):
+        sales_order.payment_terms_template = sales_order_data.get("payment_terms_template")
+
+    # Taxes and charges - skip setting template and directly add tax row
+    # if sales_order_data.get("taxes_and_charges"):
+    #     sales_order.taxes_and_charges = sales_order_data.get("taxes_and_charges")
+    # else:
+    #     # Set the template exactly as shown in the system
+    #     sales_order.taxes_and_charges = "VAT 15%"
+
+    # Always add the tax row directly
+    tax_row = sales_order.append("taxes", {})
+    tax_row.charge_type = "On Net Total"
+    tax_row.account_head = VAT_ACCOUNT
+    tax_row.description = "VAT 15%"
+    tax_row.rate = VAT_RATE
+
+    # Shipping
+    if sales_order_data.get("shipping_rule"):
+        sales_order.shipping_rule = sales_order_data.get("shipping_rule")
+
+    # Add items
+    for item_data in sales_order_data.get("items", []):
+        if not item_data.get("item_code") or not item_data.get("qty"):
+            continue
+
+        item_row = sales_order.append("items", {})
+        item_row.item_code = item_data.get("item_code")
+        item_row.qty = flt(item_data.get("qty", 1))
+        # Use client-provided rate if positive; else compute from price list or standard_rate
+        computed_rate = get_line_rate(item_data, valid_price_list, facts.prices, facts.standard_rates)
+        item_row.price_list_rate = flt(computed_rate)
+        item_row.rate = flt(computed_rate)
+        item_row.amount = flt(item_row.qty) * flt(item_row.rate)
+
+        # Optional item fields
+        if item_data.get("item_name"):
+            item_row.item_name = item_data.get("item_name")
+        if item_data.get("description"):
+            item_row.description = item_data.get("description")
+        if item_data.get("uom"):
+            item_row.uom = item_data.get("uom")
+        if item_data.get("warehouse"):
+            item_row.warehouse = item_data.get("warehouse")
+        if item_data.get("delivery_date"):
+            item_row.delivery_date = item_data.get("delivery_date")
+        if item_data.get("item_tax_template"):
+            item_row.item_tax_template = item_data.get("item_tax_template")
+
+        # Intentionally ignore client-sent discounts for public endpoint
+
+    # Do not apply document-level discounts from client on public endpoint
+
+    return sales_order
+
+
+def make_sales_order_result(sales_order, sales_order_data):
+    """Endpoint response for a created Sales Order, shared by the portals and the web form"""
+    # Calculate totals with VAT
+    total_amount = flt(sales_order.net_total or sales_order.total or 0)
+    vat_amount = total_amount * VAT_RATE / 100
+    grand_total_with_vat = total_amount + vat_amount
+
+    return {
+        "success": True,
+        "message": f"Sales Order {sales_order.name} created successfully!",
+        "sales_order_name": sales_order.name,
+        "data": {
+            "name": sales_order.name,
+            "customer": sales_order.customer,
+            "total_amount": total_amount,
+            "vat_amount": vat_amount,
+            "grand_total": grand_total_with_vat,
+            "status": sales_order.status,
+            "custom_time": sales_order_data.get("custom_time"),
+            "custom_team": sales_order_data.get("team")
+        }
+    }
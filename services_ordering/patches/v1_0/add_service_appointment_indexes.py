@@ -0,0 +1,8 @@
+from services_ordering.services_ordering.doctype.service_appointment.service_appointment import (
+    on_doctype_update,
+)
+
+
+def execute():
+    """Index Service Appointment by team and day and by sales order on sites installed before the indexes"""
+    on_doctype_update()
@@ -0,0 +1,45 @@
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+
+from services_ordering.customers import normalize_search_text
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def execute():
+    """Index customers for the portal typeahead search"""
+    # Fixtures are synced after patches run, make sure the field exists first
+    create_custom_fields({
+        "Customer": [{
+            "fieldname": "custom_search_name",
+            "fieldtype": "Data",
+            "label": "Search Name",
+            "insert_after": "customer_name",
+            "hidden": 1,
+            "read_only": 1,
+            "no_copy": 1,
+            "print_hide": 1,
+            "report_hide": 1,
+            "search_index": 1,
+            "description": "Normalized customer name used by the portal customer search"
+        }]
+    }, update=True)
+
+    frappe.db.add_index("Customer", ["mobile_no"])
+    frappe.db.add_index("Customer", ["email_id"])
+
+    customers = frappe.get_all("Customer", fields=["name", "customer_name", "custom_search_name"])
+    search_names = []
+    for customer in customers:
+        search_name = normalize_search_text(customer.customer_name)
+        if search_name != (customer.custom_search_name or ""):
+            search_names.append((customer.name, search_name))
+
+    # One UPDATE per chunk instead of one per customer
+    for start in range(0, len(search_names), BACKFILL_CHUNK_SIZE):
+        chunk = search_names[start:start + BACKFILL_CHUNK_SIZE]
+        frappe.db.sql(f"""
+            UPDATE `tabCustomer`
+            SET `custom_search_name` = CASE `name` {" ".join(["WHEN %s THEN %s"] * len(chunk))} END
+            WHERE `name` IN ({", ".join(["%s"] * len(chunk))})
+        """, [value for row in chunk for value in row] + [name for name, search_name in chunk])
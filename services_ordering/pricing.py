@@ -0,0 +1,191 @@
+import frappe
+from frappe.utils import flt
+
+DEFAULT_SELLING_PRICE_LIST = "البيع القياسية"
+
+# Every portal document carries this one tax row, On Net Total
+VAT_ACCOUNT = "KSA VAT15% - SSC"
+VAT_RATE = 15
+
+# Redis hash of "<price list>::<item code>" -> selling rate, shared by all requests
+ITEM_PRICE_CACHE_KEY = "services_ordering:item_prices"
+
+# Cached for items without a price in a price list, so misses are not queried again
+NO_ITEM_PRICE = ""
+
+
+def get_item_prices(item_codes, price_list=DEFAULT_SELLING_PRICE_LIST):
+    """Get selling rates for a set of items from one price list
+
+    Rates are memoized for the request and cached across requests per item and
+    price list, Item Price hooks invalidate them. Only the misses are queried,
+    together in one query.
+    """
+    item_codes = list({item_code for item_code in (item_codes or []) if item_code})
+    if not item_codes or not price_list:
+        return {}
+
+    memo = frappe.local.cache.setdefault(ITEM_PRICE_CACHE_KEY, {})
+    cache = frappe.cache()
+    missing = []
+    for item_code in item_codes:
+        key = get_item_price_key(item_code, price_list)
+        if key in memo:
+            continue
+        rate = cache.hget(ITEM_PRICE_CACHE_KEY, key)
+        if rate is None:
+            missing.append(item_code)
+        else:
+            memo[key] = None if rate == NO_ITEM_PRICE else rate
+
+    if missing:
+        rates = load_item_prices(missing, price_list)
+        for item_code in missing:
+            key = get_item_price_key(item_code, price_list)
+            memo[key] = rates.get(item_code)
+            cache.hset(ITEM_PRICE_CACHE_KEY, key, rates.get(item_code, NO_ITEM_PRICE))
+
+    rates = {}
+    for item_code in item_codes:
+        rate = memo[get_item_price_key(item_code, price_list)]
+        if rate is not None:
+            rates[item_code] = rate
+    return rates
+
+
+def load_item_prices(item_codes, price_list):
+    """Read selling rates for a set of items from one price list in a single query, uncached"""
+    prices = frappe.get_all(
+        "Item Price",
+        fields=["item_code", "price_list_rate"],
+        filters={
+            "item_code": ["in", list(item_codes)],
+            "price_list": price_list,
+            "selling": 1
+        },
+        order_by="modified desc"
+    )
+
+    # Keep the most recently modified price per item, same as the old per-item lookup
+    rates = {}
+    for price in prices:
+        rates.setdefault(price.item_code, price.price_list_rate)
+    return rates
+
+
+def get_item_price_key(item_code, price_list):
+    return f"{price_list}::{item_code}"
+
+
+def get_order_price_list(order):
+    return order.get("selling_price_list") or order.get("price_list")
+
+
+def get_order_prices(orders, price_lists, item_codes):
+    """Price list rates for the order lines without a client rate, by price list and item
+
+    `price_lists` and `item_codes` are the valid ones, lines referencing others are
+    priced from the standard rate or rejected by validation.
+    """
+    unpriced = {}
+    for order in orders:
+        price_list = get_order_price_list(order)
+        if price_list not in price_lists:
+            continue
+        for item in order.get("items") or []:
+            if item.get("item_code") in item_codes and flt(item.get("rate", 0)) <= 0:
+                unpriced.setdefault(price_list, set()).add(item.get("item_code"))
+
+    return {price_list: get_item_prices(codes, price_list) for price_list, codes in unpriced.items()}
+
+
+def get_line_rate(item, price_list, prices, standard_rates):
+    """Client rate if positive, else the price list rate, else the item's standard rate
+
+    `prices` comes from get_order_prices and `standard_rates` maps item codes to
+    Item.standard_rate, so pricing a line never queries.
+    """
+    client_rate = flt(item.get("rate", 0))
+    if client_rate > 0:
+        return client_rate
+
+    rate = 0
+    if price_list:
+        rate = prices.get(price_list, {}).get(item.get("item_code"))
+    return flt(rate or standard_rates.get(item.get("item_code")) or 0)
+
+
+def get_order_totals(order, facts):
+    """Line amounts, service time, VAT and grand total of an order without creating it
+
+    Priced like the created document, from `facts` of resolve_order_references.
+    Lines without an item code or quantity are skipped as on creation, lines with
+    an unknown item are listed in `unknown_items` and left out of the totals.
+    """
+    price_list = get_order_price_list(order)
+    if price_list not in facts.price_lists:
+        price_list = None
+
+    lines, unknown_items = [], []
+    for item in order.get("items") or []:
+        if not item.get("item_code") or not item.get("qty"):
+            continue
+        if item.get("item_code") not in facts.standard_rates:
+            unknown_items.append(item.get("item_code"))
+            continue
+
+        rate = get_line_rate(item, price_list, facts.prices, facts.standard_rates)
+        service_time, gap_time = facts.service_times.get(item.get("item_code"), (0, 0))
+        lines.append({
+            "item_code": item.get("item_code"),
+            "qty": flt(item.get("qty")),
+            "rate": rate,
+            "amount": flt(flt(item.get("qty")) * rate, 2),
+            "service_time": service_time,
+            "gap_time": gap_time
+        })
+
+    total_amount = flt(sum(line["amount"] for line in lines), 2)
+    vat_amount = total_amount * VAT_RATE / 100
+    return {
+        "price_list": price_list,
+        "items": lines,
+        "unknown_items": unknown_items,
+        # Same sum as utils.calculate_total_service_time: per line, not per unit
+        "total_service_time": sum(line["service_time"] + line["gap_time"] for line in lines),
+        "total_amount": total_amount,
+        "vat_rate": VAT_RATE,
+        "vat_amount": vat_amount,
+        "grand_total": total_amount + vat_amount
+    }
+
+
+def apply_item_prices(items, price_list=DEFAULT_SELLING_PRICE_LIST):
+    """Set standard_rate on catalog rows to their price list rate where one exists"""
+    rates = get_item_prices([item.name for item in items], price_list)
+    for item in items:
+        if item.name in rates:
+            item["standard_rate"] = rates[item.name]
+    return items
+
+
+def clear_item_price_cache():
+    frappe.cache().delete_value(ITEM_PRICE_CACHE_KEY)
+    frappe.local.cache.pop(ITEM_PRICE_CACHE_KEY, None)
+
+
+def clear_cached_item_price(doc, method=None, *args):
+    """doc_events hook for Item Price: drop the cached rate of its item and price list, before and after the save"""
+    prices = [doc]
+    if doc.get_doc_before_save():
+        prices.append(doc.get_doc_before_save())
+    keys = {get_item_price_key(price.item_code, price.price_list) for price in prices}
+
+    def clear():
+        for key in keys:
+            frappe.cache().hdel(ITEM_PRICE_CACHE_KEY, key)
+            frappe.local.cache.get(ITEM_PRICE_CACHE_KEY, {}).pop(key, None)
+
+    clear()
+    # A request running concurrently may cache the pre-commit rate, clear again once committed
+    frappe.db.after_commit.add(clear)
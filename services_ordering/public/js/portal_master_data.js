@@ -0,0 +1,93 @@
+// Master data helpers shared by the sales order portal, the quotation portal and the
+// public sales order form: local snapshot cache, columnar decoding and catalog sync
+(function () {
+    // Snapshot kept in localStorage between page loads, revalidated by version
+    const createMasterDataCache = (storageKey) => ({
+        load: () => {
+            try {
+                return JSON.parse(localStorage.getItem(storageKey));
+            } catch (e) {
+                return null;
+            }
+        },
+        save: (version, data) => {
+            if (!version) return;
+            try {
+                localStorage.setItem(storageKey, JSON.stringify({ version, data }));
+            } catch (e) {
+                console.warn('Could not cache master data locally:', e);
+            }
+        }
+    });
+
+    // Expand the columnar master data encoding back into a list of rows per section
+    const decodeColumnarMasterData = (data) => {
+        const decoded = {};
+        Object.keys(data || {}).forEach((section) => {
+            const encoded = data[section];
+            if (!encoded || !Array.isArray(encoded.fields)) {
+                decoded[section] = encoded;
+                return;
+            }
+            const rows = new Array(encoded.length);
+            for (let i = 0; i < encoded.length; i++) {
+                const row = {};
+                encoded.fields.forEach((field, f) => {
+                    const dict = encoded.dicts[field];
+                    const value = encoded.columns[f][i];
+                    row[field] = dict ? dict[value] : value;
+                });
+                rows[i] = row;
+            }
+            decoded[section] = rows;
+        });
+        return decoded;
+    };
+
+    // Incremental catalog sync: merge items changed since the last sync into the local list
+    const createCatalogSync = ({ method, getItems, setItems }) => {
+        let syncToken = null;
+
+        const sync = async () => {
+            if (!syncToken) return;
+            try {
+                const response = await frappe.call({
+                    method: method,
+                    args: {
+                        modified_after: syncToken
+                    }
+                });
+                if (!(response.message && response.message.success)) return;
+
+                const delta = response.message.data;
+                if (delta.items.length || delta.removed.length) {
+                    const changed = new Set(delta.items.map(item => item.name));
+                    const removed = new Set(delta.removed);
+                    const merged = getItems()
+                        .filter(item => !changed.has(item.name) && !removed.has(item.name))
+                        .concat(delta.items);
+                    merged.sort((a, b) => (a.item_name || '').localeCompare(b.item_name || ''));
+                    setItems(merged);
+                    console.log('Catalog synced:', { changed: delta.items.length, removed: delta.removed.length });
+                }
+                syncToken = delta.sync_token;
+            } catch (error) {
+                console.error('Error syncing catalog:', error);
+            }
+        };
+
+        return {
+            sync,
+            setToken: (token) => {
+                syncToken = token || null;
+            }
+        };
+    };
+
+    window.services_ordering = window.services_ordering || {};
+    window.services_ordering.portal = {
+        createMasterDataCache,
+        decodeColumnarMasterData,
+        createCatalogSync
+    };
+})();
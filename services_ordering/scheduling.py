@@ -0,0 +1,386 @@
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe import _
+from frappe.utils import cint, get_datetime, getdate, now_datetime, to_timedelta
+
+from services_ordering.customers import get_customer_neighborhoods
+
+# Appointments saved without an end time or service time were always taken as one hour
+DEFAULT_APPOINTMENT_HOURS = 1
+
+# No job runs longer, so a day's index only has to look this far back for jobs carried over
+MAX_APPOINTMENT_HOURS = 24
+
+TEAM_DAY_INDEX_CACHE_KEY = "services_ordering:team_day_index"
+
+# Longest date range one availability call or slot search may cover
+MAX_AVAILABILITY_DAYS = 31
+
+# Grid of the free slot search, bit i of a team day is the slot starting i * SLOT_MINUTES after midnight
+SLOT_MINUTES = 15
+SLOT_SECONDS = SLOT_MINUTES * 60
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+DEFAULT_SLOT_LIMIT = 10
+
+APPOINTMENT_FIELDS = [
+    "name", "appointment_date_time", "appointment_end_time", "customer", "total_service_time", "sales_order"
+]
+
+
+class AppointmentIndex:
+    """Appointments of one team on one day sorted by start, for overlap queries in O(log n)
+
+    Each appointment is an interval [start, end). Next to the sorted starts the
+    index keeps the running maximum of the ends, so "does [start, end) intersect
+    anything" is one bisect on the starts and one lookup, even when legacy data
+    holds appointments that overlap each other.
+    """
+
+    def __init__(self, appointments):
+        self.appointments = sorted(appointments, key=lambda appointment: appointment.start)
+        self.starts = [appointment.start for appointment in self.appointments]
+
+        # max_ends[i]: the latest end among appointments[0..i] and where it is
+        self.max_ends = []
+        for i, appointment in enumerate(self.appointments):
+            if not self.max_ends or appointment.end > self.max_ends[-1][0]:
+                self.max_ends.append((appointment.end, i))
+            else:
+                self.max_ends.append(self.max_ends[-1])
+
+    def find_overlap(self, start, end, exclude=None):
+        """An appointment intersecting [start, end), None if the interval is free"""
+        # Only appointments starting before `end` can intersect
+        count = bisect_left(self.starts, end)
+        if not count or self.max_ends[count - 1][0] <= start:
+            return None
+
+        appointment = self.appointments[self.max_ends[count - 1][1]]
+        if appointment.name != exclude:
+            return appointment
+
+        # The latest ending one is the excluded appointment itself, look past it
+        for appointment in reversed(self.appointments[:count]):
+            if appointment.end > start and appointment.name != exclude:
+                return appointment
+        return None
+
+    def overlaps(self, start, end, exclude=None):
+        return self.find_overlap(start, end, exclude=exclude) is not None
+
+    def get_busy_intervals(self, window_start, window_end, exclude=None):
+        """Merged [start, end) intervals taken by appointments within the window"""
+        busy = []
+        for appointment in self.appointments[:bisect_left(self.starts, window_end)]:
+            if appointment.name == exclude or appointment.end <= window_start:
+                continue
+            start, end = max(appointment.start, window_start), min(appointment.end, window_end)
+            if busy and start <= busy[-1][1]:
+                busy[-1][1] = max(busy[-1][1], end)
+            else:
+                busy.append([start, end])
+        return [tuple(interval) for interval in busy]
+
+    def get_free_intervals(self, window_start, window_end, exclude=None):
+        """[start, end) intervals within the window no appointment touches"""
+        free, cursor = [], window_start
+        for start, end in self.get_busy_intervals(window_start, window_end, exclude=exclude):
+            if start > cursor:
+                free.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < window_end:
+            free.append((cursor, window_end))
+        return free
+
+
+def get_appointment_end(appointment):
+    """End of an appointment: its end time, else start plus service time in hours, else one hour"""
+    start = get_datetime(appointment.appointment_date_time)
+    if appointment.appointment_end_time and get_datetime(appointment.appointment_end_time) > start:
+        return get_datetime(appointment.appointment_end_time)
+    return start + timedelta(hours=cint(appointment.total_service_time) or DEFAULT_APPOINTMENT_HOURS)
+
+
+def get_day_bounds(day):
+    day_start = datetime.combine(getdate(day), time.min)
+    return day_start, day_start + timedelta(days=1)
+
+
+def get_team_day_index(service_team, day):
+    """AppointmentIndex of a team's non cancelled appointments intersecting `day`, memoized per request"""
+    return get_team_day_indexes([service_team], [day])[(service_team, getdate(day))]
+
+
+def get_team_day_indexes(service_teams, days):
+    """AppointmentIndex per (team, day) for every team and day given, memoized per request
+
+    Whatever is not memoized yet is loaded in one query over the teams and the
+    date range, then split into days. An appointment running past midnight is in
+    the index of each day it touches.
+    """
+    days = sorted({getdate(day) for day in days})
+    indexes = frappe.local.cache.setdefault(TEAM_DAY_INDEX_CACHE_KEY, {})
+    missing = [(team, day) for team in service_teams for day in days if (team, str(day)) not in indexes]
+
+    if missing:
+        missing_days = sorted({day for team, day in missing})
+        appointments = load_team_appointments(
+            sorted({team for team, day in missing}), missing_days[0], missing_days[-1]
+        )
+        grouped = {}
+        for appointment in appointments:
+            day = appointment.start.date()
+            while datetime.combine(day, time.min) < appointment.end:
+                grouped.setdefault((appointment.service_team, day), []).append(appointment)
+                day += timedelta(days=1)
+        for team, day in missing:
+            indexes[(team, str(day))] = AppointmentIndex(grouped.get((team, day), []))
+
+    return {(team, day): indexes[(team, str(day))] for team in service_teams for day in days}
+
+
+def load_team_day_appointments(service_teams, day):
+    """Non cancelled appointments of one or more teams intersecting `day`, with `start` and `end` set"""
+    return load_team_appointments(service_teams, day, day)
+
+
+def load_team_appointments(service_teams, from_date, to_date):
+    """Non cancelled appointments of one or more teams intersecting the days from `from_date` to `to_date`"""
+    from_start = get_day_bounds(from_date)[0]
+    if isinstance(service_teams, str):
+        service_teams = [service_teams]
+
+    appointments = frappe.get_all(
+        "Service Appointment",
+        fields=["service_team", *APPOINTMENT_FIELDS],
+        filters=get_team_day_filters(service_teams, from_date, to_date),
+        order_by="appointment_date_time asc"
+    )
+
+    range_appointments = []
+    for appointment in appointments:
+        appointment.start = get_datetime(appointment.appointment_date_time)
+        appointment.end = get_appointment_end(appointment)
+        # Jobs of the previous day only count if they run into the range
+        if appointment.end > from_start:
+            range_appointments.append(appointment)
+    return range_appointments
+
+
+def get_team_day_filters(service_teams, day, to_day=None):
+    """Filters of the team-day lookup, served by the (service_team, appointment_date_time, docstatus) index"""
+    day_start = get_day_bounds(day)[0]
+    day_end = get_day_bounds(to_day or day)[1]
+    return {
+        "service_team": ["in", service_teams],
+        "appointment_date_time": [
+            "between", [day_start - timedelta(hours=MAX_APPOINTMENT_HOURS), day_end - timedelta(seconds=1)]
+        ],
+        "docstatus": ["!=", 2]  # Not cancelled
+    }
+
+
+def get_team_details(service_teams):
+    """Display name, member count and shifts of Cleaning Teams by name, in three queries"""
+    teams = {
+        team.name: frappe._dict(
+            team_id=team.name, team_name=team.name1 or team.name, team_members_count=0, shifts=[]
+        )
+        for team in frappe.get_all(
+            "Cleaning Team", fields=["name", "name1"], filters={"name": ["in", service_teams]}
+        )
+    }
+    if not teams:
+        return teams
+
+    for shift in frappe.get_all(
+        "Team Shift",
+        fields=["parent", "start_time", "end_time"],
+        filters={"parenttype": "Cleaning Team", "parent": ["in", list(teams)]},
+        order_by="idx asc"
+    ):
+        teams[shift.parent].shifts.append({"start_time": shift.start_time, "end_time": shift.end_time})
+
+    for member in frappe.get_all(
+        "Cleaning Team Member",
+        fields=["parent", "count(name) as count"],
+        filters={"parenttype": "Cleaning Team", "parent": ["in", list(teams)]},
+        group_by="parent"
+    ):
+        teams[member.parent].team_members_count = member.count
+
+    return teams
+
+
+def build_teams_availability(service_teams, from_date, to_date=None):
+    """Shifts, member counts and per-day appointments of several teams over a date range
+
+    Four queries whatever the number of teams and days. Teams that do not exist
+    are listed in `unknown_teams`.
+    """
+    days = get_date_range(from_date, to_date)
+    service_teams = list(dict.fromkeys(team for team in service_teams if team))
+    details = get_team_details(service_teams)
+    found = [team for team in service_teams if team in details]
+    indexes = get_team_day_indexes(found, days) if found else {}
+
+    teams = []
+    for team in found:
+        team_availability = details[team]
+        team_availability.days = []
+        for day in days:
+            index = indexes[(team, day)]
+            team_availability.days.append({
+                "date": str(day),
+                "appointments": index.appointments,
+                # Merged [start, end) times the team is booked, from real end times
+                "busy": index.get_busy_intervals(*get_day_bounds(day))
+            })
+        teams.append(team_availability)
+
+    return {
+        "from_date": str(days[0]),
+        "to_date": str(days[-1]),
+        "teams": teams,
+        "unknown_teams": [team for team in service_teams if team not in details]
+    }
+
+
+def get_date_range(from_date, to_date=None):
+    """Days from `from_date` to `to_date` inclusive, at most MAX_AVAILABILITY_DAYS of them"""
+    from_date = getdate(from_date)
+    to_date = getdate(to_date or from_date)
+    if to_date < from_date:
+        frappe.throw(_("To Date cannot be before From Date"))
+    if (to_date - from_date).days >= MAX_AVAILABILITY_DAYS:
+        frappe.throw(_("Availability can be fetched for at most {0} days at a time").format(MAX_AVAILABILITY_DAYS))
+    return [from_date + timedelta(days=offset) for offset in range((to_date - from_date).days + 1)]
+
+
+def get_available_slots(
+    duration_minutes, from_date, to_date=None, service_teams=None, neighborhood=None, limit=DEFAULT_SLOT_LIMIT
+):
+    """Earliest (team, start) pairs where a job of `duration_minutes` fits a shift without touching a booking
+
+    Each team day is an integer bitmask of 15 minute slots: the slots its shifts
+    cover minus the slots any appointment touches. Starts of enough consecutive
+    free slots are found with a handful of shifts and ands on that mask, so a
+    month of all teams costs little beyond the queries of build_teams_availability.
+    Teams without shifts have no slots. With a `neighborhood`, teams already
+    booked there that day come first among slots starting at the same time.
+    """
+    duration_slots = -(-cint(duration_minutes) // SLOT_MINUTES)
+    if duration_slots <= 0:
+        frappe.throw(_("Duration must be greater than zero"))
+    if duration_slots > SLOTS_PER_DAY:
+        frappe.throw(_("A job cannot be longer than a day"))
+
+    now = now_datetime()
+    days = [day for day in get_date_range(from_date, to_date) if day >= now.date()]
+    if not service_teams:
+        service_teams = frappe.get_all("Cleaning Team", pluck="name", order_by="name asc")
+    details = get_team_details(list(dict.fromkeys(service_teams)))
+    shift_masks = {team: get_shift_mask(team_details.shifts) for team, team_details in details.items()}
+    teams = [team for team in details if shift_masks[team]]
+    if not days or not teams:
+        return []
+
+    indexes = get_team_day_indexes(teams, days)
+    neighborhood_team_days = get_neighborhood_team_days(indexes, neighborhood) if neighborhood else set()
+
+    slots = []
+    for day in days:
+        day_start, day_end = get_day_bounds(day)
+        past = get_past_mask(day_start, now)
+
+        day_slots = []
+        for team in teams:
+            free = shift_masks[team] & ~get_busy_mask(indexes[(team, day)], day_start, day_end) & ~past
+            starts = get_run_starts(free, duration_slots)
+            while starts:
+                lowest = starts & -starts
+                starts ^= lowest
+                start = day_start + timedelta(minutes=(lowest.bit_length() - 1) * SLOT_MINUTES)
+                day_slots.append({
+                    "team": team,
+                    "team_name": details[team].team_name,
+                    "start": start,
+                    "end": start + timedelta(minutes=cint(duration_minutes)),
+                    "in_neighborhood": (team, day) in neighborhood_team_days
+                })
+
+        day_slots.sort(key=lambda slot: (slot["start"], not slot["in_neighborhood"], slot["team"]))
+        slots.extend(day_slots[:limit - len(slots)])
+        if len(slots) >= limit:
+            break
+    return slots
+
+
+def get_shift_mask(shifts):
+    """Slots fully inside a team's shifts, a shift ending at or before its start runs to midnight"""
+    mask = 0
+    for shift in shifts:
+        if shift["start_time"] is None or shift["end_time"] is None:
+            continue
+        start = int(to_timedelta(shift["start_time"]).total_seconds())
+        end = int(to_timedelta(shift["end_time"]).total_seconds())
+        first = -(-start // SLOT_SECONDS)
+        last = end // SLOT_SECONDS if end > start else SLOTS_PER_DAY
+        if last > first:
+            mask |= ((1 << (last - first)) - 1) << first
+    return mask
+
+
+def get_busy_mask(index, day_start, day_end):
+    """Slots of the day an appointment touches, even partly"""
+    mask = 0
+    for start, end in index.get_busy_intervals(day_start, day_end):
+        first = int((start - day_start).total_seconds()) // SLOT_SECONDS
+        last = -(-int((end - day_start).total_seconds()) // SLOT_SECONDS)
+        mask |= ((1 << (last - first)) - 1) << first
+    return mask
+
+
+def get_past_mask(day_start, now):
+    """Slots of the day that already started"""
+    return (1 << max(-(-int((now - day_start).total_seconds()) // SLOT_SECONDS), 0)) - 1
+
+
+def get_run_starts(free, length):
+    """Bits of `free` that start at least `length` consecutive set bits"""
+    # Doubling: a bit set in `runs` starts `run_length` free slots, anding with a shifted copy extends that
+    runs, run_length = free, 1
+    while run_length < length and runs:
+        step = min(run_length, length - run_length)
+        runs &= runs >> step
+        run_length += step
+    return runs
+
+
+def get_neighborhood_team_days(indexes, neighborhood):
+    """(team, day) pairs with an appointment of a customer living in `neighborhood`"""
+    customers = {appointment.customer for index in indexes.values() for appointment in index.appointments}
+    neighborhoods = get_customer_neighborhoods([customer for customer in customers if customer])
+    return {
+        key for key, index in indexes.items()
+        if any(neighborhoods.get(appointment.customer) == neighborhood for appointment in index.appointments)
+    }
+
+
+def find_team_overlap(service_team, start, end, exclude=None):
+    """An appointment of the team intersecting [start, end), checked on every day the interval touches"""
+    day = start.date()
+    while datetime.combine(day, time.min) < end:
+        appointment = get_team_day_index(service_team, day).find_overlap(start, end, exclude=exclude)
+        if appointment:
+            return appointment
+        day += timedelta(days=1)
+    return None
+
+
+def clear_team_day_indexes():
+    """Drop the memoized indexes, so the rest of the request sees a changed appointment"""
+    frappe.local.cache.pop(TEAM_DAY_INDEX_CACHE_KEY, None)
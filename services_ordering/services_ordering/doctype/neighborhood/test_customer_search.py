@@ -0,0 +1,26 @@
+# Copyright (c) 2026, Haris and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from services_ordering.customers import normalize_search_text
+
+
+class TestCustomerSearch(FrappeTestCase):
+	def test_arabic_letter_folding(self):
+		# Hamza forms of alef, alef maqsura and ta marbuta are searched as their plain letters
+		self.assertEqual(normalize_search_text("أحمد"), normalize_search_text("احمد"))
+		self.assertEqual(normalize_search_text("إيمان"), "ايمان")
+		self.assertEqual(normalize_search_text("آمنة"), "امنه")
+		self.assertEqual(normalize_search_text("مصطفى"), "مصطفي")
+		self.assertEqual(normalize_search_text("فاطمة"), "فاطمه")
+
+	def test_diacritics_tatweel_and_digits(self):
+		self.assertEqual(normalize_search_text("مُحَمَّد"), "محمد")
+		self.assertEqual(normalize_search_text("محــمد"), "محمد")
+		self.assertEqual(normalize_search_text("٠٥٥١٢٣"), "055123")
+		self.assertEqual(normalize_search_text("۰۵۵۱۲۳"), "055123")
+
+	def test_case_and_spacing(self):
+		self.assertEqual(normalize_search_text("  Sara   AL Qahtani "), "sara al qahtani")
+		self.assertEqual(normalize_search_text(None), "")
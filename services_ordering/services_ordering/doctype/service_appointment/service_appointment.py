@@ -6,11 +6,27 @@ from frappe.model.document import Document
 from frappe import _
 from datetime import datetime, timedelta
 
+from services_ordering.scheduling import clear_team_day_indexes, find_team_overlap, get_appointment_end
+from services_ordering.tracing import trace
+
+# Team-day lookups: overlap checks, availability and calendars
+TEAM_DAY_INDEX = "service_team_appointment_date_time_docstatus_index"
+SALES_ORDER_INDEX = "sales_order_index"
+
 
 class ServiceAppointment(Document):
 	def validate(self):
 		self.validate_appointment_overlap()
 
+	def on_update(self):
+		clear_team_day_indexes()
+
+	def on_cancel(self):
+		clear_team_day_indexes()
+
+	def on_trash(self):
+		clear_team_day_indexes()
+
 	def on_submit(self):
 		if self.sales_order:
 			self.update_sales_order_status()
@@ -22,6 +38,9 @@ class ServiceAppointment(Document):
 			sales_order = frappe.get_doc("Sales Order", self.sales_order)
 			sales_order.custom_appointment_ref = self.name
 			sales_order.save()
+			# The submitted appointment decides the team, the field is not editable after submit
+			if self.service_team and sales_order.custom_team != self.service_team:
+				sales_order.db_set("custom_team", self.service_team)
 	
 	def send_confirmation_email(self):
 		"""Send a confirmation email to the customer about their appointment booking"""
@@ -70,6 +89,7 @@ class ServiceAppointment(Document):
 				header=[_("Appointment Confirmation"), "green"]
 			)
 			frappe.msgprint(_("Appointment confirmation email sent successfully to {0}").format(self.email))
+			trace("Service Appointment - Confirmation Email", appointment=self.name, email=self.email)
 		except Exception as e:
 			frappe.log_error(f"Failed to send appointment confirmation email: {str(e)}")
 			frappe.msgprint(_("Failed to send confirmation email. Please check the email address and try again."))
@@ -80,33 +100,25 @@ class ServiceAppointment(Document):
 		if not self.service_team or not self.appointment_date_time:
 			return
 		
-		# Get appointment date and time
-		appointment_datetime = frappe.utils.get_datetime(self.appointment_date_time)
+		# Real start and end of the job, see scheduling.get_appointment_end
+		start_time = frappe.utils.get_datetime(self.appointment_date_time)
+		end_time = get_appointment_end(self)
 		
-		# Create a timespan for the appointment (assume 1 hour duration)
-		start_time = appointment_datetime
-		end_time = appointment_datetime + timedelta(hours=1)
+		overlapping = find_team_overlap(self.service_team, start_time, end_time, exclude=self.name)
 		
-		# Check for overlapping appointments
-		existing_appointments = frappe.get_all(
-			"Service Appointment",
-			filters={
-				"service_team": self.service_team,
-				"appointment_date_time": ["between", [
-					start_time.strftime("%Y-%m-%d %H:%M:%S"),
-					end_time.strftime("%Y-%m-%d %H:%M:%S")
-				]],
-				"docstatus": ["!=", 2],  # Not cancelled
-				"name": ["!=", self.name]  # Exclude current appointment
-			},
-			fields=["name", "appointment_date_time"]
+		trace(
+			"Service Appointment - Overlap Check",
+			appointment=self.name,
+			service_team=self.service_team,
+			overlapping=overlapping.name if overlapping else None
 		)
-		
-		if existing_appointments:
+
+		if overlapping:
 			frappe.throw(
-				_("Cannot book this appointment. Team {0} already has an appointment at {1}").format(
+				_("Cannot book this appointment. Team {0} already has an appointment from {1} to {2}").format(
 					frappe.bold(self.service_team),
-					frappe.bold(frappe.utils.format_datetime(self.appointment_date_time))
+					frappe.bold(frappe.utils.format_datetime(overlapping.start)),
+					frappe.bold(frappe.utils.format_datetime(overlapping.end))
 				),
 				title=_("Double Booking Not Allowed")
 			)
@@ -118,17 +130,12 @@ def get_paid_sales_orders(doctype, txt, searchfield, start, page_len, filters):
 	Query function to return only sales orders that have payment entries against them.
 	This is used to filter the sales_order Link field in Service Appointment.
 	"""
-	return frappe.db.sql("""
-		SELECT DISTINCT so.name, so.customer_name, so.transaction_date, so.grand_total
+	return frappe.db.sql(f"""
+		SELECT so.name, so.customer_name, so.transaction_date, so.grand_total
 		FROM `tabSales Order` so
-		INNER JOIN `tabPayment Entry Reference` per 
-			ON per.reference_name = so.name 
-			AND per.reference_doctype = 'Sales Order'
-		INNER JOIN `tabPayment Entry` pe 
-			ON pe.name = per.parent 
-			AND pe.docstatus = 1
 		WHERE 
 			so.docstatus = 1
+			AND {get_paid_sales_order_condition("so")}
 			AND (
 				so.name LIKE %(txt)s 
 				OR so.customer_name LIKE %(txt)s
@@ -140,3 +147,25 @@ def get_paid_sales_orders(doctype, txt, searchfield, start, page_len, filters):
 		'start': start,
 		'page_len': page_len
 	})
+
+
+def get_paid_sales_order_condition(alias):
+	"""SQL condition on the Sales Order aliased `alias`: a submitted Payment Entry references it
+
+	The one rule for which orders may get an appointment, shared by the Link
+	field query and automatic dispatch.
+	"""
+	return f"""EXISTS (
+		SELECT 1
+		FROM `tabPayment Entry Reference` per
+		INNER JOIN `tabPayment Entry` pe
+			ON pe.name = per.parent
+			AND pe.docstatus = 1
+		WHERE per.reference_doctype = 'Sales Order' AND per.reference_name = {alias}.name
+	)"""
+
+
+def on_doctype_update():
+	"""Composite indexes the JSON cannot declare, also added to existing sites by a v1_0 patch"""
+	frappe.db.add_index("Service Appointment", ["service_team", "appointment_date_time", "docstatus"], TEAM_DAY_INDEX)
+	frappe.db.add_index("Service Appointment", ["sales_order"], SALES_ORDER_INDEX)
@@ -0,0 +1,77 @@
+# Copyright (c) 2026, Haris and Contributors
+# See license.txt
+
+from datetime import datetime
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from services_ordering.dispatch import get_candidate_starts
+from services_ordering.scheduling import AppointmentIndex, get_run_starts
+
+
+def at(hour):
+	return datetime(2030, 1, 1, *divmod(int(hour * 60), 60))
+
+
+def make_appointment(name, start_hour, end_hour):
+	return frappe._dict(name=name, start=at(start_hour), end=at(end_hour))
+
+
+def get_mask(*slots):
+	return sum(1 << slot for slot in slots)
+
+
+class TestAppointmentIndex(FrappeTestCase):
+	def setUp(self):
+		# A long legacy booking covering a shorter one, then a later one
+		self.index = AppointmentIndex([
+			make_appointment("long", 8, 12),
+			make_appointment("short", 9, 10),
+			make_appointment("late", 14, 15)
+		])
+
+	def test_find_overlap(self):
+		self.assertEqual(self.index.find_overlap(at(11), at(11.5)).name, "long")
+		self.assertEqual(self.index.find_overlap(at(14.5), at(16)).name, "late")
+		self.assertIsNone(self.index.find_overlap(at(12), at(14)))
+		self.assertIsNone(self.index.find_overlap(at(6), at(8)))
+		self.assertIsNone(self.index.find_overlap(at(15), at(17)))
+
+	def test_find_overlap_with_excluded_appointment(self):
+		# The latest ending appointment is excluded, the one it covers still counts
+		self.assertEqual(self.index.find_overlap(at(9.5), at(9.75), exclude="long").name, "short")
+		self.assertIsNone(self.index.find_overlap(at(10), at(12), exclude="long"))
+		self.assertIsNone(self.index.find_overlap(at(14), at(15), exclude="late"))
+		self.assertTrue(self.index.overlaps(at(11), at(13), exclude="short"))
+
+	def test_free_intervals(self):
+		self.assertEqual(
+			self.index.get_free_intervals(at(7), at(16), exclude="long"),
+			[(at(7), at(9)), (at(10), at(14)), (at(15), at(16))]
+		)
+
+
+class TestRunStarts(FrappeTestCase):
+	def test_run_starts(self):
+		free = get_mask(1, 2, 4, 5, 6)
+		self.assertEqual(get_run_starts(free, 1), free)
+		self.assertEqual(get_run_starts(free, 2), get_mask(1, 4, 5))
+		self.assertEqual(get_run_starts(free, 3), get_mask(4))
+		self.assertEqual(get_run_starts(free, 4), 0)
+
+	def test_run_starts_at_boundaries(self):
+		# Runs touching slot 0 and the top slot of a long day
+		free = get_mask(0, 1, 2) | get_mask(*range(90, 96))
+		self.assertEqual(get_run_starts(free, 3), get_mask(0, 90, 91, 92, 93))
+		self.assertEqual(get_run_starts(free, 6), get_mask(90))
+		self.assertEqual(get_run_starts(0, 2), 0)
+
+	def test_candidate_starts(self):
+		starts = get_mask(2, 3, 4, 5, 9)
+		self.assertEqual(get_candidate_starts(starts), [2, 5, 9])
+		self.assertEqual(get_candidate_starts(starts, requested_slot=4), [2, 5, 4, 9])
+		# A requested slot at a run edge or outside any run adds nothing
+		self.assertEqual(get_candidate_starts(starts, requested_slot=5), [2, 5, 9])
+		self.assertEqual(get_candidate_starts(starts, requested_slot=7), [2, 5, 9])
+		self.assertEqual(get_candidate_starts(0), [])
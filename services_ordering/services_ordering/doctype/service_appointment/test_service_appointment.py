@@ -1,9 +1,65 @@
 # Copyright (c) 2025, Haris and Contributors
 # See license.txt
 
-# import frappe
+from datetime import datetime, timedelta
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from services_ordering.scheduling import APPOINTMENT_FIELDS, get_team_day_filters
+from services_ordering.services_ordering.doctype.service_appointment.service_appointment import (
+	SALES_ORDER_INDEX,
+	TEAM_DAY_INDEX,
+)
+
+# Enough rows across teams and days that a full scan is never the cheaper plan
+TEST_TEAMS = 20
+TEST_DAYS = 60
+TEST_APPOINTMENTS_PER_DAY = 4
+
 
 class TestServiceAppointment(FrappeTestCase):
-	pass
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		# Rolled back with the rest of the test class
+		now = frappe.utils.now_datetime()
+		first_day = datetime(2030, 1, 1, 8)
+		values = []
+		for team in range(TEST_TEAMS):
+			for day in range(TEST_DAYS):
+				for slot in range(TEST_APPOINTMENTS_PER_DAY):
+					start = first_day + timedelta(days=day, hours=2 * slot)
+					values.append((
+						f"_T-SA-{team}-{day}-{slot}", now, now, "Administrator", "Administrator",
+						f"_Test Team {team}", start, start + timedelta(hours=1), 1,
+						f"_T-SO-{team}-{day}-{slot}"
+					))
+		frappe.db.bulk_insert(
+			"Service Appointment",
+			[
+				"name", "creation", "modified", "owner", "modified_by",
+				"service_team", "appointment_date_time", "appointment_end_time", "total_service_time", "sales_order"
+			],
+			values
+		)
+
+	def explain(self, filters, fields=None, order_by=None):
+		query = frappe.get_all("Service Appointment", fields=fields or ["name"], filters=filters, order_by=order_by, run=0)
+		return frappe.db.sql(f"EXPLAIN {query}", as_dict=True)
+
+	def test_team_day_query_uses_team_day_index(self):
+		# The query behind the overlap check in validate and get_team_availability
+		for teams in (["_Test Team 3"], ["_Test Team 3", "_Test Team 7", "_Test Team 11"]):
+			plan = self.explain(
+				get_team_day_filters(teams, "2030-01-15"),
+				fields=["service_team", *APPOINTMENT_FIELDS],
+				order_by="appointment_date_time asc"
+			)
+			self.assertEqual(len(plan), 1)
+			self.assertEqual(plan[0].key, TEAM_DAY_INDEX)
+			self.assertEqual(plan[0].type, "range")
+
+	def test_sales_order_lookup_uses_sales_order_index(self):
+		plan = self.explain({"sales_order": "_T-SO-3-15-1"})
+		self.assertEqual(plan[0].key, SALES_ORDER_INDEX)
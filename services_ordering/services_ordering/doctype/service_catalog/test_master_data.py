@@ -0,0 +1,43 @@
+# Copyright (c) 2026, Haris and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from services_ordering.master_data import encode_columnar
+
+
+def decode_columnar(data):
+	"""Mirror of decodeColumnarMasterData in public/js/portal_master_data.js"""
+	decoded = {}
+	for section, encoded in data.items():
+		if not isinstance(encoded, dict) or "fields" not in encoded:
+			decoded[section] = encoded
+			continue
+		decoded[section] = [
+			{
+				field: encoded["dicts"][field][column[i]] if field in encoded["dicts"] else column[i]
+				for field, column in zip(encoded["fields"], encoded["columns"], strict=True)
+			}
+			for i in range(encoded["length"])
+		]
+	return decoded
+
+
+class TestMasterData(FrappeTestCase):
+	def test_columnar_round_trip(self):
+		data = {
+			"customers": [
+				{"name": f"CUST-{i:03d}", "customer_group": "Individual" if i % 3 else "Commercial", "territory": "Riyadh", "rate": i * 1.5}
+				for i in range(12)
+			],
+			"items": [{"item_code": "SRV-1", "stock_uom": None}, {"item_code": "SRV-2", "stock_uom": "Hour"}],
+			"price_lists": [],
+			"company": "Sage Services Co Ltd"
+		}
+		encoded = encode_columnar(data)
+		self.assertEqual(decode_columnar(encoded), data)
+
+		# Repeated values are sent once, unique ones as they are
+		self.assertEqual(encoded["customers"]["dicts"]["territory"], ["Riyadh"])
+		self.assertNotIn("name", encoded["customers"]["dicts"])
+		self.assertEqual(encoded["company"], "Sage Services Co Ltd")
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Haris and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Service Trace", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -179,7 +179,7 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 	
 	function initializeVueApp() {
 		try {
-			const { createApp, ref, onMounted, computed } = Vue;
+			const { createApp, ref, onMounted, computed, watch } = Vue;
 
 			const app = createApp({
 				setup() {
@@ -212,6 +212,7 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 					const loading = ref(false);
 					const saving = ref(false);
 					const sendingEmail = ref(false);
+					const convertingQuotation = ref(false);
 					const lastCreatedQuotation = ref(null);
 					const showSuccessMessage = ref(false);
 					const successMessage = ref('');
@@ -335,9 +336,41 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 						return grand;
 					});
 					
+					// Server-side customer search for the current search term
+					const customerSearchResults = ref(null);
+					let customerSearchTimer = null;
+
+					const searchCustomers = async (term) => {
+						try {
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.search_customers",
+								args: {
+									txt: term,
+									page_len: 50
+								}
+							});
+							// Ignore results for a term the user has already changed
+							if (term !== customerSearchTerm.value) return;
+							if (response.message && response.message.success) {
+								customerSearchResults.value = response.message.data || [];
+							}
+						} catch (error) {
+							console.error('Error searching customers:', error);
+						}
+					};
+
+					watch(customerSearchTerm, (term) => {
+						clearTimeout(customerSearchTimer);
+						customerSearchResults.value = null;
+						if (!term) return;
+						customerSearchTimer = setTimeout(() => searchCustomers(term), 250);
+					});
+
 					// Filtered customers for search
 					const filteredCustomers = computed(() => {
 						if (!customerSearchTerm.value) return customers.value;
+						// Server results cover every customer, the local filter only bridges the debounce
+						if (customerSearchResults.value !== null) return customerSearchResults.value;
 						const searchTerm = customerSearchTerm.value.toLowerCase();
 						return customers.value.filter(customer => {
 							// Search by customer name
@@ -401,6 +434,10 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 					
 					// Select customer
 					const selectCustomer = async (customer) => {
+						// Customers found by search may not be part of the preloaded list
+						if (!customers.value.some(c => c.name === customer.name)) {
+							customers.value.push(customer);
+						}
 						quotation.value.customer = customer.name;
 						showCustomerDropdown.value = false;
 						customerSearchTerm.value = '';
@@ -709,38 +746,45 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 						
 						try {
 							loadingTeamAvailability.value = true;
-							const allTeamsData = [];
+							// Availability of all teams in one call, flattened to the single team shape
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.get_teams_availability",
+								args: {
+									teams: availableTeamsList.value.map(team => team.name),
+									from_date: selectedDateForViewing.value
+								}
+							});
+							if (!response || !response.message || !response.message.success) {
+								throw new Error((response && response.message && response.message.message) || 'Unknown error');
+							}
 							
-							// Fetch availability for each team
-							for (const team of availableTeamsList.value) {
-								try {
-									const response = await frappe.call({
-										method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.get_team_availability",
-										args: {
-											team_name: team.name,
-											date: selectedDateForViewing.value
-										}
-									});
-									
-									if (response && response.message && response.message.success) {
-										allTeamsData.push({
-											team_name: team.name,
-											team_display_name: team.name1 || team.name,
-											...response.message.data
-										});
-									}
-								} catch (error) {
-									console.error(`Error fetching availability for team ${team.name}:`, error);
+							const teamsById = {};
+							for (const team of response.message.data.teams) {
+								teamsById[team.team_id] = team;
+							}
+							const allTeamsData = availableTeamsList.value.map(team => {
+								const availability = teamsById[team.name];
+								if (!availability) {
 									// Add team with error state
-									allTeamsData.push({
+									return {
 										team_name: team.name,
 										team_display_name: team.name1 || team.name,
 										error: true,
 										shifts: [],
 										appointments: []
-									});
+									};
 								}
-							}
+								
+								const { days, ...teamData } = availability;
+								return {
+									team_name: team.name,
+									team_display_name: team.name1 || team.name,
+									...teamData,
+									appointments: days[0].appointments,
+									busy: days[0].busy,
+									date: days[0].date
+								};
+							});
 							
 							teamAvailabilityData.value = allTeamsData;
 						} catch (error) {
@@ -876,6 +920,38 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 						}
 					};
 
+					// Incremental catalog sync: merge items changed since the last sync into the local list
+					const catalogSync = services_ordering.portal.createCatalogSync({
+						method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.get_items_since",
+						getItems: () => itemsList.value,
+						setItems: (items) => {
+							itemsList.value = items;
+						}
+					});
+					const syncCatalog = catalogSync.sync;
+
+					// Retries of the same payload reuse their idempotency key, so the server replays the first result
+					const idempotencyKeys = {};
+					const getIdempotencyKey = (action, payload) => {
+						const fingerprint = JSON.stringify(payload);
+						const pending = idempotencyKeys[action];
+						if (pending && pending.fingerprint === fingerprint) return pending.key;
+						const key = window.crypto && window.crypto.randomUUID
+							? window.crypto.randomUUID()
+							: `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+						idempotencyKeys[action] = { fingerprint, key };
+						return key;
+					};
+					const clearIdempotencyKey = (action) => {
+						delete idempotencyKeys[action];
+					};
+
+					// Master data snapshot kept between page loads, revalidated by version
+					const masterDataCache = services_ordering.portal.createMasterDataCache('quotation_portal_master_data');
+					const loadCachedMasterData = masterDataCache.load;
+					const saveCachedMasterData = masterDataCache.save;
+					const decodeColumnarMasterData = services_ordering.portal.decodeColumnarMasterData;
+
 					// Fetch master data from backend
 					const fetchMasterData = async () => {
 						try {
@@ -889,8 +965,13 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 								throw new Error('Backend connection test failed');
 							}
 							
+							const cachedMasterData = loadCachedMasterData();
 							const response = await frappe.call({
 								method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.get_master_data",
+								args: {
+									version: cachedMasterData ? cachedMasterData.version : null,
+									encoding: 'columnar'
+								},
 								callback: function(r) {
 									console.log('Frappe call response:', r);
 								}
@@ -899,10 +980,20 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 							console.log('Raw response:', response);
 
 							if (response && response.message && response.message.success) {
-								const data = response.message.data;
+								let data = response.message.data;
+								if (response.message.encoding === 'columnar') {
+									data = decodeColumnarMasterData(data);
+								}
+								if (response.message.unchanged && cachedMasterData) {
+									// Server snapshot has not changed since our last load
+									data = cachedMasterData.data;
+								} else {
+									saveCachedMasterData(response.message.version, data);
+								}
 								customers.value = data.customers || [];
 								companies.value = data.companies || [];
 								itemsList.value = data.items || [];
+								catalogSync.setToken(response.message.synced_at);
 								territories.value = data.territories || [];
 								customerGroups.value = data.customer_groups || [];
 								setDefaultCustomerGroup();
@@ -962,11 +1053,13 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 							const response = await frappe.call({
 								method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.create_quotation",
 								args: {
-									quotation_data: quotationData
+									quotation_data: quotationData,
+									idempotency_key: getIdempotencyKey('create_quotation', quotationData)
 								}
 							});
 
 							if (response.message && response.message.success) {
+								clearIdempotencyKey('create_quotation');
 								lastCreatedQuotation.value = response.message;
 								
 								// Show custom success message
@@ -1090,6 +1183,31 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 						}
 					};
 
+					// Convert the accepted quotation into a submitted Sales Order, lines and rates as quoted
+					const convertToSalesOrder = async () => {
+						if (!lastCreatedQuotation.value) return;
+						try {
+							convertingQuotation.value = true;
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.convert_quotation_to_sales_order",
+								args: {
+									quotation: lastCreatedQuotation.value.quotation_name
+								}
+							});
+
+							if (response.message && response.message.success) {
+								showMessage(response.message.message);
+							} else {
+								showMessage('Error converting quotation: ' + (response.message?.message || 'Unknown error'), true);
+							}
+						} catch (error) {
+							console.error('Error converting quotation:', error);
+							showMessage('Error converting quotation: ' + error.message, true);
+						} finally {
+							convertingQuotation.value = false;
+						}
+					};
+
 					// Handle customer selection
 					const onCustomerChange = async () => {
 						const selectedCustomer = customers.value.find(c => c.name === quotation.value.customer);
@@ -1164,9 +1282,49 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 						}
 					};
 
+					// Reprice every cart line in one call when the price list changes
+					const repriceItems = async () => {
+						const cartItems = items.value.filter(item => item.item_code);
+						if (!cartItems.length) return;
+						try {
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.quotation_portal.quotation_portal.get_items_details",
+								args: {
+									item_codes: [...new Set(cartItems.map(item => item.item_code))],
+									customer: quotation.value.customer,
+									company: quotation.value.company,
+									price_list: quotation.value.selling_price_list
+								}
+							});
+
+							if (response.message && response.message.success) {
+								const details = response.message.data || {};
+								cartItems.forEach((item) => {
+									const itemDetails = details[item.item_code];
+									if (!itemDetails) return;
+									item.rate = itemDetails.rate || item.rate;
+									item.uom = itemDetails.stock_uom || item.uom;
+									item.item_tax_template = itemDetails.item_tax_template;
+									calculateItemAmount(item);
+								});
+							}
+						} catch (error) {
+							console.error('Error repricing items:', error);
+						}
+					};
+
+					watch(() => quotation.value.selling_price_list, (priceList, previousPriceList) => {
+						if (priceList && priceList !== previousPriceList) repriceItems();
+					});
+
 					onMounted(() => {
 						console.log('Vue onMounted called');
 						fetchMasterData();
+						
+						// Pick up catalog changes whenever the agent comes back to the portal
+						document.addEventListener('visibilitychange', () => {
+							if (document.visibilityState === 'visible') syncCatalog();
+						});
 						addItem(); // Add first item by default
 						
 						// Add beforeunload event to show confirmation before page refresh
@@ -1210,6 +1368,8 @@ frappe.pages['quotation-portal'].on_page_load = function(wrapper) {
 						saveQuotation,
 						resetForm,
 						sendEmail,
+						convertToSalesOrder,
+						convertingQuotation,
 						onCustomerChange,
 						onItemChange,
 						showMessage,
@@ -1710,6 +1870,20 @@ class="w-full sm:w-auto px-6 py-3 bg-green-600 text-white rounded-lg hover:bg-gr
 {{ sendingEmail ? 'Sending Email...' : 'Send Email' }}
 </button>
 
+<!-- Convert Button - Only show after successful Quotation creation -->
+<button 
+v-if="lastCreatedQuotation"
+@click="convertToSalesOrder"
+:disabled="convertingQuotation"
+class="w-full sm:w-auto px-6 py-3 bg-indigo-600 text-white rounded-lg hover:bg-indigo-700 transition-all duration-200 disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center font-medium text-base"
+>
+<svg v-if="!convertingQuotation" class="w-5 h-5 mr-2" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+<path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M9 5H7a2 2 0 00-2 2v12a2 2 0 002 2h10a2 2 0 002-2V7a2 2 0 00-2-2h-2M9 5a2 2 0 002 2h2a2 2 0 002-2M9 5a2 2 0 012-2h2a2 2 0 012 2m-6 9l2 2 4-4"></path>
+</svg>
+<div v-else class="w-5 h-5 mr-2 border-2 border-white border-t-transparent rounded-full animate-spin"></div>
+{{ convertingQuotation ? 'Converting...' : 'Convert to Sales Order' }}
+</button>
+
 <button 
 @click="saveQuotation"
 :disabled="saving"
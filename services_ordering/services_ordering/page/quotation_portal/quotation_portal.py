@@ -3,6 +3,19 @@ from frappe import _
 from frappe.utils import nowdate, flt, cint
 import json
 
+from services_ordering import locations
+from services_ordering.catalog import get_catalog_delta, get_catalog_item_details, get_catalog_items, get_catalog_items_details
+from services_ordering.conversion import convert_quotation
+from services_ordering.customers import find_customers, get_customer_profiles
+from services_ordering.idempotency import run_idempotent
+from services_ordering.master_data import get_master_data_response, get_master_data_snapshot
+from services_ordering.naming import set_block_name
+from services_ordering.orders import make_sales_order_result
+from services_ordering.pricing import VAT_ACCOUNT, VAT_RATE, get_line_rate, get_order_price_list
+from services_ordering.scheduling import DEFAULT_SLOT_LIMIT, build_teams_availability, get_available_slots
+from services_ordering.tracing import trace
+from services_ordering.validation import resolve_order_references, validate_order
+
 
 @frappe.whitelist()
 def test_connection():
@@ -28,6 +41,19 @@ def get_customers():
         frappe.log_error(f"Error fetching customers: {str(e)}", "Quotation Form - Get Customers")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist()
+def search_customers(txt=None, start=None, page_len=20):
+    """Search customers by name, mobile or email for the customer picker
+
+    Pass the returned `next_start` back as `start` to get the following page.
+    """
+    try:
+        customers, next_start = find_customers(txt, start, page_len)
+        return {"success": True, "data": customers, "next_start": next_start}
+    except Exception as e:
+        frappe.log_error(f"Error searching customers: {str(e)}", "Quotation Form - Search Customers")
+        return {"success": False, "message": str(e)}
+
 @frappe.whitelist()
 def get_companies():
     """Get list of companies for the dropdown"""
@@ -46,57 +72,25 @@ def get_companies():
 def get_items():
     """Get list of sales items for the dropdown"""
     try:
-        # First, get item names that have Sage Services Co Ltd in item defaults
-        items_with_sage_company = frappe.db.sql("""
-            SELECT parent as item_code
-            FROM `tabItem Default`
-            WHERE company = 'Sage Services Co Ltd'
-        """, as_dict=True)
-        
-        # Extract item codes from the result
-        sage_item_codes = [item.item_code for item in items_with_sage_company]
-        
-        if not sage_item_codes:
-            # Return empty list if no items found
-            return {"success": True, "data": []}
-        
-        # Get details of these items
-        items = frappe.get_all(
-            "Item",
-            fields=[
-                "name", "item_name", "description", "stock_uom", 
-                "standard_rate", "item_group", "brand", "has_variants"
-            ],
-            filters={
-                "disabled": 0,
-                "is_sales_item": 1,
-                "has_variants": 0,  # Exclude template items
-                "name": ["in", sage_item_codes]  # Filter by item codes with Sage company
-            },
-            order_by="item_name asc",
-            limit=500
-        )
-        
-        # Get prices from Item Price list for each item
-        for item in items:
-            price_doc = frappe.get_all(
-                "Item Price",
-                fields=["price_list_rate"],
-                filters={
-                    "item_code": item.name,
-                    "price_list": "البيع القياسية",
-                    "selling": 1
-                },
-                limit=1
-            )
-            if price_doc:
-                item["standard_rate"] = price_doc[0].price_list_rate
-        
+        # Sellable items with Sage Services Co Ltd in item defaults, priced from the standard selling list
+        items = get_catalog_items()
         return {"success": True, "data": items}
     except Exception as e:
         frappe.log_error(f"Error fetching items: {str(e)}", "Quotation Form - Get Items")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist()
+def get_items_since(modified_after=None):
+    """Get items changed or removed since the client's last catalog sync
+
+    Pass the returned `sync_token` as `modified_after` on the next call.
+    """
+    try:
+        return {"success": True, "data": get_catalog_delta(modified_after)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching item changes: {str(e)}", "Quotation Form - Get Items Since")
+        return {"success": False, "message": str(e)}
+
 @frappe.whitelist()
 def get_warehouses():
     """Get list of warehouses for the dropdown"""
@@ -161,13 +155,8 @@ def get_price_lists():
 def get_cities():
     """Get list of cities for the dropdown"""
     try:
-        cities = frappe.get_all(
-            "City",
-            fields=["city"],
-            filters={"disabled": 0} if frappe.db.has_column("City", "disabled") else {},
-            order_by="city asc"
-        )
-        return {"success": True, "data": cities}
+        # Served from the cached location tree, rebuilt by City/Neighborhood hooks
+        return {"success": True, "data": locations.get_cities()}
     except Exception as e:
         frappe.log_error(f"Error fetching cities: {str(e)}", "Quotation Form - Get Cities")
         return {"success": False, "message": str(e)}
@@ -176,23 +165,8 @@ def get_cities():
 def get_neighborhoods(city=None):
     """Get list of neighborhoods for the dropdown, optionally filtered by city"""
     try:
-        filters = {}
-        
-        # Add disabled filter if column exists
-        if frappe.db.has_column("Neighborhood", "disabled"):
-            filters["disabled"] = 0
-        
-        # Add city filter if provided
-        if city:
-            filters["city"] = city
-        
-        neighborhoods = frappe.get_all(
-            "Neighborhood",
-            fields=["name", "city"],
-            filters=filters,
-            order_by="name asc"
-        )
-        return {"success": True, "data": neighborhoods}
+        # Served from the cached location tree, rebuilt by City/Neighborhood hooks
+        return {"success": True, "data": locations.get_neighborhoods(city)}
     except Exception as e:
         frappe.log_error(f"Error fetching neighborhoods: {str(e)}", "Quotation Form - Get Neighborhoods")
         return {"success": False, "message": str(e)}
@@ -204,73 +178,28 @@ def get_customer_details(customer):
         if not customer:
             return {"success": False, "message": "Customer is required"}
         
-        customer_doc = frappe.get_doc("Customer", customer)
-        
-        # Get default address
-        default_address = None
-        addresses = frappe.get_all(
-            "Dynamic Link",
-            fields=["parent"],
-            filters={
-                "link_doctype": "Customer",
-                "link_name": customer,
-                "parenttype": "Address"
-            }
-        )
-        
-        if addresses:
-            address_doc = frappe.get_doc("Address", addresses[0].parent)
-            default_address = {
-                "name": address_doc.name,
-                "address_line1": address_doc.address_line1,
-                "address_line2": address_doc.address_line2,
-                "city": address_doc.city,
-                "state": address_doc.state,
-                "country": address_doc.country,
-                "pincode": address_doc.pincode
-            }
-        
-        # Get default contact
-        default_contact = None
-        contacts = frappe.get_all(
-            "Dynamic Link",
-            fields=["parent"],
-            filters={
-                "link_doctype": "Customer",
-                "link_name": customer,
-                "parenttype": "Contact"
-            }
-        )
-        
-        if contacts:
-            contact_doc = frappe.get_doc("Contact", contacts[0].parent)
-            default_contact = {
-                "name": contact_doc.name,
-                "first_name": contact_doc.first_name,
-                "last_name": contact_doc.last_name,
-                "email_id": contact_doc.email_id,
-                "mobile_no": contact_doc.mobile_no,
-                "phone": contact_doc.phone
-            }
-        
-        customer_details = {
-            "customer_name": customer_doc.customer_name,
-            "customer_group": customer_doc.customer_group,
-            "territory": customer_doc.territory,
-            "customer_type": customer_doc.customer_type,
-            "default_currency": customer_doc.default_currency,
-            "default_price_list": customer_doc.default_price_list,
-            "payment_terms": customer_doc.payment_terms,
-            "credit_limit": customer_doc.credit_limit,
-            "default_address": default_address,
-            "default_contact": default_contact
-        }
+        # Customer, primary address and primary contact from one cached lookup
+        customer_details = get_customer_profiles([customer]).get(customer)
+        if not customer_details:
+            return {"success": False, "message": f"Customer {customer} not found"}
         
         return {"success": True, "data": customer_details}
     except Exception as e:
         frappe.log_error(f"Error fetching customer details: {str(e)}", "Quotation Form - Get Customer Details")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist()
+def get_customers_details(customers):
+    """Get customer details for several customers at once, keyed by customer"""
+    try:
+        if isinstance(customers, str):
+            customers = json.loads(customers)
+        
+        return {"success": True, "data": get_customer_profiles(customers)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching customers details: {str(e)}", "Quotation Form - Get Customers Details")
+        return {"success": False, "message": str(e)}
+
 @frappe.whitelist()
 def get_item_details(item_code, customer=None, company=None, price_list=None):
     """Get detailed item information including price"""
@@ -278,6 +207,11 @@ def get_item_details(item_code, customer=None, company=None, price_list=None):
         if not item_code:
             return {"success": False, "message": "Item code is required"}
         
+        # Catalog items are resolved from a single Service Catalog row
+        item_details = get_catalog_item_details(item_code, price_list)
+        if item_details:
+            return {"success": True, "data": item_details}
+        
         item_doc = frappe.get_doc("Item", item_code)
         
         # Get item price
@@ -323,19 +257,41 @@ def get_item_details(item_code, customer=None, company=None, price_list=None):
         return {"success": False, "message": str(e)}
 
 @frappe.whitelist()
-def create_quotation(quotation_data):
+def get_items_details(item_codes, customer=None, company=None, price_list=None):
+    """Get item details for several items at once, keyed by item code
+
+    Used to reprice the whole cart in one call when the price list or customer changes.
+    """
+    try:
+        if isinstance(item_codes, str):
+            item_codes = json.loads(item_codes)
+        
+        return {"success": True, "data": get_catalog_items_details(item_codes, price_list)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching items details: {str(e)}", "Quotation Form - Get Items Details")
+        return {"success": False, "message": str(e)}
+
+@frappe.whitelist()
+def create_quotation(quotation_data, idempotency_key=None):
+    """Create a new quotation in ERPNext
+
+    Retries sending the same `idempotency_key` get the first response back
+    instead of creating a duplicate.
+    """
+    return run_idempotent("create_quotation", idempotency_key, lambda: insert_quotation(quotation_data))
+
+def insert_quotation(quotation_data):
     """Create a new quotation in ERPNext"""
     try:
         # Parse the JSON data if it's a string
         if isinstance(quotation_data, str):
             quotation_data = json.loads(quotation_data)
         
-        # Validate required fields
-        if not quotation_data.get("customer"):
-            return {"success": False, "message": "Customer is required"}
-        
-        if not quotation_data.get("items") or len(quotation_data.get("items", [])) == 0:
-            return {"success": False, "message": "At least one item is required"}
+        # Validate every reference in one pass, the same facts build the document
+        facts = resolve_order_references([quotation_data])
+        errors = validate_order(quotation_data, facts)
+        if errors:
+            return {"success": False, "message": "; ".join(errors)}
         
         # Create new Quotation document
         quotation = frappe.new_doc("Quotation")
@@ -347,9 +303,9 @@ def create_quotation(quotation_data):
         quotation.currency = "SAR"  # Static currency
         quotation.transaction_date = quotation_data.get("transaction_date", nowdate())
         quotation.valid_till = quotation_data.get("delivery_date") or quotation_data.get("valid_till")  # Using delivery_date as valid_till for quotation
-        pl_candidate = quotation_data.get("selling_price_list") or quotation_data.get("price_list")
+        pl_candidate = get_order_price_list(quotation_data)
         valid_price_list = None
-        if pl_candidate and frappe.db.exists("Price List", {"name": pl_candidate, "enabled": 1, "selling": 1}):
+        if pl_candidate and pl_candidate in facts.price_lists:
             valid_price_list = pl_candidate
             quotation.selling_price_list = pl_candidate
         
@@ -362,8 +318,7 @@ def create_quotation(quotation_data):
         # Handle custom payment mode field
         if quotation_data.get("custom_payment_mode"):
             quotation.custom_payment_mode = quotation_data.get("custom_payment_mode")
-            print(f"Setting custom_payment_mode to {quotation_data.get('custom_payment_mode')}")
-            frappe.log_error(f"Setting custom_payment_mode to {quotation_data.get('custom_payment_mode')}", "Quotation Form - Custom Payment Mode")
+            trace("Quotation Form - Custom Payment Mode", custom_payment_mode=quotation_data.get("custom_payment_mode"))
             
         if quotation_data.get("source"):
             quotation.source = quotation_data.get("source")
@@ -384,12 +339,8 @@ def create_quotation(quotation_data):
         if quotation_data.get("tc_name"):
             quotation.tc_name = quotation_data.get("tc_name")
             # Fetch terms content from Terms and Conditions template
-            try:
-                tc_doc = frappe.get_doc("Terms and Conditions", quotation_data.get("tc_name"))
-                if tc_doc and tc_doc.terms:
-                    quotation.terms = tc_doc.terms
-            except Exception as e:
-                frappe.log_error(f"Error fetching terms and conditions: {str(e)}", "Quotation Form - Terms and Conditions")
+            if facts.terms.get(quotation_data.get("tc_name")):
+                quotation.terms = facts.terms.get(quotation_data.get("tc_name"))
         if quotation_data.get("terms"):
             quotation.terms = quotation_data.get("terms")
         
@@ -407,9 +358,9 @@ def create_quotation(quotation_data):
         # Always add the tax row directly
         tax_row = quotation.append("taxes", {})
         tax_row.charge_type = "On Net Total"
-        tax_row.account_head = "KSA VAT15% - SSC"
+        tax_row.account_head = VAT_ACCOUNT
         tax_row.description = "VAT 15%"
-        tax_row.rate = 15
+        tax_row.rate = VAT_RATE
         
         # Shipping
         if quotation_data.get("shipping_rule"):
@@ -424,28 +375,7 @@ def create_quotation(quotation_data):
             item_row.item_code = item_data.get("item_code")
             item_row.qty = flt(item_data.get("qty", 1))
             # Use client-provided rate if positive; else compute from price list or standard_rate
-            client_rate = flt(item_data.get("rate", 0))
-            price_list = valid_price_list
-            computed_rate = 0
-            if client_rate > 0:
-                computed_rate = client_rate
-            else:
-                if price_list:
-                    price_doc = frappe.get_all(
-                        "Item Price",
-                        fields=["price_list_rate"],
-                        filters={
-                            "item_code": item_row.item_code,
-                            "price_list": price_list,
-                            "selling": 1
-                        },
-                        limit=1
-                    )
-                    if price_doc:
-                        computed_rate = price_doc[0].price_list_rate
-                if not computed_rate:
-                    item_doc = frappe.get_doc("Item", item_row.item_code)
-                    computed_rate = item_doc.standard_rate or 0
+            computed_rate = get_line_rate(item_data, valid_price_list, facts.prices, facts.standard_rates)
             item_row.price_list_rate = flt(computed_rate)
             item_row.rate = flt(computed_rate)
             item_row.amount = flt(item_row.qty) * flt(item_row.rate)
@@ -469,6 +399,7 @@ def create_quotation(quotation_data):
         # Do not apply document-level discounts from client on public endpoint
         
         # Insert the document
+        set_block_name(quotation)
         quotation.insert(ignore_permissions=True)
         
         # Save the quotation (don't auto-submit)
@@ -476,7 +407,7 @@ def create_quotation(quotation_data):
         
         # Calculate totals with VAT
         total_amount = flt(quotation.net_total or quotation.total or 0)
-        vat_amount = total_amount * 0.15  # 15% VAT
+        vat_amount = total_amount * VAT_RATE / 100
         grand_total_with_vat = total_amount + vat_amount
         
         return {
@@ -499,40 +430,120 @@ def create_quotation(quotation_data):
         return {"success": False, "message": f"Error creating quotation: {str(e)}"}
 
 @frappe.whitelist()
-def get_master_data():
-    """Get all master data in one API call for better performance"""
+def convert_quotation_to_sales_order(quotation, overrides=None):
+    """Convert a quotation into a submitted Sales Order without re-entering the cart
+
+    `overrides` sets Sales Order only fields like delivery_date, custom_time and
+    team. The quotation and the order are committed together or not at all.
+    """
     try:
-        # Get all master data
-        customers_result = get_customers()
-        companies_result = get_companies()
-        items_result = get_items()
-        warehouses_result = get_warehouses()
-        territories_result = get_territories()
-        customer_groups_result = get_customer_groups()
-        price_lists_result = get_price_lists()
-        cities_result = get_cities()
-        neighborhoods_result = get_neighborhoods()
-        # cleaning_teams_result = get_cleaning_teams()  # Temporarily disabled
+        if isinstance(overrides, str):
+            overrides = json.loads(overrides)
         
+        return convert_quotation_in_savepoint(quotation, overrides, "quotation_conversion")
+    except Exception as e:
+        frappe.log_error(f"Error converting quotation: {str(e)}", "Quotation Form - Convert Quotation")
+        return {"success": False, "message": f"Error converting quotation: {str(e)}"}
+
+@frappe.whitelist()
+def convert_quotations_to_sales_orders(quotations, overrides=None):
+    """Convert a batch of accepted quotations, e.g. a corporate contract signed in one go
+
+    `quotations` holds quotation names or {"quotation", "overrides"} objects, the
+    shared `overrides` apply to every entry below its own. Each conversion runs
+    in its own savepoint, so a failing quotation is rolled back alone.
+    """
+    try:
+        if isinstance(quotations, str):
+            quotations = json.loads(quotations)
+        if isinstance(overrides, str):
+            overrides = json.loads(overrides)
+        
+        results = []
+        for index, entry in enumerate(quotations):
+            if isinstance(entry, str):
+                entry = {"quotation": entry}
+            results.append(convert_quotation_in_savepoint(
+                entry.get("quotation"),
+                dict(overrides or {}, **(entry.get("overrides") or {})),
+                f"quotation_conversion_{index}"
+            ))
+        
+        converted = sum(1 for result in results if result.get("success"))
         return {
             "success": True,
-            "data": {
-                "customers": customers_result.get("data", []) if customers_result.get("success") else [],
-                "companies": companies_result.get("data", []) if companies_result.get("success") else [],
-                "items": items_result.get("data", []) if items_result.get("success") else [],
-                "warehouses": warehouses_result.get("data", []) if warehouses_result.get("success") else [],
-                "territories": territories_result.get("data", []) if territories_result.get("success") else [],
-                "customer_groups": customer_groups_result.get("data", []) if customer_groups_result.get("success") else [],
-                "price_lists": price_lists_result.get("data", []) if price_lists_result.get("success") else [],
-                "cities": cities_result.get("data", []) if cities_result.get("success") else [],
-                "neighborhoods": neighborhoods_result.get("data", []) if neighborhoods_result.get("success") else [],
-                "cleaning_teams": []  # Temporarily disabled
-            }
+            "message": f"{converted} of {len(quotations)} quotations converted",
+            "converted": converted,
+            "failed": len(quotations) - converted,
+            "data": results
         }
+    except Exception as e:
+        frappe.log_error(f"Error converting quotations in bulk: {str(e)}", "Quotation Form - Convert Quotations Bulk")
+        return {"success": False, "message": f"Error converting quotations: {str(e)}"}
+
+def convert_quotation_in_savepoint(quotation_name, overrides, savepoint):
+    if not quotation_name:
+        return {"success": False, "message": "Quotation is required"}
+    
+    frappe.db.savepoint(savepoint)
+    try:
+        sales_order = convert_quotation(quotation_name, overrides)
+    except Exception as e:
+        frappe.db.rollback(save_point=savepoint)
+        frappe.log_error(f"Error converting quotation {quotation_name}: {str(e)}", "Quotation Form - Convert Quotation")
+        return {"success": False, "quotation": quotation_name, "message": f"Error converting quotation: {str(e)}"}
+    
+    result = make_sales_order_result(sales_order, overrides or {})
+    result["quotation"] = quotation_name
+    return result
+
+@frappe.whitelist()
+def get_master_data(version=None, encoding=None):
+    """Get all master data in one API call for better performance
+
+    The payload is served from a cached snapshot. Clients pass the version they
+    hold and get an "unchanged" response without the data if it is still current.
+    Pass encoding="columnar" for the compact column-oriented format.
+    """
+    try:
+        snapshot = get_master_data_snapshot("quotation_portal", build_master_data)
+        return get_master_data_response(snapshot, version, encoding)
     except Exception as e:
         frappe.log_error(f"Error fetching master data: {str(e)}", "Quotation Form - Get Master Data")
         return {"success": False, "message": str(e)}
 
+def build_master_data():
+    """Build the master data payload, returns (data, complete)"""
+    # Get all master data
+    customers_result = get_customers()
+    companies_result = get_companies()
+    items_result = get_items()
+    warehouses_result = get_warehouses()
+    territories_result = get_territories()
+    customer_groups_result = get_customer_groups()
+    price_lists_result = get_price_lists()
+    cities_result = get_cities()
+    neighborhoods_result = get_neighborhoods()
+    # cleaning_teams_result = get_cleaning_teams()  # Temporarily disabled
+    
+    results = [
+        customers_result, companies_result, items_result, warehouses_result, territories_result,
+        customer_groups_result, price_lists_result, cities_result, neighborhoods_result
+    ]
+    data = {
+        "customers": customers_result.get("data", []) if customers_result.get("success") else [],
+        "companies": companies_result.get("data", []) if companies_result.get("success") else [],
+        "items": items_result.get("data", []) if items_result.get("success") else [],
+        "warehouses": warehouses_result.get("data", []) if warehouses_result.get("success") else [],
+        "territories": territories_result.get("data", []) if territories_result.get("success") else [],
+        "customer_groups": customer_groups_result.get("data", []) if customer_groups_result.get("success") else [],
+        "price_lists": price_lists_result.get("data", []) if price_lists_result.get("success") else [],
+        "cities": cities_result.get("data", []) if cities_result.get("success") else [],
+        "neighborhoods": neighborhoods_result.get("data", []) if neighborhoods_result.get("success") else [],
+        "cleaning_teams": []  # Temporarily disabled
+    }
+    return data, all(result.get("success") for result in results)
+
 @frappe.whitelist()
 def validate_quotation_data(quotation_data):
     """Validate sales order data before creation"""
@@ -540,36 +551,8 @@ def validate_quotation_data(quotation_data):
         if isinstance(quotation_data, str):
             quotation_data = json.loads(quotation_data)
         
-        errors = []
-        
-        # Check required fields
-        if not quotation_data.get("customer"):
-            errors.append("Customer is required")
-        
-        if not quotation_data.get("company"):
-            errors.append("Company is required")
-        
-        if not quotation_data.get("items") or len(quotation_data.get("items", [])) == 0:
-            errors.append("At least one item is required")
-        
-        # Validate items
-        for i, item in enumerate(quotation_data.get("items", [])):
-            if not item.get("item_code"):
-                errors.append(f"Item code is required for item {i+1}")
-            if not item.get("qty") or flt(item.get("qty")) <= 0:
-                errors.append(f"Valid quantity is required for item {i+1}")
-            if not item.get("rate") or flt(item.get("rate")) < 0:
-                errors.append(f"Valid rate is required for item {i+1}")
-        
-        # Check if customer exists
-        if quotation_data.get("customer"):
-            if not frappe.db.exists("Customer", quotation_data.get("customer")):
-                errors.append("Selected customer does not exist")
-        
-        # Check if company exists
-        if quotation_data.get("company"):
-            if not frappe.db.exists("Company", quotation_data.get("company")):
-                errors.append("Selected company does not exist")
+        # Customer, company and items are checked with one query per doctype
+        errors = validate_order(quotation_data, resolve_order_references([quotation_data]), strict=True)
         
         return {
             "success": len(errors) == 0,
@@ -919,7 +902,7 @@ def create_customer(customer_data):
                     # Commit again to ensure everything is saved
                     frappe.db.commit()
                 
-                frappe.log_error(f"Contact created successfully for customer {customer.name}: {contact.name} with email {customer_data.get('email_id')}", "Customer Creation Debug")
+                trace("Customer Creation Debug", customer=customer.name, contact=contact.name, email_id=customer_data.get("email_id"))
                 
             except Exception as contact_error:
                 frappe.log_error(f"Error creating contact for customer {customer.name}: {str(contact_error)}", "Customer Creation - Contact Error")
@@ -1015,48 +998,24 @@ def get_team_availability(team_name, date=None):
         if not team_name:
             return {"success": False, "message": "Team name is required"}
         
-        # Check if team exists
-        if not frappe.db.exists("Cleaning Team", team_name):
-            return {"success": False, "message": "Team not found"}
-        
-        # Get team document with shifts
-        team_doc = frappe.get_doc("Cleaning Team", team_name)
-        
-        # Get shifts
-        shifts = []
-        if hasattr(team_doc, 'shifts') and team_doc.shifts:
-            for shift in team_doc.shifts:
-                shifts.append({
-                    "start_time": shift.start_time,
-                    "end_time": shift.end_time
-                })
-        
         # Use provided date or today
-        from frappe.utils import nowdate
         target_date = date if date else nowdate()
         
-        # Get appointments for this team on the target date using between filter
-        appointments = frappe.get_all(
-            "Service Appointment",
-            fields=["name", "appointment_date_time", "appointment_end_time", "customer", "total_service_time"],
-            filters={
-                "service_team": team_name,
-                "docstatus": ["!=", 2],  # Not cancelled
-                "appointment_date_time": ["between", [target_date + " 00:00:00", target_date + " 23:59:59"]]
-            }
-        )
-        
-        # Get team members count
-        team_members_count = len(team_doc.team_members) if hasattr(team_doc, 'team_members') and team_doc.team_members else 0
+        # Appointments on the target date, including jobs running over from the day before
+        availability = build_teams_availability([team_name], target_date)
+        if not availability["teams"]:
+            return {"success": False, "message": "Team not found"}
         
+        team = availability["teams"][0]
         return {
             "success": True,
             "data": {
-                "team_name": team_doc.name1 if hasattr(team_doc, 'name1') else team_name,
+                "team_name": team.team_name,
                 "team_id": team_name,
-                "team_members_count": team_members_count,
-                "shifts": shifts,
-                "appointments": appointments,
+                "team_members_count": team.team_members_count,
+                "shifts": team.shifts,
+                "appointments": team.days[0]["appointments"],
+                "busy": team.days[0]["busy"],
                 "date": target_date
             }
         }
@@ -1064,3 +1023,42 @@ def get_team_availability(team_name, date=None):
     except Exception as e:
         frappe.log_error(f"Error fetching team availability: {str(e)}", "Quotation Form - Get Team Availability")
         return {"success": False, "message": str(e)}
+
+@frappe.whitelist()
+def get_teams_availability(teams=None, from_date=None, to_date=None):
+    """Get availability of several teams over a date range at once, all teams if none are given"""
+    try:
+        if isinstance(teams, str):
+            teams = json.loads(teams)
+        if not teams:
+            teams = frappe.get_all("Cleaning Team", pluck="name", order_by="name asc")
+        
+        return {"success": True, "data": build_teams_availability(teams, from_date or nowdate(), to_date)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching teams availability: {str(e)}", "Quotation Form - Get Teams Availability")
+        return {"success": False, "message": str(e)}
+
+@frappe.whitelist()
+def find_available_slots(duration_minutes=None, from_date=None, to_date=None, teams=None, neighborhood=None, sales_order=None, limit=None):
+    """Find the earliest team slots a job fits in, by duration or by a sales order's total service time"""
+    try:
+        if isinstance(teams, str):
+            teams = json.loads(teams)
+        if not cint(duration_minutes) and sales_order:
+            # Total service time is in hours
+            duration_minutes = cint(frappe.db.get_value("Sales Order", sales_order, "custom_total_service_time")) * 60
+        if not cint(duration_minutes):
+            return {"success": False, "message": "Duration or a sales order with service time is required"}
+        
+        slots = get_available_slots(
+            cint(duration_minutes),
+            from_date or nowdate(),
+            to_date,
+            service_teams=teams,
+            neighborhood=neighborhood,
+            limit=cint(limit) or DEFAULT_SLOT_LIMIT
+        )
+        return {"success": True, "data": slots}
+    except Exception as e:
+        frappe.log_error(f"Error finding available slots: {str(e)}", "Quotation Form - Find Available Slots")
+        return {"success": False, "message": str(e)}
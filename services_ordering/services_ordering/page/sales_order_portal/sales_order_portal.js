@@ -179,7 +179,7 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 	
 	function initializeVueApp() {
 		try {
-			const { createApp, ref, onMounted, computed } = Vue;
+			const { createApp, ref, onMounted, computed, watch } = Vue;
 
 			const app = createApp({
 				setup() {
@@ -327,21 +327,95 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 						return total;
 					};
 
+					// Authoritative totals from the server, the local sums show until they arrive
+					const previewTotals = ref(null);
+					let previewTotalsTimer = null;
+					let previewTotalsRequest = 0;
+
+					const previewOrderTotals = () => {
+						previewTotals.value = null;
+						clearTimeout(previewTotalsTimer);
+						previewTotalsTimer = setTimeout(async () => {
+							const cartItems = items.value.filter(item => item.item_code && parseFloat(item.qty) > 0);
+							if (!cartItems.length) return;
+							const request = ++previewTotalsRequest;
+							try {
+								const response = await frappe.call({
+									method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.preview_order_totals",
+									args: {
+										payload: {
+											selling_price_list: salesOrder.value.selling_price_list,
+											items: cartItems.map(item => ({ item_code: item.item_code, qty: item.qty, rate: item.rate }))
+										}
+									}
+								});
+								// A later edit has already asked for newer totals
+								if (request !== previewTotalsRequest) return;
+								if (response.message && response.message.success) {
+									previewTotals.value = response.message.data;
+								}
+							} catch (error) {
+								console.error('Error previewing order totals:', error);
+							}
+						}, 300);
+					};
+
+					watch(
+						() => [salesOrder.value.selling_price_list, items.value.map(item => [item.item_code, item.qty, item.rate])],
+						previewOrderTotals,
+						{ deep: true }
+					);
+
 					// Computed properties
-					const totalAmount = computed(() => calculateTotals());
+					const totalAmount = computed(() => previewTotals.value ? previewTotals.value.total_amount : calculateTotals());
 					const vatAmount = computed(() => {
+						if (previewTotals.value) return previewTotals.value.vat_amount;
 						const total = totalAmount.value || 0;
 						const vat = total * 0.15;
 						return vat;
 					});
 					const grandTotal = computed(() => {
+						if (previewTotals.value) return previewTotals.value.grand_total;
 						const grand = (totalAmount.value || 0) + (vatAmount.value || 0);
 						return grand;
 					});
+					const totalServiceTime = computed(() => previewTotals.value ? previewTotals.value.total_service_time : null);
 					
+					// Server-side customer search for the current search term
+					const customerSearchResults = ref(null);
+					let customerSearchTimer = null;
+
+					const searchCustomers = async (term) => {
+						try {
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.search_customers",
+								args: {
+									txt: term,
+									page_len: 50
+								}
+							});
+							// Ignore results for a term the user has already changed
+							if (term !== customerSearchTerm.value) return;
+							if (response.message && response.message.success) {
+								customerSearchResults.value = response.message.data || [];
+							}
+						} catch (error) {
+							console.error('Error searching customers:', error);
+						}
+					};
+
+					watch(customerSearchTerm, (term) => {
+						clearTimeout(customerSearchTimer);
+						customerSearchResults.value = null;
+						if (!term) return;
+						customerSearchTimer = setTimeout(() => searchCustomers(term), 250);
+					});
+
 					// Filtered customers for search
 					const filteredCustomers = computed(() => {
 						if (!customerSearchTerm.value) return customers.value;
+						// Server results cover every customer, the local filter only bridges the debounce
+						if (customerSearchResults.value !== null) return customerSearchResults.value;
 						const searchTerm = customerSearchTerm.value.toLowerCase();
 						return customers.value.filter(customer => {
 							// Search by customer name
@@ -405,6 +479,10 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 					
 					// Select customer
 					const selectCustomer = async (customer) => {
+						// Customers found by search may not be part of the preloaded list
+						if (!customers.value.some(c => c.name === customer.name)) {
+							customers.value.push(customer);
+						}
 						salesOrder.value.customer = customer.name;
 						showCustomerDropdown.value = false;
 						customerSearchTerm.value = '';
@@ -677,6 +755,15 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 								return;
 							}
 							
+							// Orders created in pipeline mode are submitted in the background, wait for it
+							if (lastCreatedSalesOrder.value.pipeline) {
+								const pipeline = await waitForOrderPipeline(lastCreatedSalesOrder.value.sales_order_name);
+								if (pipeline.state === 'Failed') {
+									showMessage('Error creating payment entry: ' + (pipeline.message || 'Sales Order could not be submitted'), true);
+									return;
+								}
+							}
+
 							console.log('Creating payment entry:', newPayment.value);
 							
 							const response = await frappe.call({
@@ -685,11 +772,13 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 									sales_order_name: lastCreatedSalesOrder.value.sales_order_name,
 									mode_of_payment: newPayment.value.mode_of_payment,
 									payment_slip_file: newPayment.value.payment_slip_file,
-									payment_slip_filename: newPayment.value.payment_slip_filename
+									payment_slip_filename: newPayment.value.payment_slip_filename,
+									idempotency_key: getIdempotencyKey('create_payment_entry', { sales_order_name: lastCreatedSalesOrder.value.sales_order_name, ...newPayment.value })
 								}
 							});
 							
 							if (response && response.message && response.message.success) {
+								clearIdempotencyKey('create_payment_entry');
 								showMessage(`Payment Entry ${response.message.payment_entry_name} created successfully!`, false);
 								closeCreatePaymentPopup();
 							} else {
@@ -790,38 +879,45 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 						
 						try {
 							loadingTeamAvailability.value = true;
-							const allTeamsData = [];
+							// Availability of all teams in one call, flattened to the single team shape
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.get_teams_availability",
+								args: {
+									teams: availableTeamsList.value.map(team => team.name),
+									from_date: selectedDateForViewing.value
+								}
+							});
+							if (!response || !response.message || !response.message.success) {
+								throw new Error((response && response.message && response.message.message) || 'Unknown error');
+							}
 							
-							// Fetch availability for each team
-							for (const team of availableTeamsList.value) {
-								try {
-									const response = await frappe.call({
-										method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.get_team_availability",
-										args: {
-											team_name: team.name,
-											date: selectedDateForViewing.value
-										}
-									});
-									
-									if (response && response.message && response.message.success) {
-										allTeamsData.push({
-											team_name: team.name,
-											team_display_name: team.name1 || team.name,
-											...response.message.data
-										});
-									}
-								} catch (error) {
-									console.error(`Error fetching availability for team ${team.name}:`, error);
+							const teamsById = {};
+							for (const team of response.message.data.teams) {
+								teamsById[team.team_id] = team;
+							}
+							const allTeamsData = availableTeamsList.value.map(team => {
+								const availability = teamsById[team.name];
+								if (!availability) {
 									// Add team with error state
-									allTeamsData.push({
+									return {
 										team_name: team.name,
 										team_display_name: team.name1 || team.name,
 										error: true,
 										shifts: [],
 										appointments: []
-									});
+									};
 								}
-							}
+								
+								const { days, ...teamData } = availability;
+								return {
+									team_name: team.name,
+									team_display_name: team.name1 || team.name,
+									...teamData,
+									appointments: days[0].appointments,
+									busy: days[0].busy,
+									date: days[0].date
+								};
+							});
 							
 							teamAvailabilityData.value = allTeamsData;
 						} catch (error) {
@@ -957,6 +1053,65 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 						}
 					};
 
+					// Incremental catalog sync: merge items changed since the last sync into the local list
+					const catalogSync = services_ordering.portal.createCatalogSync({
+						method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.get_items_since",
+						getItems: () => itemsList.value,
+						setItems: (items) => {
+							itemsList.value = items;
+						}
+					});
+					const syncCatalog = catalogSync.sync;
+
+					// Follow the background pipeline (submit, payment link, email) of an order created in pipeline mode
+					const orderPipelines = {};
+					const waitForOrderPipeline = (salesOrderName) => {
+						if (!orderPipelines[salesOrderName]) {
+							orderPipelines[salesOrderName] = new Promise((resolve) => {
+								const poll = async () => {
+									try {
+										const response = await frappe.call({
+											method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.get_order_pipeline_status",
+											args: { sales_order_name: salesOrderName }
+										});
+										const status = response.message && response.message.data;
+										if (!status || status.state === 'Completed' || status.state === 'Failed') {
+											resolve(status || { sales_order: salesOrderName, state: 'Completed' });
+											return;
+										}
+									} catch (error) {
+										console.error('Error checking order pipeline:', error);
+									}
+									setTimeout(poll, 1500);
+								};
+								poll();
+							});
+						}
+						return orderPipelines[salesOrderName];
+					};
+
+					// Retries of the same payload reuse their idempotency key, so the server replays the first result
+					const idempotencyKeys = {};
+					const getIdempotencyKey = (action, payload) => {
+						const fingerprint = JSON.stringify(payload);
+						const pending = idempotencyKeys[action];
+						if (pending && pending.fingerprint === fingerprint) return pending.key;
+						const key = window.crypto && window.crypto.randomUUID
+							? window.crypto.randomUUID()
+							: `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+						idempotencyKeys[action] = { fingerprint, key };
+						return key;
+					};
+					const clearIdempotencyKey = (action) => {
+						delete idempotencyKeys[action];
+					};
+
+					// Master data snapshot kept between page loads, revalidated by version
+					const masterDataCache = services_ordering.portal.createMasterDataCache('sales_order_portal_master_data');
+					const loadCachedMasterData = masterDataCache.load;
+					const saveCachedMasterData = masterDataCache.save;
+					const decodeColumnarMasterData = services_ordering.portal.decodeColumnarMasterData;
+
 					// Fetch master data from backend
 					const fetchMasterData = async () => {
 						try {
@@ -970,8 +1125,13 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 								throw new Error('Backend connection test failed');
 							}
 							
+							const cachedMasterData = loadCachedMasterData();
 							const response = await frappe.call({
 								method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.get_master_data",
+								args: {
+									version: cachedMasterData ? cachedMasterData.version : null,
+									encoding: 'columnar'
+								},
 								callback: function(r) {
 									console.log('Frappe call response:', r);
 								}
@@ -980,10 +1140,20 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 							console.log('Raw response:', response);
 
 							if (response && response.message && response.message.success) {
-								const data = response.message.data;
+								let data = response.message.data;
+								if (response.message.encoding === 'columnar') {
+									data = decodeColumnarMasterData(data);
+								}
+								if (response.message.unchanged && cachedMasterData) {
+									// Server snapshot has not changed since our last load
+									data = cachedMasterData.data;
+								} else {
+									saveCachedMasterData(response.message.version, data);
+								}
 								customers.value = data.customers || [];
 								companies.value = data.companies || [];
 								itemsList.value = data.items || [];
+								catalogSync.setToken(response.message.synced_at);
 								territories.value = data.territories || [];
 								customerGroups.value = data.customer_groups || [];
 								setDefaultCustomerGroup();
@@ -1057,12 +1227,24 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 							const response = await frappe.call({
 								method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.create_sales_order",
 								args: {
-									sales_order_data: salesOrderData
+									sales_order_data: salesOrderData,
+									idempotency_key: getIdempotencyKey('create_sales_order', salesOrderData),
+									// Return once inserted, submission, payment link and email follow in the background
+									pipeline: 1,
+									send_email: 1
 								}
 							});
 
 							if (response.message && response.message.success) {
+								clearIdempotencyKey('create_sales_order');
 								lastCreatedSalesOrder.value = response.message;
+								if (response.message.pipeline) {
+									waitForOrderPipeline(response.message.sales_order_name).then((status) => {
+										if (status.state === 'Failed') {
+											showMessage(`Sales Order ${status.sales_order} could not be submitted: ${status.message || 'Unknown error'}`, true);
+										}
+									});
+								}
 								
 								// Show custom success message
 								let successDetails = `Sales Order ${response.message.sales_order_name} created successfully!`;
@@ -1157,6 +1339,21 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 								return;
 							}
 
+							// Orders created in pipeline mode are submitted and emailed in the background, wait for it
+							if (lastCreatedSalesOrder.value.pipeline) {
+								const pipeline = await waitForOrderPipeline(lastCreatedSalesOrder.value.sales_order_name);
+								const emailStage = pipeline.stages && pipeline.stages.email;
+								if (pipeline.state === 'Completed' && emailStage === 'Done') {
+									showMessage(`Email for Sales Order ${pipeline.sales_order} sent successfully`);
+									return;
+								}
+								// Only a failed email stage is sent again from here, the order itself is submitted
+								if (pipeline.state === 'Failed' && emailStage !== 'Failed') {
+									showMessage('Error sending email: ' + (pipeline.message || 'Sales Order could not be submitted'), true);
+									return;
+								}
+							}
+
 							// Send email with PDF attachment using our improved method
 							const emailResponse = await frappe.call({
 								method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.send_sales_order_email",
@@ -1260,9 +1457,49 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 						}
 					};
 
+					// Reprice every cart line in one call when the price list changes
+					const repriceItems = async () => {
+						const cartItems = items.value.filter(item => item.item_code);
+						if (!cartItems.length) return;
+						try {
+							const response = await frappe.call({
+								method: "services_ordering.services_ordering.page.sales_order_portal.sales_order_portal.get_items_details",
+								args: {
+									item_codes: [...new Set(cartItems.map(item => item.item_code))],
+									customer: salesOrder.value.customer,
+									company: salesOrder.value.company,
+									price_list: salesOrder.value.selling_price_list
+								}
+							});
+
+							if (response.message && response.message.success) {
+								const details = response.message.data || {};
+								cartItems.forEach((item) => {
+									const itemDetails = details[item.item_code];
+									if (!itemDetails) return;
+									item.rate = itemDetails.rate || item.rate;
+									item.uom = itemDetails.stock_uom || item.uom;
+									item.item_tax_template = itemDetails.item_tax_template;
+									calculateItemAmount(item);
+								});
+							}
+						} catch (error) {
+							console.error('Error repricing items:', error);
+						}
+					};
+
+					watch(() => salesOrder.value.selling_price_list, (priceList, previousPriceList) => {
+						if (priceList && priceList !== previousPriceList) repriceItems();
+					});
+
 					onMounted(() => {
 						console.log('Vue onMounted called');
 						fetchMasterData();
+						
+						// Pick up catalog changes whenever the agent comes back to the portal
+						document.addEventListener('visibilitychange', () => {
+							if (document.visibilityState === 'visible') syncCatalog();
+						});
 						addItem(); // Add first item by default
 						
 						// Add beforeunload event to show confirmation before page refresh
@@ -1301,6 +1538,7 @@ frappe.pages['sales-order-portal'].on_page_load = function(wrapper) {
 						totalAmount,
 						vatAmount,
 						grandTotal,
+						totalServiceTime,
 						addItem,
 						removeItem,
 						calculateItemAmount,
@@ -1812,6 +2050,12 @@ placeholder="Rate"
 {{ (vatAmount || 0).toLocaleString('en-US', { style: 'currency', currency: 'SAR' }) }}
 </span>
 </div>
+<div v-if="totalServiceTime !== null" class="flex justify-between items-center gap-4">
+<span class="text-sm sm:text-base font-medium text-gray-600">Service Time:</span>
+<span class="text-base sm:text-lg font-semibold text-gray-800">
+{{ totalServiceTime }} hours
+</span>
+</div>
 <div class="flex justify-between items-center gap-4 border-t border-gray-200 pt-2 sm:pt-3">
 <span class="text-base sm:text-lg font-semibold text-gray-800">Grand Total:</span>
 <span class="text-lg sm:text-2xl font-bold text-green-600">
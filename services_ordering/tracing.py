@@ -0,0 +1,95 @@
+import json
+import random
+from collections import deque
+
+import frappe
+from frappe.utils import add_days, now, now_datetime
+
+# Breadcrumbs of this process, bounded so a burst can never grow memory
+TRACE_BUFFER = deque(maxlen=1000)
+
+# Shared queue the processes drain into, trimmed to the newest entries like a ring
+TRACE_QUEUE_KEY = "services_ordering:trace_queue"
+TRACE_QUEUE_MAX_LEN = 10000
+
+# write_traces moves the queue here before reading it, flushes keep appending to a fresh queue
+TRACE_BATCH_KEY = "services_ordering:trace_batch"
+
+# Overridable in site_config.json
+DEFAULT_TRACE_SAMPLE_RATE = 0.1
+DEFAULT_TRACE_RETENTION_DAYS = 7
+
+
+def trace(event, **data):
+    """Record a sampled debug breadcrumb
+
+    Costs an append to an in-memory buffer, nothing is written during the
+    request. Sampling is set by `services_ordering_trace_sample_rate`.
+    """
+    if random.random() >= get_sample_rate():
+        return
+    session = getattr(frappe.local, "session", None)
+    TRACE_BUFFER.append({
+        "traced_at": now(),
+        "event": event,
+        "user": session.user if session else None,
+        "data": data
+    })
+
+
+def get_sample_rate():
+    return float(frappe.conf.get("services_ordering_trace_sample_rate", DEFAULT_TRACE_SAMPLE_RATE))
+
+
+def flush_trace_buffer(*args, **kwargs):
+    """after_request / after_job hook: move this process' breadcrumbs to the shared queue"""
+    if not TRACE_BUFFER:
+        return
+    try:
+        cache = frappe.cache()
+        while TRACE_BUFFER:
+            cache.rpush(TRACE_QUEUE_KEY, frappe.as_json(TRACE_BUFFER.popleft(), indent=None))
+        cache.ltrim(TRACE_QUEUE_KEY, -TRACE_QUEUE_MAX_LEN, -1)
+    except Exception:
+        # Tracing must never fail a request
+        TRACE_BUFFER.clear()
+
+
+def write_traces():
+    """Scheduled: write the queued breadcrumbs to Service Trace in one insert"""
+    cache = frappe.cache()
+    # A batch left by a failed run is written before a new one is taken
+    if not cache.exists(TRACE_BATCH_KEY):
+        if not cache.exists(TRACE_QUEUE_KEY):
+            return
+        cache.rename(cache.make_key(TRACE_QUEUE_KEY), cache.make_key(TRACE_BATCH_KEY))
+
+    entries = cache.lrange(TRACE_BATCH_KEY, 0, -1)
+
+    values = []
+    for entry in entries:
+        try:
+            entry = json.loads(entry)
+            values.append((
+                frappe.generate_hash(length=10), entry["traced_at"], entry["traced_at"], "Administrator",
+                "Administrator", entry["event"], entry["traced_at"], entry["user"], json.dumps(entry["data"], default=str)
+            ))
+        except (ValueError, KeyError, TypeError):
+            # A broken breadcrumb must not hold back the rest of the batch
+            continue
+
+    if values:
+        frappe.db.bulk_insert(
+            "Service Trace",
+            ["name", "creation", "modified", "owner", "modified_by", "event", "traced_at", "user", "data"],
+            values
+        )
+        frappe.db.commit()
+    # Only dropped once committed, a failed insert leaves the batch for the next run
+    cache.delete_value(TRACE_BATCH_KEY)
+
+
+def purge_old_traces():
+    """Scheduled daily: drop breadcrumbs past `services_ordering_trace_retention_days`"""
+    retention_days = int(frappe.conf.get("services_ordering_trace_retention_days", DEFAULT_TRACE_RETENTION_DAYS))
+    frappe.db.delete("Service Trace", {"traced_at": ["<", add_days(now_datetime(), -retention_days)]})
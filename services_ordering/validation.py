@@ -0,0 +1,90 @@
+import frappe
+from frappe.utils import cint, flt
+
+from services_ordering.pricing import get_order_price_list, get_order_prices
+
+
+def resolve_order_references(orders):
+    """Look up everything `orders` reference with one IN query per doctype
+
+    Returns the existing customers, companies, items with their standard rate and
+    service times, enabled selling price lists, price list rates for lines without a client rate
+    and terms templates. validate_order checks against these facts and creation
+    reads rates and terms from them, so nothing is looked up twice.
+    """
+    customers, companies, item_codes, price_list_names, tc_names = set(), set(), set(), set(), set()
+    for order in orders:
+        customers.add(order.get("customer"))
+        companies.add(order.get("company"))
+        price_list_names.add(get_order_price_list(order))
+        tc_names.add(order.get("tc_name"))
+        item_codes.update(item.get("item_code") for item in order.get("items") or [])
+
+    facts = frappe._dict({
+        "customers": get_existing("Customer", customers),
+        "companies": get_existing("Company", companies),
+        "standard_rates": {},
+        "service_times": {},
+        "price_lists": get_existing("Price List", price_list_names, filters={"enabled": 1, "selling": 1}),
+        "terms": dict(get_existing("Terms and Conditions", tc_names, fields=["name", "terms"]))
+    })
+
+    for item_code, standard_rate, service_time, gap_time in get_existing(
+        "Item", item_codes, fields=["name", "standard_rate", "custom_service_time", "custom_gap_time"]
+    ):
+        facts.standard_rates[item_code] = standard_rate
+        facts.service_times[item_code] = (cint(service_time), cint(gap_time))
+
+    facts.prices = get_order_prices(orders, facts.price_lists, facts.standard_rates)
+    return facts
+
+
+def get_existing(doctype, names, fields=None, filters=None):
+    """Existing records of `doctype` among `names`: a set of names, or rows of `fields`"""
+    names = list(set(names) - {None, ""})
+    if not names:
+        return [] if fields else set()
+
+    filters = dict(filters or {}, name=["in", names])
+    if fields:
+        return frappe.get_all(doctype, fields=fields, filters=filters, as_list=True)
+    return set(frappe.get_all(doctype, filters=filters, pluck="name"))
+
+
+def validate_order(order, facts, strict=False):
+    """Errors of one order checked against `facts` from resolve_order_references
+
+    Creation only needs an existing customer and items, lines without an item
+    code or quantity are skipped there. `strict` adds the checks of the validate
+    endpoints: a company and an item code, quantity and rate on every line.
+    """
+    errors = []
+
+    if not order.get("customer"):
+        errors.append("Customer is required")
+
+    if strict and not order.get("company"):
+        errors.append("Company is required")
+
+    if not order.get("items"):
+        errors.append("At least one item is required")
+
+    for i, item in enumerate(order.get("items") or []):
+        if strict:
+            if not item.get("item_code"):
+                errors.append(f"Item code is required for item {i+1}")
+            if not item.get("qty") or flt(item.get("qty")) <= 0:
+                errors.append(f"Valid quantity is required for item {i+1}")
+            if not item.get("rate") or flt(item.get("rate")) < 0:
+                errors.append(f"Valid rate is required for item {i+1}")
+        if item.get("item_code") and (strict or item.get("qty")) and item.get("item_code") not in facts.standard_rates:
+            errors.append(f"Item {item.get('item_code')} does not exist for item {i+1}")
+
+    if order.get("customer") and order.get("customer") not in facts.customers:
+        errors.append("Selected customer does not exist")
+
+    if strict and order.get("company") and order.get("company") not in facts.companies:
+        errors.append("Selected company does not exist")
+
+    return errors
+
@@ -1,8 +1,45 @@
 import frappe
 from frappe import _
+from frappe.sessions import get_csrf_token
 from frappe.utils import nowdate, flt, cint
 import json
 
+from services_ordering import locations
+from services_ordering.catalog import get_catalog_delta, get_catalog_item_details, get_catalog_items, get_catalog_items_details
+from services_ordering.customers import find_customers, get_customer_profiles
+from services_ordering.idempotency import run_idempotent
+from services_ordering.master_data import COLUMNAR_ENCODING, get_master_data_response, get_master_data_snapshot
+from services_ordering.naming import set_block_name
+from services_ordering.orders import build_sales_order, make_sales_order_result
+from services_ordering.scheduling import build_teams_availability
+from services_ordering.tracing import trace
+from services_ordering.validation import resolve_order_references, validate_order
+
+# Rendered per request, the page embeds the session's CSRF token
+no_cache = 1
+
+
+def get_context(context):
+    """
+    Context for the sales order form: embeds the master data snapshot and CSRF
+    token so the form does not wait on API calls before it can be used
+    """
+    context.no_cache = 1
+    context.show_sidebar = False
+    context.csrf_token = get_csrf_token()
+
+    bootstrap = None
+    try:
+        snapshot = get_master_data_snapshot("sales_order_form", build_master_data)
+        bootstrap = get_master_data_response(snapshot, encoding=COLUMNAR_ENCODING)
+    except Exception as e:
+        # The form falls back to fetching master data itself
+        frappe.log_error(f"Error prerendering master data: {str(e)}", "Sales Order Form - Get Context")
+
+    # Escape "</" so the JSON cannot close the inline <script> tag
+    context.master_data_bootstrap = frappe.as_json(bootstrap, indent=None).replace("</", "<\\/")
+    return context
+
 
 @frappe.whitelist(allow_guest=True)
 def test_connection():
@@ -28,6 +65,19 @@ def get_customers():
         frappe.log_error(f"Error fetching customers: {str(e)}", "Sales Order Form - Get Customers")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist(allow_guest=True)
+def search_customers(txt=None, start=None, page_len=20):
+    """Search customers by name, mobile or email for the customer picker
+
+    Pass the returned `next_start` back as `start` to get the following page.
+    """
+    try:
+        customers, next_start = find_customers(txt, start, page_len)
+        return {"success": True, "data": customers, "next_start": next_start}
+    except Exception as e:
+        frappe.log_error(f"Error searching customers: {str(e)}", "Sales Order Form - Search Customers")
+        return {"success": False, "message": str(e)}
+
 @frappe.whitelist(allow_guest=True)
 def get_companies():
     """Get list of companies for the dropdown"""
@@ -46,41 +96,25 @@ def get_companies():
 def get_items():
     """Get list of sales items for the dropdown"""
     try:
-        # First, get item names that have Sage Services Co Ltd in item defaults
-        items_with_sage_company = frappe.db.sql("""
-            SELECT parent as item_code
-            FROM `tabItem Default`
-            WHERE company = 'Sage Services Co Ltd'
-        """, as_dict=True)
-        
-        # Extract item codes from the result
-        sage_item_codes = [item.item_code for item in items_with_sage_company]
-        
-        if not sage_item_codes:
-            # Return empty list if no items found
-            return {"success": True, "data": []}
-        
-        # Get details of these items
-        items = frappe.get_all(
-            "Item",
-            fields=[
-                "name", "item_name", "description", "stock_uom", 
-                "standard_rate", "item_group", "brand", "has_variants"
-            ],
-            filters={
-                "disabled": 0,
-                "is_sales_item": 1,
-                "has_variants": 0,  # Exclude template items
-                "name": ["in", sage_item_codes]  # Filter by item codes with Sage company
-            },
-            order_by="item_name asc",
-            limit=500
-        )
+        # Sellable items with Sage Services Co Ltd in item defaults, priced from the standard selling list
+        items = get_catalog_items()
         return {"success": True, "data": items}
     except Exception as e:
         frappe.log_error(f"Error fetching items: {str(e)}", "Sales Order Form - Get Items")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist(allow_guest=True)
+def get_items_since(modified_after=None):
+    """Get items changed or removed since the client's last catalog sync
+
+    Pass the returned `sync_token` as `modified_after` on the next call.
+    """
+    try:
+        return {"success": True, "data": get_catalog_delta(modified_after)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching item changes: {str(e)}", "Sales Order Form - Get Items Since")
+        return {"success": False, "message": str(e)}
+
 @frappe.whitelist(allow_guest=True)
 def get_warehouses():
     """Get list of warehouses for the dropdown"""
@@ -145,13 +179,8 @@ def get_price_lists():
 def get_cities():
     """Get list of cities for the dropdown"""
     try:
-        cities = frappe.get_all(
-            "City",
-            fields=["city"],
-            filters={"disabled": 0} if frappe.db.has_column("City", "disabled") else {},
-            order_by="city asc"
-        )
-        return {"success": True, "data": cities}
+        # Served from the cached location tree, rebuilt by City/Neighborhood hooks
+        return {"success": True, "data": locations.get_cities()}
     except Exception as e:
         frappe.log_error(f"Error fetching cities: {str(e)}", "Sales Order Form - Get Cities")
         return {"success": False, "message": str(e)}
@@ -160,23 +189,8 @@ def get_cities():
 def get_neighborhoods(city=None):
     """Get list of neighborhoods for the dropdown, optionally filtered by city"""
     try:
-        filters = {}
-        
-        # Add disabled filter if column exists
-        if frappe.db.has_column("Neighborhood", "disabled"):
-            filters["disabled"] = 0
-        
-        # Add city filter if provided
-        if city:
-            filters["city"] = city
-        
-        neighborhoods = frappe.get_all(
-            "Neighborhood",
-            fields=["name", "city"],
-            filters=filters,
-            order_by="name asc"
-        )
-        return {"success": True, "data": neighborhoods}
+        # Served from the cached location tree, rebuilt by City/Neighborhood hooks
+        return {"success": True, "data": locations.get_neighborhoods(city)}
     except Exception as e:
         frappe.log_error(f"Error fetching neighborhoods: {str(e)}", "Sales Order Form - Get Neighborhoods")
         return {"success": False, "message": str(e)}
@@ -188,73 +202,28 @@ def get_customer_details(customer):
         if not customer:
             return {"success": False, "message": "Customer is required"}
         
-        customer_doc = frappe.get_doc("Customer", customer)
-        
-        # Get default address
-        default_address = None
-        addresses = frappe.get_all(
-            "Dynamic Link",
-            fields=["parent"],
-            filters={
-                "link_doctype": "Customer",
-                "link_name": customer,
-                "parenttype": "Address"
-            }
-        )
-        
-        if addresses:
-            address_doc = frappe.get_doc("Address", addresses[0].parent)
-            default_address = {
-                "name": address_doc.name,
-                "address_line1": address_doc.address_line1,
-                "address_line2": address_doc.address_line2,
-                "city": address_doc.city,
-                "state": address_doc.state,
-                "country": address_doc.country,
-                "pincode": address_doc.pincode
-            }
-        
-        # Get default contact
-        default_contact = None
-        contacts = frappe.get_all(
-            "Dynamic Link",
-            fields=["parent"],
-            filters={
-                "link_doctype": "Customer",
-                "link_name": customer,
-                "parenttype": "Contact"
-            }
-        )
-        
-        if contacts:
-            contact_doc = frappe.get_doc("Contact", contacts[0].parent)
-            default_contact = {
-                "name": contact_doc.name,
-                "first_name": contact_doc.first_name,
-                "last_name": contact_doc.last_name,
-                "email_id": contact_doc.email_id,
-                "mobile_no": contact_doc.mobile_no,
-                "phone": contact_doc.phone
-            }
-        
-        customer_details = {
-            "customer_name": customer_doc.customer_name,
-            "customer_group": customer_doc.customer_group,
-            "territory": customer_doc.territory,
-            "customer_type": customer_doc.customer_type,
-            "default_currency": customer_doc.default_currency,
-            "default_price_list": customer_doc.default_price_list,
-            "payment_terms": customer_doc.payment_terms,
-            "credit_limit": customer_doc.credit_limit,
-            "default_address": default_address,
-            "default_contact": default_contact
-        }
+        # Customer, primary address and primary contact from one cached lookup
+        customer_details = get_customer_profiles([customer]).get(customer)
+        if not customer_details:
+            return {"success": False, "message": f"Customer {customer} not found"}
         
         return {"success": True, "data": customer_details}
     except Exception as e:
         frappe.log_error(f"Error fetching customer details: {str(e)}", "Sales Order Form - Get Customer Details")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist(allow_guest=True)
+def get_customers_details(customers):
+    """Get customer details for several customers at once, keyed by customer"""
+    try:
+        if isinstance(customers, str):
+            customers = json.loads(customers)
+        
+        return {"success": True, "data": get_customer_profiles(customers)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching customers details: {str(e)}", "Sales Order Form - Get Customers Details")
+        return {"success": False, "message": str(e)}
+
 @frappe.whitelist(allow_guest=True)
 def get_item_details(item_code, customer=None, company=None, price_list=None):
     """Get detailed item information including price"""
@@ -262,6 +231,11 @@ def get_item_details(item_code, customer=None, company=None, price_list=None):
         if not item_code:
             return {"success": False, "message": "Item code is required"}
         
+        # Catalog items are resolved from a single Service Catalog row
+        item_details = get_catalog_item_details(item_code, price_list)
+        if item_details:
+            return {"success": True, "data": item_details}
+        
         item_doc = frappe.get_doc("Item", item_code)
         
         # Get item price
@@ -307,216 +281,105 @@ def get_item_details(item_code, customer=None, company=None, price_list=None):
         return {"success": False, "message": str(e)}
 
 @frappe.whitelist(allow_guest=True)
-def create_sales_order(sales_order_data):
+def get_items_details(item_codes, customer=None, company=None, price_list=None):
+    """Get item details for several items at once, keyed by item code
+
+    Used to reprice the whole cart in one call when the price list or customer changes.
+    """
+    try:
+        if isinstance(item_codes, str):
+            item_codes = json.loads(item_codes)
+        
+        return {"success": True, "data": get_catalog_items_details(item_codes, price_list)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching items details: {str(e)}", "Sales Order Form - Get Items Details")
+        return {"success": False, "message": str(e)}
+
+@frappe.whitelist(allow_guest=True)
+def create_sales_order(sales_order_data, idempotency_key=None):
+    """Create a new sales order in ERPNext
+
+    Retries sending the same `idempotency_key` get the first response back
+    instead of creating a duplicate.
+    """
+    return run_idempotent("create_sales_order", idempotency_key, lambda: insert_sales_order(sales_order_data))
+
+def insert_sales_order(sales_order_data):
     """Create a new sales order in ERPNext"""
     try:
         # Parse the JSON data if it's a string
         if isinstance(sales_order_data, str):
             sales_order_data = json.loads(sales_order_data)
         
-        # Validate required fields
-        if not sales_order_data.get("customer"):
-            return {"success": False, "message": "Customer is required"}
+        # Validate every reference in one pass, the same facts build the document
+        facts = resolve_order_references([sales_order_data])
+        errors = validate_order(sales_order_data, facts)
+        if errors:
+            return {"success": False, "message": "; ".join(errors)}
         
-        if not sales_order_data.get("items") or len(sales_order_data.get("items", [])) == 0:
-            return {"success": False, "message": "At least one item is required"}
-        
-        # Create new Sales Order document
-        sales_order = frappe.new_doc("Sales Order")
-        
-        # Set basic fields with static values
-        sales_order.customer = sales_order_data.get("customer")
-        sales_order.company = "Sage Services Co Ltd"  # Static company
-        sales_order.currency = "SAR"  # Static currency
-        sales_order.transaction_date = sales_order_data.get("transaction_date", nowdate())
-        sales_order.delivery_date = sales_order_data.get("delivery_date")
-        pl_candidate = sales_order_data.get("selling_price_list") or sales_order_data.get("price_list")
-        valid_price_list = None
-        if pl_candidate and frappe.db.exists("Price List", {"name": pl_candidate, "enabled": 1, "selling": 1}):
-            valid_price_list = pl_candidate
-            sales_order.selling_price_list = pl_candidate
-        
-        # Optional fields
-        if sales_order_data.get("customer_group"):
-            sales_order.customer_group = sales_order_data.get("customer_group")
-        if sales_order_data.get("territory"):
-            sales_order.territory = sales_order_data.get("territory")
-        if sales_order_data.get("order_type"):
-            sales_order.order_type = sales_order_data.get("order_type", "Sales")
-        
-        # Handle new fields (time and team)
-        if sales_order_data.get("custom_time"):
-            sales_order.custom_time = sales_order_data.get("custom_time")
-            print(f"Setting custom_time to {sales_order_data.get('custom_time')}")
-            frappe.log_error(f"Setting custom_time to {sales_order_data.get('custom_time')}", "Sales Order Form - Custom Time")
-            
-        if sales_order_data.get("team"):
-            sales_order.custom_team = sales_order_data.get("team")
-            print(f"Setting custom_team to {sales_order_data.get('team')}")
-            frappe.log_error(f"Setting custom_team to {sales_order_data.get('team')}", "Sales Order Form - Custom Team")
-            
-        if sales_order_data.get("source"):
-            sales_order.source = sales_order_data.get("source")
-        if sales_order_data.get("project"):
-            sales_order.project = sales_order_data.get("project")
-        if sales_order_data.get("cost_center"):
-            sales_order.cost_center = sales_order_data.get("cost_center")
-        
-        # Address and contact details
-        if sales_order_data.get("customer_address"):
-            sales_order.customer_address = sales_order_data.get("customer_address")
-        if sales_order_data.get("shipping_address_name"):
-            sales_order.shipping_address_name = sales_order_data.get("shipping_address_name")
-        if sales_order_data.get("contact_person"):
-            sales_order.contact_person = sales_order_data.get("contact_person")
-        
-        # Terms and conditions
-        if sales_order_data.get("tc_name"):
-            sales_order.tc_name = sales_order_data.get("tc_name")
-        if sales_order_data.get("terms"):
-            sales_order.terms = sales_order_data.get("terms")
-        
-        # Payment terms
-        if sales_order_data.get("payment_terms_template"):
-            sales_order.payment_terms_template = sales_order_data.get("payment_terms_template")
-        
-        # Taxes and charges - skip setting template and directly add tax row
-        # if sales_order_data.get("taxes_and_charges"):
-        #     sales_order.taxes_and_charges = sales_order_data.get("taxes_and_charges")
-        # else:
-        #     # Set the template exactly as shown in the system
-        #     sales_order.taxes_and_charges = "VAT 15%"
-        
-        # Always add the tax row directly
-        tax_row = sales_order.append("taxes", {})
-        tax_row.charge_type = "On Net Total"
-        tax_row.account_head = "KSA VAT15% - SSC"
-        tax_row.description = "VAT 15%"
-        tax_row.rate = 15
-        
-        # Shipping
-        if sales_order_data.get("shipping_rule"):
-            sales_order.shipping_rule = sales_order_data.get("shipping_rule")
-        
-        # Add items
-        for item_data in sales_order_data.get("items", []):
-            if not item_data.get("item_code") or not item_data.get("qty"):
-                continue
-                
-            item_row = sales_order.append("items", {})
-            item_row.item_code = item_data.get("item_code")
-            item_row.qty = flt(item_data.get("qty", 1))
-            # Use client-provided rate if positive; else compute from price list or standard_rate
-            client_rate = flt(item_data.get("rate", 0))
-            price_list = valid_price_list
-            computed_rate = 0
-            if client_rate > 0:
-                computed_rate = client_rate
-            else:
-                if price_list:
-                    price_doc = frappe.get_all(
-                        "Item Price",
-                        fields=["price_list_rate"],
-                        filters={
-                            "item_code": item_row.item_code,
-                            "price_list": price_list,
-                            "selling": 1
-                        },
-                        limit=1
-                    )
-                    if price_doc:
-                        computed_rate = price_doc[0].price_list_rate
-                if not computed_rate:
-                    item_doc = frappe.get_doc("Item", item_row.item_code)
-                    computed_rate = item_doc.standard_rate or 0
-            item_row.price_list_rate = flt(computed_rate)
-            item_row.rate = flt(computed_rate)
-            item_row.amount = flt(item_row.qty) * flt(item_row.rate)
-            
-            # Optional item fields
-            if item_data.get("item_name"):
-                item_row.item_name = item_data.get("item_name")
-            if item_data.get("description"):
-                item_row.description = item_data.get("description")
-            if item_data.get("uom"):
-                item_row.uom = item_data.get("uom")
-            if item_data.get("warehouse"):
-                item_row.warehouse = item_data.get("warehouse")
-            if item_data.get("delivery_date"):
-                item_row.delivery_date = item_data.get("delivery_date")
-            if item_data.get("item_tax_template"):
-                item_row.item_tax_template = item_data.get("item_tax_template")
-            
-            # Intentionally ignore client-sent discounts for public endpoint
-        
-        # Do not apply document-level discounts from client on public endpoint
+        # Build the Sales Order document
+        sales_order = build_sales_order(sales_order_data, facts)
         
         # Insert the document
+        set_block_name(sales_order)
         sales_order.insert(ignore_permissions=True)
         
         # Submit if auto-submit is enabled (optional)
         sales_order.submit()
         
-        # Calculate totals with VAT
-        total_amount = flt(sales_order.net_total or sales_order.total or 0)
-        vat_amount = total_amount * 0.15  # 15% VAT
-        grand_total_with_vat = total_amount + vat_amount
-        
-        return {
-            "success": True, 
-            "message": f"Sales Order {sales_order.name} created successfully!",
-            "sales_order_name": sales_order.name,
-            "data": {
-                "name": sales_order.name,
-                "customer": sales_order.customer,
-                "total_amount": total_amount,
-                "vat_amount": vat_amount,
-                "grand_total": grand_total_with_vat,
-                "status": sales_order.status,
-                "custom_time": sales_order_data.get("custom_time"),
-                "custom_team": sales_order_data.get("team")
-            }
-        }
+        return make_sales_order_result(sales_order, sales_order_data)
         
     except Exception as e:
         frappe.log_error(f"Error creating sales order: {str(e)}", "Sales Order Form - Create Sales Order")
         return {"success": False, "message": f"Error creating sales order: {str(e)}"}
 
 @frappe.whitelist(allow_guest=True)
-def get_master_data():
-    """Get all master data in one API call for better performance"""
+def get_master_data(version=None, encoding=None):
+    """Get all master data in one API call for better performance
+
+    The payload is served from a cached snapshot. Clients pass the version they
+    hold and get an "unchanged" response without the data if it is still current.
+    Pass encoding="columnar" for the compact column-oriented format.
+    """
     try:
-        # Get all master data
-        customers_result = get_customers()
-        companies_result = get_companies()
-        items_result = get_items()
-        warehouses_result = get_warehouses()
-        territories_result = get_territories()
-        customer_groups_result = get_customer_groups()
-        price_lists_result = get_price_lists()
-        cities_result = get_cities()
-        neighborhoods_result = get_neighborhoods()
-        # cleaning_teams_result = get_cleaning_teams()  # Temporarily disabled
-        
-        return {
-            "success": True,
-            "data": {
-                "customers": customers_result.get("data", []) if customers_result.get("success") else [],
-                "companies": companies_result.get("data", []) if companies_result.get("success") else [],
-                "items": items_result.get("data", []) if items_result.get("success") else [],
-                "warehouses": warehouses_result.get("data", []) if warehouses_result.get("success") else [],
-                "territories": territories_result.get("data", []) if territories_result.get("success") else [],
-                "customer_groups": customer_groups_result.get("data", []) if customer_groups_result.get("success") else [],
-                "price_lists": price_lists_result.get("data", []) if price_lists_result.get("success") else [],
-                "cities": cities_result.get("data", []) if cities_result.get("success") else [],
-                "neighborhoods": neighborhoods_result.get("data", []) if neighborhoods_result.get("success") else [],
-                "cleaning_teams": []  # Temporarily disabled
-            }
-        }
+        snapshot = get_master_data_snapshot("sales_order_form", build_master_data)
+        return get_master_data_response(snapshot, version, encoding)
     except Exception as e:
         frappe.log_error(f"Error fetching master data: {str(e)}", "Sales Order Form - Get Master Data")
         return {"success": False, "message": str(e)}
 
+def build_master_data():
+    """Build the master data payload, returns (data, complete)"""
+    # Get all master data
+    customers_result = get_customers()
+    companies_result = get_companies()
+    items_result = get_items()
+    warehouses_result = get_warehouses()
+    territories_result = get_territories()
+    customer_groups_result = get_customer_groups()
+    price_lists_result = get_price_lists()
+    cities_result = get_cities()
+    neighborhoods_result = get_neighborhoods()
+    # cleaning_teams_result = get_cleaning_teams()  # Temporarily disabled
+    
+    results = [
+        customers_result, companies_result, items_result, warehouses_result, territories_result,
+        customer_groups_result, price_lists_result, cities_result, neighborhoods_result
+    ]
+    data = {
+        "customers": customers_result.get("data", []) if customers_result.get("success") else [],
+        "companies": companies_result.get("data", []) if companies_result.get("success") else [],
+        "items": items_result.get("data", []) if items_result.get("success") else [],
+        "warehouses": warehouses_result.get("data", []) if warehouses_result.get("success") else [],
+        "territories": territories_result.get("data", []) if territories_result.get("success") else [],
+        "customer_groups": customer_groups_result.get("data", []) if customer_groups_result.get("success") else [],
+        "price_lists": price_lists_result.get("data", []) if price_lists_result.get("success") else [],
+        "cities": cities_result.get("data", []) if cities_result.get("success") else [],
+        "neighborhoods": neighborhoods_result.get("data", []) if neighborhoods_result.get("success") else [],
+        "cleaning_teams": []  # Temporarily disabled
+    }
+    return data, all(result.get("success") for result in results)
+
 @frappe.whitelist(allow_guest=True)
 def validate_sales_order_data(sales_order_data):
     """Validate sales order data before creation"""
@@ -524,36 +387,8 @@ def validate_sales_order_data(sales_order_data):
         if isinstance(sales_order_data, str):
             sales_order_data = json.loads(sales_order_data)
         
-        errors = []
-        
-        # Check required fields
-        if not sales_order_data.get("customer"):
-            errors.append("Customer is required")
-        
-        if not sales_order_data.get("company"):
-            errors.append("Company is required")
-        
-        if not sales_order_data.get("items") or len(sales_order_data.get("items", [])) == 0:
-            errors.append("At least one item is required")
-        
-        # Validate items
-        for i, item in enumerate(sales_order_data.get("items", [])):
-            if not item.get("item_code"):
-                errors.append(f"Item code is required for item {i+1}")
-            if not item.get("qty") or flt(item.get("qty")) <= 0:
-                errors.append(f"Valid quantity is required for item {i+1}")
-            if not item.get("rate") or flt(item.get("rate")) < 0:
-                errors.append(f"Valid rate is required for item {i+1}")
-        
-        # Check if customer exists
-        if sales_order_data.get("customer"):
-            if not frappe.db.exists("Customer", sales_order_data.get("customer")):
-                errors.append("Selected customer does not exist")
-        
-        # Check if company exists
-        if sales_order_data.get("company"):
-            if not frappe.db.exists("Company", sales_order_data.get("company")):
-                errors.append("Selected company does not exist")
+        # Customer, company and items are checked with one query per doctype
+        errors = validate_order(sales_order_data, resolve_order_references([sales_order_data]), strict=True)
         
         return {
             "success": len(errors) == 0,
@@ -909,7 +744,7 @@ def create_customer(customer_data):
                     # Commit again to ensure everything is saved
                     frappe.db.commit()
                 
-                frappe.log_error(f"Contact created successfully for customer {customer.name}: {contact.name} with email {customer_data.get('email_id')}", "Customer Creation Debug")
+                trace("Customer Creation Debug", customer=customer.name, contact=contact.name, email_id=customer_data.get("email_id"))
                 
             except Exception as contact_error:
                 frappe.log_error(f"Error creating contact for customer {customer.name}: {str(contact_error)}", "Customer Creation - Contact Error")
@@ -969,7 +804,15 @@ def get_payment_modes():
         return {"success": False, "message": str(e)}
 
 @frappe.whitelist(allow_guest=True)
-def create_payment_entry(sales_order_name, mode_of_payment, payment_slip_file=None, payment_slip_filename=None):
+def create_payment_entry(sales_order_name, mode_of_payment, payment_slip_file=None, payment_slip_filename=None, idempotency_key=None):
+    """Create a payment entry for a sales order
+
+    Retries sending the same `idempotency_key` get the first response back
+    instead of creating a duplicate.
+    """
+    return run_idempotent("create_payment_entry", idempotency_key, lambda: insert_payment_entry(sales_order_name, mode_of_payment, payment_slip_file, payment_slip_filename))
+
+def insert_payment_entry(sales_order_name, mode_of_payment, payment_slip_file=None, payment_slip_filename=None):
     """Create a payment entry for a sales order"""
     try:
         if not sales_order_name:
@@ -1141,48 +984,24 @@ def get_team_availability(team_name, date=None):
         if not team_name:
             return {"success": False, "message": "Team name is required"}
         
-        # Check if team exists
-        if not frappe.db.exists("Cleaning Team", team_name):
-            return {"success": False, "message": "Team not found"}
-        
-        # Get team document with shifts
-        team_doc = frappe.get_doc("Cleaning Team", team_name)
-        
-        # Get shifts
-        shifts = []
-        if hasattr(team_doc, 'shifts') and team_doc.shifts:
-            for shift in team_doc.shifts:
-                shifts.append({
-                    "start_time": shift.start_time,
-                    "end_time": shift.end_time
-                })
-        
         # Use provided date or today
-        from frappe.utils import nowdate
         target_date = date if date else nowdate()
         
-        # Get appointments for this team on the target date using between filter
-        appointments = frappe.get_all(
-            "Service Appointment",
-            fields=["name", "appointment_date_time", "appointment_end_time", "customer", "total_service_time"],
-            filters={
-                "service_team": team_name,
-                "docstatus": ["!=", 2],  # Not cancelled
-                "appointment_date_time": ["between", [target_date + " 00:00:00", target_date + " 23:59:59"]]
-            }
-        )
-        
-        # Get team members count
-        team_members_count = len(team_doc.team_members) if hasattr(team_doc, 'team_members') and team_doc.team_members else 0
+        # Appointments on the target date, including jobs running over from the day before
+        availability = build_teams_availability([team_name], target_date)
+        if not availability["teams"]:
+            return {"success": False, "message": "Team not found"}
         
+        team = availability["teams"][0]
         return {
             "success": True,
             "data": {
-                "team_name": team_doc.name1 if hasattr(team_doc, 'name1') else team_name,
+                "team_name": team.team_name,
                 "team_id": team_name,
-                "team_members_count": team_members_count,
-                "shifts": shifts,
-                "appointments": appointments,
+                "team_members_count": team.team_members_count,
+                "shifts": team.shifts,
+                "appointments": team.days[0]["appointments"],
+                "busy": team.days[0]["busy"],
                 "date": target_date
             }
         }
@@ -1190,3 +1009,17 @@ def get_team_availability(team_name, date=None):
     except Exception as e:
         frappe.log_error(f"Error fetching team availability: {str(e)}", "Sales Order Form - Get Team Availability")
         return {"success": False, "message": str(e)}
+
+@frappe.whitelist(allow_guest=True)
+def get_teams_availability(teams=None, from_date=None, to_date=None):
+    """Get availability of several teams over a date range at once, all teams if none are given"""
+    try:
+        if isinstance(teams, str):
+            teams = json.loads(teams)
+        if not teams:
+            teams = frappe.get_all("Cleaning Team", pluck="name", order_by="name asc")
+        
+        return {"success": True, "data": build_teams_availability(teams, from_date or nowdate(), to_date)}
+    except Exception as e:
+        frappe.log_error(f"Error fetching teams availability: {str(e)}", "Sales Order Form - Get Teams Availability")
+        return {"success": False, "message": str(e)}